@@ -0,0 +1,450 @@
+# cluster_orchestrator.py
+"""Bring up a Ray cluster on Kubernetes, wait until it is usable and keep its
+port-forwards alive.
+
+Runs the steps of ray_infra_local.sh / ray_infra_aws.sh, but the independent
+ones run concurrently and the fixed sleeps are replaced by readiness probes:
+the head pod's Ready condition, the dashboard API, `ray health-check` against
+GCS inside the head pod and the Serve proxy's health route. A TCP connect to a
+forwarded port only proves kubectl is listening, so every service is probed
+end to end. Dead port-forwards are restarted with backoff, and every step is
+timed so time-to-ready is printed at the end.
+
+    python cluster_orchestrator.py local
+"""
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+import subprocess
+import urllib.request
+import webbrowser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Union
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+NAMESPACE = "default"
+HEAD_SELECTOR = "ray.io/node-type=head"
+HEAD_CONTAINER = "ray-head"
+DASHBOARD_PORT = 8265
+GCS_PORT = 6379
+SERVE_PORT = 8000
+HEAD_METRICS_PORT = 8080
+CODE_SERVER_PORT = 9999
+PROMETHEUS_PORT = 9090
+GRAFANA_PORT = 3000
+
+TARGETS = {
+    "local": {
+        "prepare": [],
+        "cluster_config": "ray-cluster-autoscaler.yaml",
+        "apply": True,
+        "prometheus_install": None,
+        # The local script does not install the Prometheus stack, so its
+        # forwards are only waited for with --monitoring
+        "monitoring": False,
+    },
+    "aws": {
+        "prepare": [["aws", "eks", "update-kubeconfig", "--region", "us-west-2", "--name", "ray-cluster-robin"]],
+        "cluster_config": "ray-cluster-autoscaler.yaml",
+        # The EKS cluster config is applied out of band, as in ray_infra_aws.sh
+        "apply": False,
+        "prometheus_install": "/Users/robin/source/anyscale/kuberay/install/prometheus/install.sh",
+        "monitoring": True,
+    },
+}
+
+COMMAND_TIMEOUT_S = 120
+PROMETHEUS_INSTALL_TIMEOUT_S = 600
+MAX_PROBE_DELAY_S = 2.0
+SUPERVISE_INTERVAL_S = 1.0
+# A forward that is running but refuses connections this many checks in a row is restarted
+MAX_PROBE_FAILURES = 3
+MAX_RESTART_BACKOFF_S = 30.0
+# How often long commands check whether bring-up was stopped
+STOP_POLL_S = 0.5
+
+
+class BringUpError(RuntimeError):
+    pass
+
+
+def run_command(args: List[str], timeout_s: float = COMMAND_TIMEOUT_S,
+                stopping: Optional[threading.Event] = None) -> str:
+    """Run a command to completion and return its stdout. The command is
+    killed when it times out or, for long steps, when `stopping` is set."""
+    try:
+        # In its own process group, so a kill also reaches what it started
+        process = subprocess.Popen(args, cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   start_new_session=True)
+    except FileNotFoundError:
+        raise BringUpError(f"{args[0]} not found on PATH")
+    deadline = time.perf_counter() + timeout_s
+    while True:
+        remaining = deadline - time.perf_counter()
+        try:
+            stdout, stderr = process.communicate(
+                timeout=max(0.0, min(remaining, STOP_POLL_S) if stopping is not None else remaining))
+            break
+        except subprocess.TimeoutExpired:
+            stopped = stopping is not None and stopping.is_set()
+            if stopped or time.perf_counter() >= deadline:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.communicate()
+                if stopped:
+                    raise BringUpError(f"`{' '.join(args)}` stopped")
+                raise BringUpError(f"`{' '.join(args)}` did not finish in {timeout_s:g}s")
+    if process.returncode != 0:
+        raise BringUpError(f"`{' '.join(args)}` failed: {stderr.strip() or stdout.strip()}")
+    return stdout
+
+
+def tcp_open(port: int, host: str = "127.0.0.1", timeout_s: float = 0.5) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout_s):
+            return True
+    except OSError:
+        return False
+
+
+def http_ok(url: str, timeout_s: float = 2.0) -> bool:
+    """Whether url answers with a non-error status"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout_s) as response:
+            return response.status < 400
+    except Exception:
+        return False
+
+
+class StepTimings:
+    """Start offset, duration and outcome of every bring-up step"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+        self.lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @contextmanager
+    def step(self, name: str):
+        start = self.elapsed()
+        print(f"[{start:6.1f}s] {name}...")
+        status = "ok"
+        try:
+            yield
+        except BaseException as e:
+            status = f"failed: {e}" if isinstance(e, Exception) else "interrupted"
+            raise
+        finally:
+            duration = self.elapsed() - start
+            print(f"[{self.elapsed():6.1f}s] {name}: {status} ({duration:.1f}s)")
+            with self.lock:
+                self.steps.append({"name": name, "start_s": start, "duration_s": duration, "status": status})
+
+    def print_breakdown(self):
+        print("\n===== Cluster bring-up steps =====")
+        print(f"{'step':<32} {'start':>8} {'duration':>9}  status")
+        for step in sorted(self.steps, key=lambda step: step["start_s"]):
+            print(f"{step['name']:<32} {step['start_s']:>7.1f}s {step['duration_s']:>8.1f}s  {step['status']}")
+
+
+class PortForward:
+    """One supervised `kubectl port-forward` process.
+
+    `resource` may be a callable so a forward to the head pod follows the pod
+    when it is replaced.
+    """
+
+    def __init__(self, name: str, resource: Union[str, Callable[[], str]], ports: List[int],
+                 namespace: str = NAMESPACE):
+        self.name = name
+        self.resource = resource
+        self.ports = ports
+        self.namespace = namespace
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.probe_failures = 0
+
+    def start(self):
+        resource = self.resource() if callable(self.resource) else self.resource
+        try:
+            self.process = subprocess.Popen(
+                ["kubectl", "port-forward", resource, "-n", self.namespace] + [f"{port}:{port}" for port in self.ports],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            raise BringUpError("kubectl not found on PATH")
+        self.started_at = time.perf_counter()
+        self.probe_failures = 0
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def listening(self) -> bool:
+        return all(tcp_open(port) for port in self.ports)
+
+    def stop(self):
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class Cluster:
+    """A Ray cluster being brought up, then supervised until close()"""
+
+    def __init__(self,
+                 target: str = "local",
+                 open_browser: bool = True,
+                 wait_serve: bool = False,
+                 teardown: bool = True,
+                 head_timeout_s: float = 300.0,
+                 probe_timeout_s: float = 120.0,
+                 monitoring: Optional[bool] = None):
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target {target}, expected one of {', '.join(TARGETS)}")
+        self.target = target
+        self.config = TARGETS[target]
+        self.open_browser = open_browser
+        self.wait_serve = wait_serve
+        self.teardown = teardown
+        self.head_timeout_s = head_timeout_s
+        self.probe_timeout_s = probe_timeout_s
+        # Forward Prometheus and Grafana; None uses the target's default
+        self.monitoring = self.config["monitoring"] if monitoring is None else monitoring
+        self.timings = StepTimings()
+        self.stopping = threading.Event()
+        self.forwards = []
+        self.forwards_lock = threading.Lock()
+        self.head_pod = None
+        self.ready_s = None
+        self.supervisor = None
+        self.closed = False
+        self.pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="bring-up")
+
+    def wait_for(self, probe: Callable[[], bool], timeout_s: float, what: str):
+        """Poll probe with exponential backoff until it passes"""
+        deadline = time.perf_counter() + timeout_s
+        delay = 0.1
+        while not probe():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise BringUpError(f"{what} not ready after {timeout_s:g}s")
+            if self.stopping.wait(min(delay, remaining)):
+                raise BringUpError(f"Stopped waiting for {what}")
+            delay = min(delay * 2, MAX_PROBE_DELAY_S)
+
+    def find_head_pod(self, ready_only: bool = True) -> Optional[str]:
+        output = run_command(["kubectl", "get", "pods", "-n", NAMESPACE, "-l", HEAD_SELECTOR, "-o",
+                              'jsonpath={range .items[*]}{.metadata.name} '
+                              '{.status.conditions[?(@.type=="Ready")].status}{"\\n"}{end}'])
+        for line in output.splitlines():
+            name, _, ready = line.partition(" ")
+            if name and (ready.strip() == "True" or not ready_only):
+                return name
+        return None
+
+    def _head_ready(self) -> bool:
+        # The API server can briefly refuse requests while the cluster starts
+        try:
+            return self.find_head_pod() is not None
+        except BringUpError:
+            return False
+
+    def _head_resource(self) -> str:
+        self.head_pod = self.find_head_pod(ready_only=False) or self.head_pod
+        return f"pod/{self.head_pod}"
+
+    def _gcs_healthy(self) -> bool:
+        try:
+            run_command(["kubectl", "exec", "-n", NAMESPACE, self.head_pod, "-c", HEAD_CONTAINER, "--",
+                         "ray", "health-check", "--address", f"127.0.0.1:{GCS_PORT}"], timeout_s=30)
+            return True
+        except BringUpError:
+            return False
+
+    def _forward(self, name: str, resource, ports: List[int], health_url: Optional[str],
+                 namespace: str = NAMESPACE) -> PortForward:
+        """Start a port-forward, wait until it answers, then put it under supervision"""
+        forward = PortForward(name, resource, ports, namespace)
+
+        def ready() -> bool:
+            # kubectl exits right away when the target has no running pod yet
+            if not forward.alive():
+                forward.start()
+                return False
+            return forward.listening() and (health_url is None or http_ok(health_url))
+
+        with self.timings.step(f"{name} port-forward"):
+            forward.start()
+            try:
+                self.wait_for(ready, self.probe_timeout_s, name)
+            except BaseException:
+                forward.stop()
+                raise
+        with self.forwards_lock:
+            self.forwards.append(forward)
+        return forward
+
+    def _head_chain(self):
+        if self.config["apply"]:
+            with self.timings.step("apply cluster config"):
+                run_command(["kubectl", "apply", "-f", self.config["cluster_config"]], stopping=self.stopping)
+        with self.timings.step("head pod ready"):
+            self.wait_for(self._head_ready, self.head_timeout_s, "Ray head pod")
+            self.head_pod = self.find_head_pod()
+        # The code server and the head's own ports only need the head pod
+        code_server = self.pool.submit(self._forward, "code server", "svc/coder-service", [CODE_SERVER_PORT],
+                                       f"http://127.0.0.1:{CODE_SERVER_PORT}/healthz")
+        self._forward("ray head", self._head_resource, [DASHBOARD_PORT, GCS_PORT, SERVE_PORT, HEAD_METRICS_PORT],
+                      None)
+        dashboard = self.pool.submit(self._probe, "dashboard", f"http://127.0.0.1:{DASHBOARD_PORT}/api/version")
+        with self.timings.step("GCS healthy"):
+            self.wait_for(self._gcs_healthy, self.probe_timeout_s, "GCS")
+        dashboard.result()
+        serve_url = f"http://127.0.0.1:{SERVE_PORT}/-/healthz"
+        if self.wait_serve:
+            self._probe("serve", serve_url)
+        elif not http_ok(serve_url):
+            print(f"[{self.timings.elapsed():6.1f}s] Serve is not running yet; deploy an app with `serve run`")
+        code_server.result()
+
+    def _probe(self, name: str, url: str):
+        with self.timings.step(f"{name} ready"):
+            self.wait_for(lambda: http_ok(url), self.probe_timeout_s, name)
+
+    def _monitoring_chain(self):
+        if self.config["prometheus_install"]:
+            with self.timings.step("install prometheus stack"):
+                run_command(["bash", self.config["prometheus_install"]], timeout_s=PROMETHEUS_INSTALL_TIMEOUT_S,
+                            stopping=self.stopping)
+        prometheus = self.pool.submit(self._forward, "prometheus", "prometheus-prometheus-kube-prometheus-prometheus-0",
+                                      [PROMETHEUS_PORT], f"http://127.0.0.1:{PROMETHEUS_PORT}/-/ready",
+                                      "prometheus-system")
+        self._forward("grafana", "deployment/prometheus-grafana", [GRAFANA_PORT],
+                      f"http://127.0.0.1:{GRAFANA_PORT}/api/health", "prometheus-system")
+        prometheus.result()
+
+    def _monitoring_done(self, future):
+        if not self.stopping.is_set() and future.exception() is not None:
+            print(f"Monitoring is not available: {future.exception()}")
+        elif future.exception() is None:
+            print(f"Prometheus http://localhost:{PROMETHEUS_PORT} and Grafana http://localhost:{GRAFANA_PORT} are ready")
+
+    def bring_up(self) -> "Cluster":
+        """Run every step and return once the head, dashboard and GCS are ready"""
+        try:
+            for command in self.config["prepare"]:
+                with self.timings.step(" ".join(command[:3])):
+                    run_command(command)
+            head = self.pool.submit(self._head_chain)
+            # Dashboards are a convenience; the cluster is usable without them,
+            # so readiness does not wait for this chain
+            if self.monitoring:
+                monitoring = self.pool.submit(self._monitoring_chain)
+                monitoring.add_done_callback(self._monitoring_done)
+            head.result()
+            self.ready_s = self.timings.elapsed()
+        except BaseException:
+            # Report the failure now: steps still running see `stopping` and
+            # end within a probe interval, queued ones never start
+            self.stopping.set()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.timings.print_breakdown()
+            self.close()
+            raise
+        self.timings.print_breakdown()
+        print(f"\nRay cluster is ready in {self.ready_s:.1f}s")
+        print(f"  Dashboard    http://localhost:{DASHBOARD_PORT}")
+        print(f"  Code server  http://localhost:{CODE_SERVER_PORT}")
+        print(f"  Serve        http://localhost:{SERVE_PORT}")
+        if self.open_browser:
+            webbrowser.open(f"http://localhost:{CODE_SERVER_PORT}/?folder=/home/ray")
+            webbrowser.open(f"http://localhost:{DASHBOARD_PORT}/#/cluster")
+        return self
+
+    def check_forwards(self):
+        """Restart port-forwards that exited or stopped accepting connections"""
+        now = time.perf_counter()
+        with self.forwards_lock:
+            forwards = list(self.forwards)
+        for forward in forwards:
+            if forward.alive():
+                if forward.listening():
+                    forward.probe_failures = 0
+                    continue
+                forward.probe_failures += 1
+                if forward.probe_failures < MAX_PROBE_FAILURES:
+                    continue
+                reason = "stopped accepting connections"
+            else:
+                reason = "exited"
+            # Space out restarts of a forward that keeps dying, e.g. while its pod restarts
+            backoff = min(MAX_RESTART_BACKOFF_S, 2.0 ** forward.restarts)
+            if now - forward.started_at < backoff:
+                continue
+            print(f"Port-forward {forward.name} {reason}, restarting (restart {forward.restarts + 1})")
+            forward.stop()
+            try:
+                forward.start()
+            except BringUpError as e:
+                print(f"Could not restart port-forward {forward.name}: {e}")
+                forward.started_at = now
+            forward.restarts += 1
+
+    def supervise(self):
+        """Keep the port-forwards up until close() is called or Ctrl+C"""
+        while not self.stopping.wait(SUPERVISE_INTERVAL_S):
+            self.check_forwards()
+
+    def start_supervisor(self):
+        self.supervisor = threading.Thread(target=self.supervise, name="port-forward-supervisor", daemon=True)
+        self.supervisor.start()
+
+    def close(self):
+        """Stop the port-forwards and delete the cluster (unless teardown is off)"""
+        if self.closed:
+            return
+        self.closed = True
+        self.stopping.set()
+        print("Cleaning up...")
+        with self.forwards_lock:
+            for forward in self.forwards:
+                forward.stop()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.teardown:
+            try:
+                run_command(["kubectl", "delete", "-f", self.config["cluster_config"]])
+            except BringUpError as e:
+                print(e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bring up a Ray cluster and keep its port-forwards alive')
+    parser.add_argument('target', choices=sorted(TARGETS), help='Where the cluster runs')
+    parser.add_argument('--no-browser', action='store_true', help='Do not open the code server and dashboard')
+    parser.add_argument('--wait-serve', action='store_true', help='Also wait for the Serve proxy to be healthy')
+    parser.add_argument('--keep-cluster', action='store_true', help='Do not delete the cluster on exit')
+    parser.add_argument('--head-timeout', type=float, default=300.0, help='Seconds to wait for the head pod')
+    parser.add_argument('--monitoring', action='store_true', default=None,
+                        help='Also forward Prometheus and Grafana (the default for aws)')
+
+    args = parser.parse_args()
+
+    cluster = Cluster(args.target, open_browser=not args.no_browser, wait_serve=args.wait_serve,
+                      teardown=not args.keep_cluster, head_timeout_s=args.head_timeout, monitoring=args.monitoring)
+    try:
+        cluster.bring_up()
+        print("Press Ctrl+C to clean up and exit")
+        cluster.supervise()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.close()
@@ -1,57 +1,121 @@
-import typer
-from typing import List, Optional
-import questionary
-import subprocess
-import atexit
 import time
-import sys
+_START = time.perf_counter()
+
 import os
+import sys
+import typer
+from typing import List, Optional
+
+# questionary, subprocess and the cluster orchestrator are only needed by the
+# commands that use them, so they are imported there. Keeping module load to
+# typer alone makes non-interactive runs (CI loops) start fast.
+_IMPORTS_DONE = time.perf_counter()
+
 app = typer.Typer()
+# `rayzer` without a subcommand opens the interactive menu; its subcommands
+# run the same actions without prompts.
+rayzer_app = typer.Typer(invoke_without_command=True, help="Ray cluster, service and job management.")
+cluster_app = typer.Typer(help="Launch Ray clusters.")
+service_app = typer.Typer(help="Launch example Ray Serve services.")
+job_app = typer.Typer(help="Launch example Ray jobs.")
+app.add_typer(rayzer_app, name="rayzer")
+rayzer_app.add_typer(cluster_app, name="cluster")
+rayzer_app.add_typer(service_app, name="service")
+rayzer_app.add_typer(job_app, name="job")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_SOURCE_DIR = os.path.join(REPO_DIR, "ray_ws")
+DEFAULT_WORKSPACE = os.path.join(REPO_DIR, "workspace")
+XGBOOST_SERVICE_FILES = [
+    "load_test.py",
+    "serve_app.py",
+    "bulk_codec.py",
+    "tree_engine.py",
+    "prediction_cache.py",
+    "latency_histogram.py",
+    "scenarios.py",
+    "results_sink.py",
+    "compare_runs.py",
+    "stack_sampler.py",
+    "model_store.py",
+    "multi_model_app.py",
+    "autoscaling_sim.py",
+    "local_serve.py",
+    "hot_path_bench.py",
+    "autoscaling_scenario.json",
+]
+
+BANNER = "\033[1m" + """
+██████╗  █████╗ ██╗   ██╗███████╗███████╗██████╗
+██╔══██╗██╔══██╗╚██╗ ██╔╝╚══███╔╝██╔════╝██╔══██╗
+██████╔╝███████║ ╚████╔╝   ███╔╝ █████╗  ██████╔╝
+██╔══██╗██╔══██║  ╚██╔╝   ███╔╝  ██╔══╝  ██╔══██╗
+██║  ██║██║  ██║   ██║   ███████╗███████╗██║  ██║
+╚═╝  ╚═╝╚═╝  ╚═╝   ╚═╝   ╚══════╝╚══════╝╚═╝  ╚═╝
+""" + "\033[0m"
+
+# Startup report, enabled with --timings or RAYZER_TIMINGS=1
+_timings = {"enabled": False, "dispatch": None}
+
+
+def _report_timings():
+    end = time.perf_counter()
+    dispatch = _timings["dispatch"] or end
+    print(f"rayzer timings: imports {(_IMPORTS_DONE - _START) * 1000:.1f} ms, "
+          f"cli setup {(dispatch - _IMPORTS_DONE) * 1000:.1f} ms, "
+          f"command {(end - dispatch) * 1000:.1f} ms, "
+          f"total {(end - _START) * 1000:.1f} ms", file=sys.stderr)
+
 
 @app.command()
 def hello(name: str, age: int):
     print(f"Hello {name}! You are {age} years old.")
 
-@app.command()
+
+@rayzer_app.callback()
 def rayzer(
-    # default_option: Optional[str] = typer.Option(
-    #     None, 
-    #     "--option", 
-    #     "-o", 
-    #     help="Specify a default option to run without interactive prompts"
-    # )
+    ctx: typer.Context,
+    timings: bool = typer.Option(
+        False,
+        "--timings",
+        envvar="RAYZER_TIMINGS",
+        help="Print import, setup and command times to stderr on exit"
+    )
 ):
     """Interactive Ray cluster and job management."""
-    print("\033[1m" + """
-██████╗  █████╗ ██╗   ██╗███████╗███████╗██████╗ 
-██╔══██╗██╔══██╗╚██╗ ██╔╝╚══███╔╝██╔════╝██╔══██╗
-██████╔╝███████║ ╚████╔╝   ███╔╝ █████╗  ██████╔╝
-██╔══██╗██╔══██║  ╚██╔╝   ███╔╝  ██╔══╝  ██╔══██╗
-██║  ██║██║  ██║   ██║   ███████╗███████╗██║  ██║
-╚═╝  ╚═╝╚═╝  ╚═╝   ╚═╝   ╚══════╝╚══════╝╚═╝  ╚═╝
-""" + "\033[0m")
-
-    # handle_option("ColdStart")
-        
-
-    # Otherwise, show the interactive menu
-    choice = questionary.select(
-        "Welcome to Rayzer! Fastest way to get started with Ray.",
-        choices=[
-            "Launch a new job",
-            "Launch a new service",
-            "Launch a Ray Cluster",
-            "ColdStart",
-            "Exit"
-        ]
-    ).ask()
-
-    handle_option(choice)
-
-def handle_option(choice: str):
-    """Handle the selected option."""
+    _timings["dispatch"] = time.perf_counter()
+    if timings and not _timings["enabled"]:
+        import atexit
+        _timings["enabled"] = True
+        atexit.register(_report_timings)
+    if ctx.invoked_subcommand is None:
+        interactive_menu()
+
+
+def interactive_menu():
+    """Show the menu until the user exits"""
+    import questionary
+    print(BANNER)
+    while True:
+        choice = questionary.select(
+            "Welcome to Rayzer! Fastest way to get started with Ray.",
+            choices=[
+                "Launch a new job",
+                "Launch a new service",
+                "Launch a Ray Cluster",
+                "ColdStart",
+                "Exit"
+            ]
+        ).ask()
+        # None when the prompt is cancelled with Ctrl-C
+        if choice is None or not handle_option(choice):
+            return
+
+
+def handle_option(choice: str) -> bool:
+    """Handle the selected option. Returns whether to show the main menu again."""
+    import questionary
     if choice == "Launch a new job":
-        
         job_type = questionary.select(
             "What type of job would you like to create?",
             choices=[
@@ -63,16 +127,16 @@ def handle_option(choice: str):
         ).ask()
 
         if job_type == "init Ray Job":
-            print("Initializing Ray Job...")
+            launch_job("init")
         elif job_type == "Example: Train a xgboost model":
-            print("Training a xgboost model...")
+            launch_job("xgboost")
         elif job_type == "Example: Train a pytorch model":
-            print("Training a pytorch model...")
+            launch_job("pytorch")
         elif job_type == "Go Back":
-            return app()
+            return True
 
     elif choice == "Launch a new service":
-        service_type = questionary.select(  
+        service_type = questionary.select(
             "What type of service would you like to create?",
             choices=[
                 "Example: Run inference on a pytorch model",
@@ -81,18 +145,17 @@ def handle_option(choice: str):
             ]
         ).ask()
         if service_type == "Example: Run inference on a xgboost model":
-            print("Downloading example xgboost model...")
-            anyscale_token = questionary.text(
-                "Please enter the path to your workspace:").ask()
-            subprocess.run(["cp", "/Users/robin/.rayzer/repo/ray_ws/load_test.py", "/Users/robin/source/anyscale/rayzer/workspace/load_test.py"], check=True)
-            subprocess.run(["cp", "/Users/robin/.rayzer/repo/ray_ws/serve_app.py", "/Users/robin/source/anyscale/rayzer/workspace/serve_app.py"], check=True)
-            return app()
-            # print("Running inference on a xgboost model...")
-
+            workspace = questionary.text(
+                "Please enter the path to your workspace:", default=DEFAULT_WORKSPACE).ask()
+            try:
+                deploy_service("xgboost", workspace or DEFAULT_WORKSPACE)
+            except typer.BadParameter as e:
+                print(e)
+            return True
         elif service_type == "Example: Run inference on a pytorch model":
-            print("Running inference on a pytorch model...")
+            deploy_service("pytorch", DEFAULT_WORKSPACE)
         elif service_type == "Go Back":
-            return app()
+            return True
 
     elif choice == "Launch a Ray Cluster":
         cluster_type = questionary.select(
@@ -104,61 +167,164 @@ def handle_option(choice: str):
                 "Go Back"
             ]
         ).ask()
-        
+
         if cluster_type == "Deploy a Ray Cluster locally":
-            print(f"Setting up local autoscaling Ray Cluster...")
-            print(f"This will take a few minutes and open a few browser windows.")
-            
-            proc = subprocess.Popen(["bash", "ray_infra_local.sh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            atexit.register(lambda p: p.kill(), proc)  # Kill subprocess when Python exits
-        
-            # time.sleep(5)
-            # Create a loading spinner animation
-            def spinner(time_to_run=5):
-                chars = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
-                start_time = time.time()
-                while time.time() - start_time < time_to_run:
-                    for char in chars:
-                        sys.stdout.write('\r' + 'Setting up cluster ' + char)
-                        sys.stdout.flush()
-                        time.sleep(0.1)
-                sys.stdout.write('\r' + ' ' * 20 + '\r')  # Clear the line
-                sys.stdout.flush()
-            
-            spinner()  # Run the spinner for 5 seconds
-            print("Local Ray cluster launched successfully!")
-            # Return to the main menu
-            return app()
-            
+            cluster_up("local", background=True)
+            return True
         elif cluster_type == "Deploy a Ray Cluster on AWS":
-            print(f"Setting up Ray cluster on AWS...")
-            print(f"This will take a few minutes and open a few browser windows.")
-            subprocess.run(["bash", "ray_infra_aws.sh"], check=True)
-            print("Ray cluster on AWS launched successfully!")
-
-
+            cluster_up("aws")
         elif cluster_type == "Deploy a managed Ray Cluster on Anyscale":
-            print(f"Setting up Ray cluster on Anyscale...")
-            print(f"This will take a few minutes and open a few browser windows.")
             anyscale_token = questionary.text(
                 "Please enter your Anyscale CLI token:").ask()
-            os.environ["ANYSCALE_CLI_TOKEN"] = anyscale_token
-            subprocess.run(["anyscale login"], check=True)
-            return app()
-
+            cluster_up("anyscale", token=anyscale_token)
+            return True
         elif cluster_type == "Go Back":
-            return app()
-            
+            return True
 
     elif choice == "ColdStart":
-        print(f"Running ColdStart...")
-        proc = subprocess.Popen(["bash", "ray_infra_local.sh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        atexit.register(lambda p: p.kill(), proc)  # Kill subprocess when Python exits
-        # return app()
+        cold_start()
 
     elif choice == "Exit":
         print("Exiting Rayzer CLI. Goodbye!")
-        return
+    return False
+
+
+def launch_job(job_type: str):
+    if job_type == "init":
+        print("Initializing Ray Job...")
+    elif job_type == "xgboost":
+        print("Training a xgboost model...")
+    elif job_type == "pytorch":
+        print("Training a pytorch model...")
+
+
+def deploy_service(service_type: str, workspace: str = DEFAULT_WORKSPACE):
+    if service_type == "xgboost":
+        import shutil
+        missing = [name for name in XGBOOST_SERVICE_FILES
+                   if not os.path.isfile(os.path.join(EXAMPLE_SOURCE_DIR, name))]
+        if missing:
+            raise typer.BadParameter(f"Example service files missing from {EXAMPLE_SOURCE_DIR}: "
+                                     f"{', '.join(missing)}")
+        print("Downloading example xgboost model...")
+        os.makedirs(workspace, exist_ok=True)
+        for name in XGBOOST_SERVICE_FILES:
+            shutil.copy(os.path.join(EXAMPLE_SOURCE_DIR, name), os.path.join(workspace, name))
+        print(f"Copied the xgboost service to {workspace}")
+    elif service_type == "pytorch":
+        print("Running inference on a pytorch model...")
+
+
+def cluster_up(target: str, background: bool = False, token: Optional[str] = None,
+               open_browser: bool = True, keep_cluster: bool = False, wait_serve: bool = False,
+               monitoring: Optional[bool] = None):
+    if target in ("local", "aws"):
+        from cluster_orchestrator import BringUpError, Cluster
+        print(f"Setting up {'local autoscaling ' if target == 'local' else ''}Ray cluster"
+              f"{' on AWS' if target == 'aws' else ''}...")
+        cluster = Cluster(target, open_browser=open_browser, wait_serve=wait_serve, teardown=not keep_cluster,
+                          monitoring=monitoring)
+        try:
+            cluster.bring_up()
+        except BringUpError as e:
+            print(f"Ray cluster bring-up failed: {e}")
+            if background:
+                return
+            raise typer.Exit(1)
+        if background:
+            # The menu stays usable while port-forwards are supervised in a thread
+            import atexit
+            cluster.start_supervisor()
+            atexit.register(cluster.close)
+            return
+        print("Press Ctrl+C to clean up and exit")
+        try:
+            cluster.supervise()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cluster.close()
+    elif target == "anyscale":
+        import subprocess
+        print(f"Setting up Ray cluster on Anyscale...")
+        print(f"This will take a few minutes and open a few browser windows.")
+        if token:
+            os.environ["ANYSCALE_CLI_TOKEN"] = token
+        subprocess.run(["anyscale", "login"], check=True)
+
+
+def cold_start() -> int:
+    """Run the local cluster script in the foreground until it exits or Ctrl+C.
+    Returns the script's exit code, negative when a signal stopped it."""
+    import signal
+    import subprocess
+    print(f"Running ColdStart...")
+    # Output goes straight to the terminal; the script keeps its port-forwards
+    # up until it is interrupted. It runs in its own process group so Ctrl+C
+    # can stop it together with the port-forwards it started.
+    proc = subprocess.Popen(["bash", "ray_infra_local.sh"], cwd=REPO_DIR, start_new_session=True)
+    try:
+        return proc.wait()
+    except KeyboardInterrupt:
+        # Background jobs of a non-interactive bash ignore SIGINT, so stop the
+        # group with SIGTERM; the script's EXIT trap then deletes the cluster
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            return proc.wait(timeout=120)
+        except (KeyboardInterrupt, subprocess.TimeoutExpired):
+            proc.kill()
+            return proc.wait()
+
+
+@cluster_app.command("up")
+def cluster_up_command(
+    local: bool = typer.Option(False, "--local", help="Deploy a Ray cluster locally"),
+    aws: bool = typer.Option(False, "--aws", help="Deploy a Ray cluster on AWS"),
+    anyscale: bool = typer.Option(False, "--anyscale", help="Deploy a managed Ray cluster on Anyscale"),
+    token: Optional[str] = typer.Option(None, "--token", envvar="ANYSCALE_CLI_TOKEN",
+                                        help="Anyscale CLI token (for --anyscale)"),
+    no_browser: bool = typer.Option(False, "--no-browser", help="Do not open the code server and dashboard"),
+    keep_cluster: bool = typer.Option(False, "--keep-cluster", help="Do not delete the cluster on exit"),
+    wait_serve: bool = typer.Option(False, "--wait-serve", help="Also wait for the Serve proxy to be healthy"),
+    monitoring: bool = typer.Option(False, "--monitoring",
+                                    help="Also forward Prometheus and Grafana (always on for --aws)")
+):
+    """Launch a Ray cluster without prompts, then keep its port-forwards alive until Ctrl+C"""
+    targets = [name for name, selected in (("local", local), ("aws", aws), ("anyscale", anyscale)) if selected]
+    if len(targets) != 1:
+        raise typer.BadParameter("Pass exactly one of --local, --aws or --anyscale")
+    cluster_up(targets[0], token=token, open_browser=not no_browser, keep_cluster=keep_cluster,
+               wait_serve=wait_serve, monitoring=monitoring or None)
+
+
+@service_app.command("deploy")
+def service_deploy_command(
+    service_type: str = typer.Argument(..., help="xgboost or pytorch"),
+    workspace: str = typer.Option(DEFAULT_WORKSPACE, "--workspace", "-w",
+                                  help="Directory to copy the service files to")
+):
+    """Launch an example service without prompts"""
+    if service_type not in ("xgboost", "pytorch"):
+        raise typer.BadParameter(f"Unknown service {service_type}, expected xgboost or pytorch")
+    deploy_service(service_type, workspace)
+
+
+@job_app.command("run")
+def job_run_command(job_type: str = typer.Argument(..., help="init, xgboost or pytorch")):
+    """Launch an example job without prompts"""
+    if job_type not in ("init", "xgboost", "pytorch"):
+        raise typer.BadParameter(f"Unknown job {job_type}, expected init, xgboost or pytorch")
+    launch_job(job_type)
+
+
+@rayzer_app.command("coldstart")
+def coldstart_command():
+    """Run the local cluster script until Ctrl+C, then let it clean up"""
+    returncode = cold_start()
+    # Negative codes are the signal that stopped the script after Ctrl+C
+    if returncode > 0:
+        raise typer.Exit(returncode)
+
 
 if __name__ == "__main__":
     app()
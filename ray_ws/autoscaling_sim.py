@@ -0,0 +1,484 @@
+# autoscaling_sim.py
+"""Offline discrete-event simulator of Ray Serve autoscaling.
+
+Replays an arrival sequence against a model of one deployment: a handle that
+queues requests while every replica is at max_ongoing_requests, replicas that
+each serve `replica_concurrency` requests at a time from a FIFO queue (by
+default all max_ongoing_requests of them, as async replicas do), and
+the autoscaling policy of Ray Serve 2.44 (replica_queue_length_autoscaling_policy):
+
+    every metrics_interval_s the controller sees the total ongoing requests
+    (queued at the handle plus assigned to replicas), averaged over the last
+    look_back_period_s of samples taken every 0.5s;
+    every 0.1s it computes
+        error_ratio = ongoing / (target_ongoing_requests * current target replicas)
+        desired = ceil(current * (1 + (error_ratio - 1) * smoothing))
+    and scales once the decision has pointed the same way for
+    upscale_delay_s / downscale_delay_s.
+
+New replicas serve after startup_s; removed replicas finish their requests
+first. Service times are drawn independently of the payload from a
+distribution, e.g. the server-side times of a load-test results file.
+
+Only request arrivals, completions and control ticks are simulated, so an
+hour of traffic takes about a second.
+"""
+import ast
+import math
+import time
+import heapq
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from latency_histogram import LatencyHistogram
+from results_sink import merged_histogram, read_results
+
+# Defaults of ray.serve.config.AutoscalingConfig (Ray 2.44)
+AUTOSCALING_DEFAULTS = {
+    "min_replicas": 1,
+    "initial_replicas": None,
+    "max_replicas": 1,
+    "target_ongoing_requests": 2.0,
+    "metrics_interval_s": 10.0,
+    "look_back_period_s": 30.0,
+    "smoothing_factor": 1.0,
+    "upscale_smoothing_factor": None,
+    "downscale_smoothing_factor": None,
+    "upscale_delay_s": 30.0,
+    "downscale_delay_s": 600.0,
+}
+# Older name of target_ongoing_requests, still used by the deployments in this repo
+RENAMED_SETTINGS = {"target_num_ongoing_requests_per_replica": "target_ongoing_requests"}
+DEFAULT_MAX_ONGOING_REQUESTS = 5
+CONTROL_LOOP_INTERVAL_S = 0.1
+METRICS_RECORD_INTERVAL_S = 0.5
+DEFAULT_STARTUP_S = 5.0
+SIM_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def read_deployment_config(path: str, class_name: Optional[str] = None) -> Dict:
+    """
+    Options of the @serve.deployment decorator in a source file, read with ast
+    so the module (and Ray) is not imported
+
+    Only literal arguments are returned. With several deployments in the file,
+    class_name picks one.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    found = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or (class_name and node.name != class_name):
+            continue
+        for decorator in node.decorator_list:
+            if isinstance(decorator, ast.Call) and getattr(decorator.func, "attr", None) == "deployment":
+                options = {}
+                for keyword in decorator.keywords:
+                    try:
+                        options[keyword.arg] = ast.literal_eval(keyword.value)
+                    except ValueError:
+                        pass
+                found.append((node.name, options))
+    if not found:
+        raise ValueError(f"No @serve.deployment class{' ' + class_name if class_name else ''} in {path}")
+    if len(found) > 1:
+        raise ValueError(f"{path} has several deployments ({', '.join(name for name, _ in found)}), pick one")
+    return found[0][1]
+
+
+def autoscaling_settings(autoscaling_config: Dict, overrides: Optional[Dict] = None) -> Dict:
+    """Complete an autoscaling_config with Serve's defaults and apply overrides"""
+    settings = dict(AUTOSCALING_DEFAULTS)
+    for source in (autoscaling_config, overrides or {}):
+        for key, value in source.items():
+            key = RENAMED_SETTINGS.get(key, key)
+            if key not in settings:
+                raise ValueError(f"Unknown autoscaling setting {key}")
+            settings[key] = value
+    if not 0 <= settings["min_replicas"] <= settings["max_replicas"]:
+        raise ValueError("Need 0 <= min_replicas <= max_replicas")
+    if settings["target_ongoing_requests"] <= 0:
+        raise ValueError("target_ongoing_requests must be positive")
+    return settings
+
+
+def desired_replicas(settings: Dict, current: int, ongoing: float) -> int:
+    """Replica count the policy asks for, before the upscale/downscale delays"""
+    if current == 0:
+        return max(settings["min_replicas"], 1 if ongoing > 0 else 0)
+    error_ratio = ongoing / (settings["target_ongoing_requests"] * current)
+    if error_ratio >= 1:
+        smoothing = settings["upscale_smoothing_factor"] or settings["smoothing_factor"]
+    else:
+        smoothing = settings["downscale_smoothing_factor"] or settings["smoothing_factor"]
+    desired = math.ceil(current * (1 + (error_ratio - 1) * smoothing))
+    # With no traffic at all, step down even when smoothing rounds back up
+    if error_ratio == 0 and desired == current:
+        desired -= 1
+    return min(max(desired, settings["min_replicas"]), settings["max_replicas"])
+
+
+class ServiceTime:
+    """Distribution of the time a replica spends on one request"""
+
+    def __init__(self, values: np.ndarray, weights: Optional[np.ndarray] = None, description: str = ""):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.probabilities = None if weights is None else np.asarray(weights, dtype=np.float64) / np.sum(weights)
+        self.description = description
+
+    @property
+    def mean(self) -> float:
+        if self.probabilities is None:
+            return float(self.values.mean())
+        return float(self.values @ self.probabilities)
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.choice(self.values, size=size, p=self.probabilities)
+
+    @classmethod
+    def from_histogram(cls, histogram: LatencyHistogram, description: str = "") -> "ServiceTime":
+        buckets = histogram.buckets()
+        if not buckets:
+            raise ValueError("Service time histogram is empty")
+        values, counts = zip(*buckets)
+        return cls(np.array(values), np.array(counts), description)
+
+    @classmethod
+    def from_results(cls, path: str, part: str = "total_s") -> "ServiceTime":
+        """
+        Server-side times of a load-test results file (part of the server
+        timing breakdown), or the client response times when the server did
+        not report timings. Run the load test at low load so queueing does not
+        inflate them.
+        """
+        results = read_results(path)
+        server_times = ((results["summary"] or {}).get("stats") or {}).get("server_times", {})
+        if part in server_times:
+            return cls.from_histogram(LatencyHistogram.from_dict(server_times[part]), f"{path} server {part}")
+        print(f"{path} has no server timings for {part}; using client response times")
+        return cls.from_histogram(merged_histogram(results["windows"]), f"{path} response times")
+
+    @classmethod
+    def from_spec(cls, spec: str, samples: int = 100000, seed: int = 0) -> "ServiceTime":
+        """
+        A results file path, or a distribution in milliseconds:
+        constant:MS, exponential:MEAN_MS, lognormal:MEDIAN_MS,SIGMA
+        """
+        kind, _, args = spec.partition(":")
+        if kind not in ("constant", "exponential", "lognormal"):
+            return cls.from_results(spec)
+        params = [float(value) / (1000 if index == 0 else 1) for index, value in enumerate(args.split(","))]
+        rng = np.random.default_rng(seed)
+        if kind == "constant":
+            return cls(np.array([params[0]]), description=spec)
+        if kind == "exponential":
+            return cls(rng.exponential(params[0], samples), description=spec)
+        if len(params) != 2:
+            raise ValueError("lognormal needs MEDIAN_MS,SIGMA")
+        return cls(params[0] * np.exp(rng.normal(0.0, params[1], samples)), description=spec)
+
+
+class _Replica:
+    __slots__ = ("ready_at", "ongoing", "busy", "queue", "draining", "started_at")
+
+    def __init__(self, now: float, ready_at: float):
+        self.started_at = now
+        self.ready_at = ready_at
+        self.ongoing = 0  # assigned requests, running or queued at the replica
+        self.busy = 0
+        self.queue = deque()
+        self.draining = False
+
+
+class AutoscalingSimulator:
+    """Simulate one deployment's replicas, handle queue and autoscaler"""
+
+    def __init__(self,
+                 settings: Dict,
+                 service_time: ServiceTime,
+                 max_ongoing_requests: int = DEFAULT_MAX_ONGOING_REQUESTS,
+                 replica_concurrency: Optional[int] = None,
+                 startup_s: float = DEFAULT_STARTUP_S,
+                 timeline_interval_s: float = 1.0,
+                 seed: int = 0):
+        if replica_concurrency is None:
+            replica_concurrency = max_ongoing_requests
+        if replica_concurrency < 1 or max_ongoing_requests < replica_concurrency:
+            raise ValueError("Need 1 <= replica_concurrency <= max_ongoing_requests")
+        self.settings = settings
+        self.service_time = service_time
+        self.max_ongoing_requests = max_ongoing_requests
+        self.replica_concurrency = replica_concurrency
+        self.startup_s = startup_s
+        self.timeline_interval_s = timeline_interval_s
+        self.seed = seed
+
+    def run(self, arrivals: Sequence[float], duration: Optional[float] = None) -> Dict:
+        """
+        Simulate sorted arrival offsets (seconds) and return the summary and
+        timeline. Scaling stops at `duration` (default: the last arrival);
+        requests still queued then are served by the replicas left.
+        """
+        wall_start = time.perf_counter()
+        settings = self.settings
+        rng = np.random.default_rng(self.seed)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        duration = float(duration if duration is not None else (arrivals[-1] if len(arrivals) else 0.0))
+        service_times = self.service_time.sample(rng, len(arrivals))
+        route_draws = rng.random((len(arrivals), 2))
+
+        latency = LatencyHistogram()
+        queue_wait = LatencyHistogram()
+        completions = []  # heap of (time, seq, replica, arrival time)
+        sequence = itertools.count()
+        handle_queue = deque()
+        replicas = []
+
+        initial = settings["initial_replicas"]
+        target = settings["min_replicas"] if initial is None else initial
+        for _ in range(target):
+            replicas.append(_Replica(0.0, 0.0))
+
+        state = {"now": 0.0, "replica_seconds": 0.0, "upscales": 0, "downscales": 0}
+        decision_counter = 0
+        samples = deque()  # (time, total ongoing)
+        reported = None
+        timeline = []
+        next_record = 0.0
+        next_report = settings["metrics_interval_s"]
+        next_control = CONTROL_LOOP_INTERVAL_S
+        next_timeline = 0.0
+        interval_arrivals = 0
+        completed = 0
+
+        def advance(to: float):
+            state["replica_seconds"] += len(replicas) * (to - state["now"])
+            state["now"] = to
+
+        def start_service(replica: _Replica, request: int, now: float):
+            replica.busy += 1
+            queue_wait.record(now - arrivals[request])
+            heapq.heappush(completions, (now + service_times[request], next(sequence), replica, request))
+
+        def assign(request: int, now: float) -> bool:
+            # Power of two choices among ready replicas with room, like Serve's router
+            candidates = [replica for replica in replicas if replica.ready_at <= now and not replica.draining
+                          and replica.ongoing < self.max_ongoing_requests]
+            if not candidates:
+                return False
+            if len(candidates) == 1:
+                replica = candidates[0]
+            else:
+                first = candidates[int(route_draws[request, 0] * len(candidates))]
+                second = candidates[int(route_draws[request, 1] * len(candidates))]
+                replica = first if first.ongoing <= second.ongoing else second
+            replica.ongoing += 1
+            if replica.busy < self.replica_concurrency:
+                start_service(replica, request, now)
+            else:
+                replica.queue.append(request)
+            return True
+
+        def drain_handle_queue(now: float):
+            while handle_queue and assign(handle_queue[0], now):
+                handle_queue.popleft()
+
+        def scale_to(new_target: int, now: float):
+            active = [replica for replica in replicas if not replica.draining]
+            if new_target > len(active):
+                for _ in range(new_target - len(active)):
+                    replicas.append(_Replica(now, now + self.startup_s))
+                state["upscales"] += 1
+            elif new_target < len(active):
+                # Stop replicas that are still starting first, then the least loaded ones
+                active.sort(key=lambda replica: (replica.ready_at <= now, replica.ongoing))
+                for replica in active[:len(active) - new_target]:
+                    replica.draining = True
+                    if replica.ongoing == 0:
+                        replicas.remove(replica)
+                state["downscales"] += 1
+
+        index = 0
+        total = len(arrivals)
+        pending_ready = sorted(replica.ready_at for replica in replicas if replica.ready_at > 0)
+        while True:
+            next_arrival = arrivals[index] if index < total else math.inf
+            next_completion = completions[0][0] if completions else math.inf
+            in_control = state["now"] < duration
+            next_tick = min(next_record, next_control, next_timeline) if in_control else math.inf
+            next_ready = pending_ready[0] if pending_ready else math.inf
+            now = min(next_arrival, next_completion, next_tick, next_ready)
+            if now == math.inf:
+                break
+            if in_control and now > duration:
+                # Replica-seconds are counted up to the end of the scaling window
+                advance(duration)
+                continue
+            if in_control:
+                advance(now)
+            else:
+                state["now"] = now
+
+            if now == next_ready:
+                heapq.heappop(pending_ready)
+                drain_handle_queue(now)
+            elif now == next_completion:
+                _, _, replica, request = heapq.heappop(completions)
+                latency.record(now - arrivals[request])
+                completed += 1
+                replica.busy -= 1
+                replica.ongoing -= 1
+                if replica.queue:
+                    start_service(replica, replica.queue.popleft(), now)
+                if replica.draining and replica.ongoing == 0:
+                    replicas.remove(replica)
+                drain_handle_queue(now)
+            elif now == next_arrival:
+                if handle_queue or not assign(index, now):
+                    handle_queue.append(index)
+                index += 1
+                interval_arrivals += 1
+            else:
+                if now == next_record:
+                    ongoing = len(handle_queue) + sum(replica.ongoing for replica in replicas)
+                    samples.append((now, ongoing))
+                    next_record += METRICS_RECORD_INTERVAL_S
+                    if now >= next_report:
+                        while samples and samples[0][0] <= now - settings["look_back_period_s"]:
+                            samples.popleft()
+                        reported = sum(value for _, value in samples) / len(samples)
+                        next_report += settings["metrics_interval_s"]
+                if now == next_control:
+                    next_control += CONTROL_LOOP_INTERVAL_S
+                    if reported is not None or target == 0:
+                        current_ongoing = reported if reported is not None else len(handle_queue)
+                        desired = desired_replicas(settings, target, current_ongoing)
+                        if desired > target and target == 0:
+                            # Scaling up from zero does not wait for the delay
+                            decision_counter = 0
+                            target = desired
+                        elif desired > target:
+                            decision_counter = max(decision_counter, 0) + 1
+                            if decision_counter * CONTROL_LOOP_INTERVAL_S > settings["upscale_delay_s"]:
+                                decision_counter = 0
+                                target = desired
+                        elif desired < target:
+                            decision_counter = min(decision_counter, 0) - 1
+                            if -decision_counter * CONTROL_LOOP_INTERVAL_S > settings["downscale_delay_s"]:
+                                decision_counter = 0
+                                target = desired
+                        else:
+                            decision_counter = 0
+                        active = sum(1 for replica in replicas if not replica.draining)
+                        if target != active:
+                            scale_to(target, now)
+                            for replica in replicas:
+                                if replica.ready_at > now and replica.ready_at not in pending_ready:
+                                    heapq.heappush(pending_ready, replica.ready_at)
+                if now == next_timeline:
+                    next_timeline += self.timeline_interval_s
+                    timeline.append({
+                        "t": now,
+                        "arrival_rps": interval_arrivals / self.timeline_interval_s,
+                        "target_replicas": target,
+                        "running_replicas": sum(1 for replica in replicas
+                                                if replica.ready_at <= now and not replica.draining),
+                        "replicas": len(replicas),
+                        "ongoing": sum(replica.ongoing for replica in replicas),
+                        "handle_queue": len(handle_queue),
+                        "reported_ongoing": reported,
+                    })
+                    interval_arrivals = 0
+
+        wall_s = time.perf_counter() - wall_start
+        return {
+            "settings": dict(settings),
+            "max_ongoing_requests": self.max_ongoing_requests,
+            "replica_concurrency": self.replica_concurrency,
+            "startup_s": self.startup_s,
+            "service_time": self.service_time.description,
+            "duration_s": duration,
+            "requests": total,
+            "completed": completed,
+            "latency_ms": {name: value * 1000 if value is not None else None
+                           for name, value in latency.percentiles(SIM_PERCENTILES).items()},
+            "queue_wait_ms": {name: value * 1000 if value is not None else None
+                              for name, value in queue_wait.percentiles(SIM_PERCENTILES).items()},
+            "replica_seconds": state["replica_seconds"],
+            "mean_replicas": state["replica_seconds"] / duration if duration else None,
+            "max_replicas": max((point["replicas"] for point in timeline), default=len(replicas)),
+            "upscales": state["upscales"],
+            "downscales": state["downscales"],
+            "sim_wall_s": wall_s,
+            "speedup": duration / wall_s if wall_s > 0 else None,
+            "timeline": timeline,
+        }
+
+
+def _run_config(args):
+    simulator, arrivals, duration = args
+    return simulator.run(arrivals, duration)
+
+
+def sweep(base_settings: Dict,
+          grid: Dict[str, List],
+          service_time: ServiceTime,
+          arrivals: Sequence[float],
+          duration: Optional[float] = None,
+          workers: int = 1,
+          **simulator_options) -> List[Dict]:
+    """Simulate every combination of the values in grid, in parallel processes when workers > 1"""
+    keys = list(grid)
+    runs = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        settings = autoscaling_settings(base_settings, dict(zip(keys, values)))
+        runs.append((AutoscalingSimulator(settings, service_time, **simulator_options), arrivals, duration))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_run_config, runs))
+    return [_run_config(run) for run in runs]
+
+
+def print_simulation(result: Dict):
+    settings = result["settings"]
+    print(f"\n===== Autoscaling simulation ({result['duration_s']:.0f}s simulated in {result['sim_wall_s']:.2f}s, "
+          f"{result['speedup']:.0f}x real time) =====")
+    print(f"Replicas {settings['min_replicas']}-{settings['max_replicas']}, "
+          f"target ongoing {settings['target_ongoing_requests']:g}, "
+          f"max ongoing {result['max_ongoing_requests']}, startup {result['startup_s']:g}s, "
+          f"delays up {settings['upscale_delay_s']:g}s / down {settings['downscale_delay_s']:g}s, "
+          f"smoothing {settings['smoothing_factor']:g}")
+    print(f"Service time: {result['service_time']}")
+    print(f"Requests: {result['completed']}/{result['requests']} completed")
+    print("Latency (ms):    " + ", ".join(f"{name} {value:.1f}" for name, value in result["latency_ms"].items()
+                                          if value is not None))
+    print("Queue wait (ms): " + ", ".join(f"{name} {value:.1f}" for name, value in result["queue_wait_ms"].items()
+                                          if value is not None))
+    print(f"Replica-seconds: {result['replica_seconds']:.0f} (mean {result['mean_replicas'] or 0:.2f}, "
+          f"max {result['max_replicas']}), {result['upscales']} upscales, {result['downscales']} downscales")
+
+
+def print_sweep(results: List[Dict], keys: List[str], slo_p99_ms: Optional[float] = None):
+    """One row per config, cheapest first; configs missing the p99 SLO are marked"""
+    print(f"\n===== Autoscaling sweep ({len(results)} configs) =====")
+    header = "".join(f"{key:>24}" for key in keys)
+    print(f"{header} {'p50 ms':>9} {'p99 ms':>9} {'wait p99':>9} {'replica-s':>10} {'max':>4} {'scales':>7}")
+    ranked = sorted(results, key=lambda result: result["replica_seconds"])
+    for result in ranked:
+        latency = result["latency_ms"]
+        p99 = latency.get("p99") or 0.0
+        row = "".join(f"{result['settings'][key]!s:>24}" for key in keys)
+        mark = "  misses SLO" if slo_p99_ms is not None and p99 > slo_p99_ms else ""
+        print(f"{row} {latency.get('p50') or 0:>9.1f} {p99:>9.1f} {result['queue_wait_ms'].get('p99') or 0:>9.1f} "
+              f"{result['replica_seconds']:>10.0f} {result['max_replicas']:>4} "
+              f"{result['upscales'] + result['downscales']:>7}{mark}")
+    if slo_p99_ms is not None:
+        passing = [result for result in ranked if (result["latency_ms"].get("p99") or 0.0) <= slo_p99_ms]
+        if passing:
+            best = passing[0]["settings"]
+            print(f"Cheapest config within p99 <= {slo_p99_ms:g} ms: "
+                  + ", ".join(f"{key}={best[key]}" for key in keys))
+        else:
+            print(f"No config meets p99 <= {slo_p99_ms:g} ms")
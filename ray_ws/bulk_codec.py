@@ -0,0 +1,50 @@
+# bulk_codec.py
+"""Binary payload format for the /predict/bulk endpoint.
+
+Request body:  <uint32 n_rows><uint32 n_cols> then n_rows * n_cols float32 values
+Response body: <uint32 n_rows> then n_rows float32 predictions
+
+Everything is little-endian and row-major, so both sides can decode with
+np.frombuffer without copying or parsing.
+"""
+import struct
+import numpy as np
+
+CONTENT_TYPE = "application/octet-stream"
+
+MATRIX_HEADER = struct.Struct("<II")
+VECTOR_HEADER = struct.Struct("<I")
+DTYPE = np.dtype("<f4")
+
+
+def encode_matrix(X: np.ndarray) -> bytes:
+    """Encode a 2D feature matrix as a bulk request body"""
+    X = np.ascontiguousarray(X, dtype=DTYPE)
+    if X.ndim != 2:
+        raise ValueError(f"Expected a 2D matrix, got shape {X.shape}")
+    return MATRIX_HEADER.pack(*X.shape) + X.tobytes()
+
+
+def decode_matrix(body: bytes) -> np.ndarray:
+    """Decode a bulk request body into a read-only (n_rows, n_cols) view of it"""
+    if len(body) < MATRIX_HEADER.size:
+        raise ValueError("Body is shorter than the shape header")
+    n_rows, n_cols = MATRIX_HEADER.unpack_from(body)
+    expected = MATRIX_HEADER.size + n_rows * n_cols * DTYPE.itemsize
+    if len(body) != expected:
+        raise ValueError(f"Expected {expected} bytes for a {n_rows}x{n_cols} matrix, "
+                         f"got {len(body)}")
+    return np.frombuffer(body, dtype=DTYPE, count=n_rows * n_cols,
+                         offset=MATRIX_HEADER.size).reshape(n_rows, n_cols)
+
+
+def encode_vector(values: np.ndarray) -> bytes:
+    """Encode a 1D prediction vector as a bulk response body"""
+    values = np.ascontiguousarray(values, dtype=DTYPE).ravel()
+    return VECTOR_HEADER.pack(len(values)) + values.tobytes()
+
+
+def decode_vector(body: bytes) -> np.ndarray:
+    """Decode a bulk response body into a read-only prediction vector"""
+    (n_rows,) = VECTOR_HEADER.unpack_from(body)
+    return np.frombuffer(body, dtype=DTYPE, count=n_rows, offset=VECTOR_HEADER.size)
@@ -0,0 +1,146 @@
+# compare_runs.py
+"""Statistical comparison of load-test results files.
+
+Confidence intervals come from a bootstrap over the one-second windows of a
+run: windows are resampled with replacement, their latency histograms merged
+and the metrics recomputed. Resampling whole windows keeps the correlation
+between requests that were in flight together, which per-request resampling
+would hide and so make intervals too narrow. Runs are resampled
+independently and the interval of a delta is taken from the differences of
+paired bootstrap draws.
+"""
+import math
+from typing import Dict, List, Optional
+import numpy as np
+from latency_histogram import LatencyHistogram
+from results_sink import read_results
+
+COMPARE_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class RunSamples:
+    """The windows of one results file as dense arrays for resampling"""
+
+    def __init__(self, path: str, skip_s: float = 0.0):
+        self.path = path
+        # Keep windows that started at or after skip_s
+        windows = [window for window in read_results(path)["windows"]
+                   if window["elapsed_s"] - window["interval_s"] >= skip_s - 1e-3]
+        if not windows:
+            raise ValueError(f"{path} has no windows after the first {skip_s:g}s")
+        self.windows = len(windows)
+        self.completed = np.array([window["completed"] for window in windows], dtype=np.float64)
+        self.errors = np.array([window["errors"] for window in windows], dtype=np.float64)
+        self.interval_s = np.array([window["interval_s"] for window in windows], dtype=np.float64)
+
+        # Only the buckets used anywhere in the run, as columns of a window x bucket matrix
+        histograms = [window["response_time"] for window in windows]
+        indices = sorted({index for histogram in histograms for index, _ in histogram["counts"]})
+        column = {index: position for position, index in enumerate(indices)}
+        self.counts = np.zeros((len(windows), len(indices)), dtype=np.float64)
+        for row, histogram in enumerate(histograms):
+            for index, count in histogram["counts"]:
+                self.counts[row, column[index]] = count
+        reference = LatencyHistogram.from_dict(histograms[0])
+        self.bucket_values = np.array([reference._highest_equivalent(index) / 1e6 for index in indices])
+
+    def metrics(self, weights: np.ndarray, percentiles=COMPARE_PERCENTILES) -> Dict[str, np.ndarray]:
+        """
+        Metrics of the run with each window counted weights[i] times
+
+        weights has shape (draws, windows); every metric is returned as an
+        array with one value per draw.
+        """
+        completed = weights @ self.completed
+        errors = weights @ self.errors
+        elapsed = weights @ self.interval_s
+        with np.errstate(invalid="ignore", divide="ignore"):
+            metrics = {
+                "throughput_rps": completed / elapsed,
+                "error_rate": errors / (completed + errors),
+            }
+        cumulative = np.cumsum(weights @ self.counts, axis=1)
+        total = cumulative[:, -1] if cumulative.shape[1] else np.zeros(len(weights))
+        for percentile in percentiles:
+            target = np.maximum(1, np.ceil(percentile / 100.0 * total))
+            position = np.minimum((cumulative < target[:, None]).sum(axis=1), len(self.bucket_values) - 1)
+            values = self.bucket_values[position] * 1000 if len(self.bucket_values) else np.full(len(weights), np.nan)
+            metrics[f"p{percentile:g}_ms"] = np.where(total > 0, values, np.nan)
+        return metrics
+
+    def point(self, percentiles=COMPARE_PERCENTILES) -> Dict[str, float]:
+        values = self.metrics(np.ones((1, self.windows)), percentiles)
+        return {name: float(value[0]) for name, value in values.items()}
+
+    def bootstrap(self, draws: int, rng: np.random.Generator, percentiles=COMPARE_PERCENTILES) -> Dict[str, np.ndarray]:
+        weights = rng.multinomial(self.windows, np.full(self.windows, 1.0 / self.windows), size=draws)
+        return self.metrics(weights.astype(np.float64), percentiles)
+
+
+def compare_runs(baseline: RunSamples,
+                 candidate: RunSamples,
+                 draws: int = 1000,
+                 confidence: float = 0.95,
+                 threshold: float = 0.05,
+                 error_threshold: float = 0.005,
+                 seed: Optional[int] = 0) -> List[Dict]:
+    """
+    Compare candidate against baseline, one row per metric
+
+    A change is significant when the confidence interval of the delta excludes
+    zero. It is a regression when it is significant, in the worse direction
+    (lower throughput, higher latency or error rate) and larger than
+    `threshold` relative to the baseline (`error_threshold` absolute for the
+    error rate).
+    """
+    rng = np.random.default_rng(seed)
+    base_point, cand_point = baseline.point(), candidate.point()
+    base_draws, cand_draws = baseline.bootstrap(draws, rng), candidate.bootstrap(draws, rng)
+    tail = (1 - confidence) / 2 * 100
+
+    rows = []
+    for name in base_point:
+        delta = cand_point[name] - base_point[name]
+        differences = cand_draws[name] - base_draws[name]
+        differences = differences[~np.isnan(differences)]
+        if len(differences):
+            low, high = np.percentile(differences, [tail, 100 - tail])
+        else:
+            low, high = math.nan, math.nan
+        relative = delta / base_point[name] if base_point[name] else math.nan
+        higher_is_worse = name != "throughput_rps"
+        significant = bool(low > 0 or high < 0)
+        worse = delta > 0 if higher_is_worse else delta < 0
+        if name == "error_rate":
+            large = abs(delta) > error_threshold
+        else:
+            large = not math.isnan(relative) and abs(relative) > threshold
+        rows.append({
+            "metric": name,
+            "baseline": base_point[name],
+            "candidate": cand_point[name],
+            "delta": delta,
+            "relative": relative,
+            "ci_low": float(low),
+            "ci_high": float(high),
+            "significant": significant,
+            "regression": significant and worse and large,
+        })
+    return rows
+
+
+def print_comparison(baseline: RunSamples, candidate: RunSamples, rows: List[Dict], confidence: float):
+    print(f"\n===== {candidate.path} vs {baseline.path} =====")
+    print(f"Windows: {baseline.windows} baseline, {candidate.windows} candidate")
+    ci = f"{confidence * 100:g}% CI of delta"
+    print(f"{'metric':>15} {'baseline':>10} {'candidate':>10} {'delta':>10} {'change':>8} {ci:>23}  verdict")
+    for row in rows:
+        change = f"{row['relative'] * 100:+.1f}%" if not math.isnan(row["relative"]) else "n/a"
+        if row["regression"]:
+            verdict = "REGRESSION"
+        elif row["significant"]:
+            verdict = "significant"
+        else:
+            verdict = ""
+        print(f"{row['metric']:>15} {row['baseline']:>10.3f} {row['candidate']:>10.3f} {row['delta']:>+10.3f} "
+              f"{change:>8} [{row['ci_low']:>+10.3f}, {row['ci_high']:>+10.3f}]  {verdict}")
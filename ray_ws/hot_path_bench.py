@@ -0,0 +1,222 @@
+# hot_path_bench.py
+"""Micro-benchmarks of the XGBoostModel request path, without Ray.
+
+Every stage of a prediction request is timed on its own at several batch
+sizes, on an XGBoostModel created in-process by local_serve.py:
+
+    json_decode    json.loads of a /predict body (a list of rows when batch > 1)
+    features       building the float64 feature array from the decoded lists
+    bulk_decode    bulk_codec.decode_matrix of a /predict/bulk body
+    dmatrix        xgb.DMatrix construction
+    predict        Booster.predict on a prebuilt DMatrix
+    native_predict TreeEnsemble.predict (the "native" backend)
+    serialize      FastAPI's JSON encoding of one /predict response per row
+    bulk_encode    bulk_codec.encode_vector of the predictions
+    handler        the whole /predict (batch 1) or /predict/bulk handler on a
+                   synthetic request, including event loop overhead
+
+Each result is the median of `repeats` samples, each sample long enough
+(about 2 ms) for the timer to be accurate. A run is appended as one JSON
+line to the results file, and --baseline compares it with the last run in
+another file, exiting 1 when a stage got slower than --threshold:
+
+    python hot_path_bench.py --out bench.jsonl
+    python hot_path_bench.py --out bench.jsonl --baseline main-bench.jsonl
+"""
+import os
+import json
+import time
+import asyncio
+import platform
+import argparse
+import subprocess
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+from local_serve import local_app
+
+DEFAULT_BATCH_SIZES = (1, 16, 256, 4096)
+DEFAULT_REPEATS = 20
+# Target duration of one sample; fast stages are looped to reach it
+SAMPLE_TARGET_S = 0.002
+
+
+def measure(fn: Callable[[], object], repeats: int = DEFAULT_REPEATS) -> Dict:
+    """Per-call time statistics of fn in microseconds"""
+    fn()
+    start_time = time.perf_counter()
+    fn()
+    single = time.perf_counter() - start_time
+    inner = max(1, int(SAMPLE_TARGET_S / max(single, 1e-9)))
+    samples = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        samples.append((time.perf_counter() - start_time) / inner)
+    samples = np.array(samples) * 1e6
+    return {
+        "median_us": float(np.median(samples)),
+        "min_us": float(samples.min()),
+        "p90_us": float(np.percentile(samples, 90)),
+        "samples": repeats,
+        "inner_loops": inner,
+    }
+
+
+def _request(path: str, body: bytes):
+    """A Starlette request carrying body, as the ASGI server would build it"""
+    from starlette.requests import Request
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [], "query_string": b""}
+    return Request(scope, receive)
+
+
+def run_benchmarks(model, batch_sizes=DEFAULT_BATCH_SIZES, repeats: int = DEFAULT_REPEATS,
+                   stages: Optional[List[str]] = None) -> List[Dict]:
+    import xgboost as xgb
+    import bulk_codec
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from tree_engine import TreeEnsemble
+
+    engine = model.engine or TreeEnsemble.from_booster(model.model)
+    loop = asyncio.new_event_loop()
+    results = []
+
+    def bench(stage: str, batch_size: int, fn: Callable[[], object]):
+        if stages and stage not in stages:
+            return
+        result = dict(measure(fn, repeats), stage=stage, batch_size=batch_size)
+        result["per_row_ns"] = result["median_us"] * 1000 / batch_size
+        results.append(result)
+        print(f"{stage:>15} {batch_size:>6} {result['median_us']:>12.2f} {result['p90_us']:>12.2f} "
+              f"{result['per_row_ns']:>12.1f}")
+
+    print(f"{'stage':>15} {'batch':>6} {'median us':>12} {'p90 us':>12} {'ns per row':>12}")
+    for batch_size in batch_sizes:
+        X = np.random.rand(batch_size, model.n_features)
+        rows = X.tolist()
+        features = rows[0] if batch_size == 1 else rows
+        body = json.dumps({"features": features, "complexity": 1.0}).encode()
+        decoded = json.loads(body)
+        bulk_body = bulk_codec.encode_matrix(X)
+        dmatrix = xgb.DMatrix(X)
+        predictions = model.model.predict(dmatrix)
+        response = {"prediction": 0.5, "probability": 0.5, "processing_time": 0.001,
+                    "timings": {"total_s": 0.001, "predict_s": 0.0005}, "complexity": 1.0,
+                    "cached": False, "instance_id": "local", "replica_id": "local-0"}
+        responses = [dict(response, prediction=float(value)) for value in predictions]
+
+        bench("json_decode", batch_size, lambda: json.loads(body))
+        bench("features", batch_size, lambda: np.asarray(decoded["features"], dtype=np.float64))
+        bench("bulk_decode", batch_size, lambda: bulk_codec.decode_matrix(bulk_body))
+        bench("dmatrix", batch_size, lambda: xgb.DMatrix(X))
+        bench("predict", batch_size, lambda: model.model.predict(dmatrix))
+        bench("native_predict", batch_size, lambda: engine.predict(X))
+        bench("serialize", batch_size, lambda: [JSONResponse(jsonable_encoder(item)) for item in responses])
+        bench("bulk_encode", batch_size, lambda: bulk_codec.encode_vector(predictions))
+        if batch_size == 1:
+            bench("handler", batch_size,
+                  lambda: loop.run_until_complete(model._predict(_request("/predict", body))))
+        else:
+            bench("handler", batch_size,
+                  lambda: loop.run_until_complete(model._predict_bulk(_request("/predict/bulk", bulk_body))))
+    loop.close()
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def run_record(results: List[Dict], model) -> Dict:
+    import xgboost as xgb
+    return {
+        "type": "bench",
+        "started_at": time.time(),
+        "git_commit": _git_commit(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "xgboost": xgb.__version__,
+        "backend": model.backend,
+        "n_features": model.n_features,
+        "results": results,
+    }
+
+
+def last_run(path: str) -> Dict:
+    """The most recent benchmark run in a results file"""
+    record = None
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    if record is None:
+        raise ValueError(f"{path} has no benchmark runs")
+    return record
+
+
+def compare_to_baseline(run: Dict, baseline: Dict, threshold: float) -> int:
+    """Print the change of every stage and return how many got slower than threshold"""
+    base = {(result["stage"], result["batch_size"]): result for result in baseline["results"]}
+    print(f"\n===== vs baseline {baseline.get('git_commit') or ''} on {baseline.get('host')} =====")
+    print(f"{'stage':>15} {'batch':>6} {'baseline us':>12} {'now us':>12} {'change':>8}")
+    regressions = 0
+    for result in run["results"]:
+        before = base.get((result["stage"], result["batch_size"]))
+        if before is None:
+            continue
+        change = result["median_us"] / before["median_us"] - 1
+        slower = change > threshold
+        regressions += slower
+        print(f"{result['stage']:>15} {result['batch_size']:>6} {before['median_us']:>12.2f} "
+              f"{result['median_us']:>12.2f} {change * 100:>+7.1f}%{'  SLOWER' if slower else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-benchmark the prediction hot path without Ray')
+    parser.add_argument('--model-path', type=str, default=None,
+                        help='Model artifact to load (default: train the demo model)')
+    parser.add_argument('--batch-sizes', type=str, default=",".join(map(str, DEFAULT_BATCH_SIZES)),
+                        help='Comma-separated batch sizes')
+    parser.add_argument('--stages', type=str, default=None,
+                        help='Comma-separated stages to run (default: all)')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='Samples per stage and batch size')
+    parser.add_argument('--out', type=str, default='hot_path_bench.jsonl',
+                        help='JSONL file the run is appended to')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Compare with the last run in this file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown of a stage that counts as a regression')
+
+    args = parser.parse_args()
+
+    _, model = local_app(model_path=args.model_path, simulated_work_ratio=0.0)
+    results = run_benchmarks(model, [int(size) for size in args.batch_sizes.split(",")], args.repeats,
+                             args.stages.split(",") if args.stages else None)
+    record = run_record(results, model)
+    with open(args.out, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"Results appended to {args.out}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(record, last_run(args.baseline), args.threshold)
+        if regressions:
+            print(f"\n{regressions} stage(s) slower than the baseline by more than {args.threshold * 100:g}%")
+            raise SystemExit(1)
+        print(f"\nNo stage slower than the baseline by more than {args.threshold * 100:g}%")
@@ -0,0 +1,124 @@
+# latency_histogram.py
+"""Constant-memory latency histogram with HDR-style log-linear buckets.
+
+Values are stored as integer microseconds. Every power-of-two range is split
+into 2 * 10^significant_figures linear sub-buckets, so any recorded value can
+be read back within that relative precision while memory stays fixed no matter
+how many values are recorded. Histograms with the same settings can be merged,
+which lets separate runs or worker processes be combined exactly.
+"""
+import math
+from typing import Dict, List, Optional
+import numpy as np
+
+# Percentiles reported by default, up to p99.99
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99)
+
+
+class LatencyHistogram:
+    def __init__(self,
+                 highest_s: float = 3600.0,
+                 significant_figures: int = 3):
+        self.highest_s = highest_s
+        self.significant_figures = significant_figures
+        self.highest = int(highest_s * 1e6)
+
+        sub_bucket_count = 2 ** int(math.ceil(math.log2(2 * 10 ** significant_figures)))
+        self.sub_bucket_half_count_magnitude = int(math.log2(sub_bucket_count)) - 1
+        self.sub_bucket_half_count = sub_bucket_count // 2
+        self.sub_bucket_mask = sub_bucket_count - 1
+        bucket_count = 1
+        smallest_untrackable = sub_bucket_count
+        while smallest_untrackable <= self.highest:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = np.zeros((bucket_count + 1) * self.sub_bucket_half_count, dtype=np.int64)
+
+        self.total_count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def _index(self, value: int) -> int:
+        bucket_index = (value | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket_index = value >> bucket_index
+        return ((bucket_index + 1) << self.sub_bucket_half_count_magnitude) + \
+            (sub_bucket_index - self.sub_bucket_half_count)
+
+    def _highest_equivalent(self, index: int) -> int:
+        """Largest value that falls in the bucket at index"""
+        bucket_index = (index >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket_index < 0:
+            sub_bucket_index -= self.sub_bucket_half_count
+            bucket_index = 0
+        return (sub_bucket_index << bucket_index) + (1 << bucket_index) - 1
+
+    def record(self, seconds: float, count: int = 1):
+        """Record a latency in seconds; values past highest_s are clamped"""
+        value = min(max(int(seconds * 1e6), 0), self.highest)
+        self.counts[self._index(value)] += count
+        self.total_count += count
+        self.total_us += value * count
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+        self.max_us = max(self.max_us, value)
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """Add the counts of another histogram with the same settings into this one"""
+        if (other.highest, other.significant_figures) != (self.highest, self.significant_figures):
+            raise ValueError("Can only merge histograms with the same highest_s and significant_figures")
+        self.counts += other.counts
+        self.total_count += other.total_count
+        self.total_us += other.total_us
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+        return self
+
+    def value_at_percentile(self, percentile: float) -> Optional[float]:
+        """Latency in seconds at or below which `percentile` percent of values fall"""
+        if self.total_count == 0:
+            return None
+        target = max(1, int(math.ceil(percentile / 100.0 * self.total_count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), target))
+        return min(self._highest_equivalent(index), self.max_us) / 1e6
+
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES) -> Dict[str, Optional[float]]:
+        return {f"p{p:g}": self.value_at_percentile(p) for p in percentiles}
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total_us / self.total_count / 1e6 if self.total_count else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return self.max_us / 1e6 if self.total_count else None
+
+    def buckets(self) -> List[tuple]:
+        """Non-empty buckets as (upper bound in seconds, count) pairs"""
+        return [(self._highest_equivalent(int(i)) / 1e6, int(self.counts[i]))
+                for i in np.flatnonzero(self.counts)]
+
+    def to_dict(self) -> Dict:
+        """Serialize to a JSON-friendly dict with sparse counts"""
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "highest_s": self.highest_s,
+            "significant_figures": self.significant_figures,
+            "total_count": self.total_count,
+            "total_us": self.total_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "counts": [[int(i), int(self.counts[i])] for i in nonzero],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        histogram = cls(highest_s=data["highest_s"], significant_figures=data["significant_figures"])
+        for index, count in data["counts"]:
+            histogram.counts[index] = count
+        histogram.total_count = data["total_count"]
+        histogram.total_us = data["total_us"]
+        histogram.min_us = data["min_us"]
+        histogram.max_us = data["max_us"]
+        return histogram
@@ -1,58 +1,441 @@
 # load_test.py
+import csv
+import math
 import time
 import json
+import itertools
 import random
+import asyncio
 import argparse
 import requests
 import threading
 import concurrent.futures
-from typing import Dict
+from typing import Dict, Optional
 import numpy as np
-# import matplotlib.pyplot as plt
+import bulk_codec
+from latency_histogram import LatencyHistogram
+from autoscaling_sim import (DEFAULT_MAX_ONGOING_REQUESTS, DEFAULT_STARTUP_S, RENAMED_SETTINGS,
+                             AutoscalingSimulator, ServiceTime, autoscaling_settings, print_simulation,
+                             print_sweep, read_deployment_config, sweep)
+from compare_runs import RunSamples, compare_runs, print_comparison
+from results_sink import ResultsSink, plot_results
+from scenarios import load_scenario, scenario_phases, scenario_requests
 from datetime import datetime
 
+
+def arrival_schedule(requests_per_second: float,
+                     test_duration: float,
+                     ramp_up: bool = False,
+                     arrival: str = "constant"):
+    """
+    Yield intended send times (seconds from the start) for an open-loop test
+    
+    With ramp_up the rate grows linearly from 0 to requests_per_second over the
+    first half of the test. Arrival k is placed where the expected number of
+    requests sent so far reaches k ("constant") or a unit-rate Poisson count
+    reaches k ("poisson"), so both shapes follow the same rate curve.
+    """
+    if arrival not in ("constant", "poisson"):
+        raise ValueError(f"Unknown arrival process {arrival}, expected 'constant' or 'poisson'")
+    if requests_per_second <= 0:
+        return
+    ramp_time = test_duration * 0.5 if ramp_up else 0.0
+    ramp_requests = requests_per_second * ramp_time / 2
+    
+    count = 0.0
+    while True:
+        count += random.expovariate(1.0) if arrival == "poisson" else 1.0
+        # Invert the cumulative expected request count at time t
+        if count < ramp_requests:
+            offset = math.sqrt(2 * count * ramp_time / requests_per_second)
+        else:
+            offset = ramp_time + (count - ramp_requests) / requests_per_second
+        if offset >= test_duration:
+            return
+        yield offset
+
+
+def _parse_timestamp(value) -> float:
+    """Trace timestamps may be seconds (relative or epoch) or ISO 8601 strings"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def iter_trace(path: str,
+               speed: float = 1.0,
+               complexity_range: tuple = (0.5, 2.0),
+               feature_pool=None):
+    """
+    Stream (offset in seconds, payload) pairs from a recorded arrival trace
+    
+    The file is read one record at a time, so traces larger than memory work.
+    Records are CSV rows (with a header) or JSONL objects with the fields:
+        timestamp:  seconds or ISO 8601, relative to the first record (required)
+        complexity: request complexity (default: uniform in complexity_range)
+        features:   feature vector, a JSON list in CSV files (optional)
+        payload:    extra JSON object merged into the request body (optional)
+    Offsets are divided by speed, so speed=2.0 replays twice as fast.
+    """
+    if speed <= 0:
+        raise ValueError("Trace speed must be positive")
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        
+        first_timestamp = None
+        for record in records:
+            timestamp = _parse_timestamp(record["timestamp"])
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            
+            # CSV fields are strings, JSONL fields are already decoded
+            payload = record.get("payload") or {}
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            payload = dict(payload)
+            complexity = record.get("complexity")
+            payload["complexity"] = float(complexity) if complexity not in (None, "") else \
+                random.uniform(complexity_range[0], complexity_range[1])
+            features = record.get("features")
+            if isinstance(features, str) and features:
+                features = json.loads(features)
+            if features:
+                payload["features"] = features
+            elif feature_pool:
+                payload["features"] = random.choice(feature_pool)
+            
+            yield (timestamp - first_timestamp) / speed, payload
+
+
+def think_time_sampler(mean_s: float, distribution: str = "exponential"):
+    """Return a function drawing a virtual user's think time in seconds"""
+    if distribution == "constant":
+        return lambda: mean_s
+    if distribution == "exponential":
+        return lambda: random.expovariate(1.0 / mean_s) if mean_s > 0 else 0.0
+    if distribution == "uniform":
+        return lambda: random.uniform(0, 2 * mean_s)
+    raise ValueError(f"Unknown think time distribution {distribution}, "
+                     f"expected 'constant', 'exponential' or 'uniform'")
+
+
+def user_spans(levels, level_duration: float, ramp_up_s: float = 0.0):
+    """
+    Active (start, stop) spans in seconds of every virtual user for a list of
+    concurrency levels, each held for level_duration
+    
+    User u is active while the current level is above u. Users added by a
+    level start spread evenly over its first ramp_up_s seconds.
+    """
+    spans = [[] for _ in range(max(levels))]
+    previous = 0
+    for index, level in enumerate(levels):
+        level_start = index * level_duration
+        level_stop = level_start + level_duration
+        for user in range(level):
+            if user < previous and spans[user] and spans[user][-1][1] == level_start:
+                # Already active: extend the span into this level
+                spans[user][-1] = (spans[user][-1][0], level_stop)
+            else:
+                new_users = level - min(previous, level)
+                delay = ramp_up_s * (user - previous) / new_users if user >= previous else 0.0
+                spans[user].append((level_start + min(delay, level_duration), level_stop))
+        previous = level
+    return spans
+
+
+def _model_headers(payload: Dict) -> Optional[Dict]:
+    """Routing header for payloads that name a model"""
+    model_id = payload.get("model_id")
+    return {MULTIPLEXED_MODEL_HEADER: model_id} if model_id else None
+
+
+def _import_aiohttp():
+    """aiohttp is only needed by the async engine, so it is imported on demand"""
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("The async engine requires aiohttp (pip install aiohttp)")
+    return aiohttp
+
+
+# Order of the server-side parts reported by /predict (see XGBoostModel.predict),
+# followed by what is left of the client's service time
+SERVER_TIMING_PARTS = ("decode_s", "features_s", "cache_s", "batch_wait_s", "executor_wait_s",
+                       "dmatrix_s", "predict_s", "simulated_work_s", "total_s")
+OUTSIDE_SERVER_PART = "network_proxy_queue_s"
+
+
+# Header the Serve proxy uses to route a request to a replica holding that model
+MULTIPLEXED_MODEL_HEADER = "serve_multiplexed_model_id"
+
+# Workers of a LoadCoordinator start this long after the coordinator picks
+# their shared start time, so process (or Ray task) startup does not eat into
+# the first window
+WORKER_START_DELAY_S = 2.0
+# How long after a window ends the coordinator waits for every worker's part
+# before it reports the window with the parts it has
+WINDOW_MERGE_TIMEOUT_S = 5.0
+
+
+class PhaseStats:
+    """Counters and latency histogram for one phase of a scenario"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.sent = 0
+        self.completed = 0
+        self.errors = 0
+        self.instance_counts = {}
+        self.replica_counts = {}
+        self.response_times = LatencyHistogram()
+
+
 class LoadTester:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, feature_pool_size: int = 0, n_features: int = 20,
+                 model_ids: Optional[list] = None, model_zipf: float = 0.0):
         self.base_url = base_url.rstrip('/')
         self.predict_url = f"{self.base_url}/predict"
-        self.results = []
-        self.instance_counts = {}
         self.lock = threading.Lock()
+        # Serializes _count_sent when many threads send on their own (closed loop)
+        self.send_lock = threading.Lock()
+        self.verbose = True
+        # Called with a dict of per-interval stats (see _close_interval) once a second
+        self.interval_listeners = []
+        # Shared start time (epoch seconds) of the per-second windows. When set,
+        # windows are the whole seconds since it and carry their index, so the
+        # windows of several workers line up (see LoadCoordinator). Otherwise a
+        # window closes on the first send after a second of the run has passed.
+        self.window_epoch = None
+        # (seconds into a run, duration in seconds) of server profiles to take
+        # during each run, saved as <profile_prefix>-<at>s-<phase>.folded
+        self.profile_schedule = []
+        self.profile_prefix = "profile"
+        self.reset_stats()
+        # Send features drawn from a fixed pool so repeated vectors can hit the
+        # server-side prediction cache. Without it the server generates random ones.
+        self.feature_pool = np.random.rand(feature_pool_size, n_features).tolist() if feature_pool_size else None
+        # For multiplexed deployments (multi_model_app.py): spread requests over
+        # these model ids, uniformly or Zipf-skewed with exponent model_zipf
+        self.model_ids = list(model_ids or [])
+        self.model_weights = [1.0 / (rank + 1) ** model_zipf for rank in range(len(self.model_ids))]
+    
+    def reset_stats(self):
+        """Clear the statistics collected by previous runs"""
+        with self.lock:
+            self.completed = 0
+            self.errors = 0
+            self.cache_hits = 0
+            self.instance_counts = {}
+            self.replica_counts = {}
+            # Response time is measured from when a request was due to be sent,
+            # so client-side queueing is not hidden (coordinated omission).
+            # Service time is measured from when it actually went out.
+            self.response_times = LatencyHistogram()
+            self.service_times = LatencyHistogram()
+            # Server-reported timing parts, plus the client service time the
+            # handler did not see (network, proxy and Serve queueing)
+            self.server_times = {}
+            self.duration = 0.0
+            self.phase_stats = {}
+            self.current_phase = None
         
-    def make_request(self, complexity: float) -> Dict:
+    def make_request(self, complexity: float, intended_time: Optional[float] = None) -> Dict:
         """Make a single request to the prediction endpoint"""
+        return self.send_payload(self.build_payload(complexity), intended_time)
+    
+    def send_payload(self, payload: Dict, intended_time: Optional[float] = None,
+                     phase: Optional[str] = None) -> Dict:
+        """POST a /predict body and record the outcome"""
         try:
-            payload = {"complexity": complexity}
             start_time = time.time()
-            response = requests.post(self.predict_url, json=payload, timeout=30)
+            response = requests.post(self.predict_url, json=payload, headers=_model_headers(payload), timeout=30)
             end_time = time.time()
             
             if response.status_code == 200:
-                result = response.json()
-                result['latency'] = end_time - start_time
-                result['timestamp'] = datetime.now().strftime('%H:%M:%S')
-                
-                with self.lock:
-                    self.results.append(result)
-                    instance_id = result.get('instance_id', 'unknown')
-                    if instance_id in self.instance_counts:
-                        self.instance_counts[instance_id] += 1
-                    else:
-                        self.instance_counts[instance_id] = 1
-                
-                return result
+                return self.record_result(response.json(), start_time, end_time, intended_time, phase)
+            else:
+                print(f"Error: {response.status_code} - {response.text}")
+                return self.record_error(response.status_code, phase)
+        except Exception as e:
+            print(f"Request failed: {str(e)}")
+            return self.record_error(str(e), phase)
+    
+    async def send_payload_async(self, session, payload: Dict, intended_time: Optional[float] = None,
+                                 phase: Optional[str] = None) -> Dict:
+        """POST a /predict body on a shared aiohttp session and record the outcome"""
+        try:
+            start_time = time.time()
+            async with session.post(self.predict_url, json=payload, headers=_model_headers(payload)) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return self.record_result(result, start_time, time.time(), intended_time, phase)
+                else:
+                    print(f"Error: {response.status} - {await response.text()}")
+                    return self.record_error(response.status, phase)
+        except Exception as e:
+            print(f"Request failed: {str(e)}")
+            return self.record_error(str(e), phase)
+    
+    def build_payload(self, complexity: float) -> Dict:
+        """Build the JSON body of a /predict request"""
+        payload = {"complexity": complexity}
+        if self.feature_pool:
+            payload["features"] = random.choice(self.feature_pool)
+        if self.model_ids:
+            payload["model_id"] = random.choices(self.model_ids, weights=self.model_weights)[0]
+        return payload
+    
+    def record_result(self, result: Dict, start_time: float, end_time: float,
+                      intended_time: Optional[float] = None, phase: Optional[str] = None) -> Dict:
+        """Add a successful response to the run statistics"""
+        result['latency'] = end_time - (intended_time if intended_time is not None else start_time)
+        result['service_time'] = end_time - start_time
+        result['timestamp'] = datetime.now().strftime('%H:%M:%S')
+        
+        with self.lock:
+            self.completed += 1
+            self.response_times.record(result['latency'])
+            self.service_times.record(result['service_time'])
+            if result.get('cached'):
+                self.cache_hits += 1
+            instance_id = result.get('instance_id', 'unknown')
+            if instance_id in self.instance_counts:
+                self.instance_counts[instance_id] += 1
+            else:
+                self.instance_counts[instance_id] = 1
+            replica_id = result.get('replica_id')
+            if replica_id is not None:
+                self.replica_counts[replica_id] = self.replica_counts.get(replica_id, 0) + 1
+            timings = result.get('timings')
+            if timings:
+                self._record_server_times(timings, result['service_time'])
+            
+            # Stats for the current one-second interval
+            self.interval_completed += 1
+            self.interval_response_times.record(result['latency'])
+            self.interval_instance_counts[instance_id] = self.interval_instance_counts.get(instance_id, 0) + 1
+            
+            if phase is not None:
+                phase_stats = self.phase_stats[phase]
+                phase_stats.completed += 1
+                phase_stats.response_times.record(result['latency'])
+                phase_stats.instance_counts[instance_id] = phase_stats.instance_counts.get(instance_id, 0) + 1
+                if replica_id is not None:
+                    phase_stats.replica_counts[replica_id] = phase_stats.replica_counts.get(replica_id, 0) + 1
+        
+        return result
+    
+    def _record_server_times(self, timings: Dict, service_time: float):
+        """Add a response's server timing breakdown; call with self.lock held"""
+        for part, seconds in timings.items():
+            if part not in self.server_times:
+                self.server_times[part] = LatencyHistogram()
+            self.server_times[part].record(seconds)
+        if "total_s" in timings:
+            if OUTSIDE_SERVER_PART not in self.server_times:
+                self.server_times[OUTSIDE_SERVER_PART] = LatencyHistogram()
+            self.server_times[OUTSIDE_SERVER_PART].record(service_time - timings["total_s"])
+    
+    def record_error(self, error, phase: Optional[str] = None) -> Dict:
+        """Count a failed request"""
+        with self.lock:
+            self.errors += 1
+            self.interval_errors += 1
+            if phase is not None:
+                self.phase_stats[phase].errors += 1
+        return {"error": error}
+    
+    def capture_profile(self, duration_s: float = 10.0, interval_ms: float = 10.0,
+                        path: Optional[str] = None, include_idle: bool = False) -> Optional[str]:
+        """
+        Ask a replica for a collapsed-stack profile (GET /profile, needs
+        enable_profiling=true) and save it. The proxy routes the call like any
+        request, so it profiles whichever replica receives it. Returns the
+        file written, or None if the profile could not be taken.
+        """
+        try:
+            response = requests.get(f"{self.base_url}/profile",
+                                    params={"duration_s": duration_s, "interval_ms": interval_ms,
+                                            "include_idle": str(include_idle).lower()},
+                                    timeout=duration_s + 30)
+        except Exception as e:
+            print(f"Profile request failed: {str(e)}")
+            return None
+        if response.status_code != 200:
+            print(f"Profile error: {response.status_code} - {response.text}")
+            return None
+        replica_id = response.headers.get("X-Replica-Id", "unknown")
+        path = path or f"{self.profile_prefix}-{replica_id}.folded"
+        with open(path, "w") as f:
+            f.write(response.text)
+        if self.verbose:
+            print(f"Profile of replica {replica_id} ({response.headers.get('X-Samples', '?')} samples) "
+                  f"saved to {path}")
+        return path
+    
+    def _start_profiles(self, start_time: float):
+        """Start a timer for every entry of profile_schedule"""
+        timers = []
+        for at_s, duration_s in self.profile_schedule:
+            def take_profile(at_s=at_s, duration_s=duration_s):
+                label = f"-{self.current_phase}" if self.current_phase else ""
+                path = f"{self.profile_prefix}-{at_s:g}s{label.replace(' ', '_')}.folded"
+                if self.verbose:
+                    print(f"--- Profiling a replica for {duration_s:g}s at {time.time() - start_time:.1f}s ---")
+                self.capture_profile(duration_s, path=path)
+            timer = threading.Timer(max(0.0, start_time + at_s - time.time()), take_profile)
+            timer.daemon = True
+            timer.start()
+            timers.append(timer)
+        return timers
+    
+    def _finish_profiles(self, timers):
+        """Drop profiles scheduled past the end of the run and wait for running ones"""
+        for timer in timers:
+            timer.cancel()
+        for timer in timers:
+            timer.join()
+    
+    def make_bulk_request(self, n_rows: int, n_features: int = 20) -> Dict:
+        """Score n_rows random feature vectors in one binary /predict/bulk request"""
+        try:
+            X = np.random.rand(n_rows, n_features).astype(np.float32)
+            start_time = time.time()
+            response = requests.post(f"{self.predict_url}/bulk",
+                                     data=bulk_codec.encode_matrix(X),
+                                     headers={"Content-Type": bulk_codec.CONTENT_TYPE},
+                                     timeout=30)
+            end_time = time.time()
+
+            if response.status_code == 200:
+                predictions = bulk_codec.decode_vector(response.content)
+                return {
+                    "rows": len(predictions),
+                    "latency": end_time - start_time,
+                    "processing_time": float(response.headers.get("X-Processing-Time", 0)),
+                    "instance_id": response.headers.get("X-Instance-Id", "unknown"),
+                }
             else:
                 print(f"Error: {response.status_code} - {response.text}")
                 return {"error": response.status_code}
         except Exception as e:
             print(f"Request failed: {str(e)}")
             return {"error": str(e)}
-    
+
     def run_load_test(self, 
                       requests_per_second: int, 
                       test_duration: int,
                       complexity_range: tuple = (0.5, 2.0),
-                      ramp_up: bool = True):
+                      ramp_up: bool = True,
+                      engine: str = "thread",
+                      arrival: str = "constant",
+                      max_connections: int = 1000,
+                      verbose: bool = True):
         """
         Run a load test with specified RPS
         
@@ -61,154 +444,976 @@ class LoadTester:
             test_duration: Test duration in seconds
             complexity_range: Range of complexity values
             ramp_up: Whether to gradually ramp up load
+            engine: "thread" (blocking requests on a thread pool) or "async"
+                (asyncio + pooled keep-alive aiohttp client)
+            arrival: "constant" or "poisson" inter-arrival times
+            max_connections: Connection pool size for the async engine
+            verbose: Print per-second stats and the final summary
+        """
+        if verbose:
+            print(f"Starting load test: {requests_per_second} RPS for {test_duration} seconds "
+                  f"({engine} engine, {arrival} arrivals)")
+        
+        schedule = arrival_schedule(requests_per_second, test_duration, ramp_up, arrival)
+        # Generate random complexity values
+        requests = ((offset, self.build_payload(random.uniform(complexity_range[0], complexity_range[1])))
+                    for offset in schedule)
+        
+        return self.run_schedule(requests, engine=engine, max_connections=max_connections,
+                                 max_workers=min(50, requests_per_second * 2),  # Limit number of threads
+                                 verbose=verbose)
+    
+    def replay_trace(self,
+                     trace_path: str,
+                     speed: float = 1.0,
+                     complexity_range: tuple = (0.5, 2.0),
+                     max_duration: Optional[float] = None,
+                     engine: str = "thread",
+                     max_connections: int = 1000,
+                     verbose: bool = True):
+        """
+        Replay a recorded arrival trace (see iter_trace for the file format)
+        
+        Args:
+            trace_path: CSV or JSONL trace file, streamed from disk
+            speed: Replay speed multiplier (2.0 = twice as fast as recorded)
+            complexity_range: Range for records that do not set a complexity
+            max_duration: Stop after this many seconds of (scaled) trace time
+            engine, max_connections, verbose: As for run_load_test
+        """
+        if verbose:
+            print(f"Replaying trace {trace_path} at {speed}x speed ({engine} engine)")
+        
+        requests = iter_trace(trace_path, speed, complexity_range, self.feature_pool)
+        if max_duration is not None:
+            requests = itertools.takewhile(lambda request: request[0] < max_duration, requests)
+        
+        return self.run_schedule(requests, engine=engine, max_connections=max_connections, verbose=verbose)
+    
+    def find_max_throughput(self,
+                            min_rps: int = 1,
+                            max_rps: int = 1000,
+                            trial_duration: int = 30,
+                            slo_p99_ms: float = 500.0,
+                            max_error_rate: float = 0.01,
+                            tolerance: float = 0.05,
+                            complexity_range: tuple = (0.5, 2.0),
+                            engine: str = "thread",
+                            arrival: str = "constant",
+                            max_connections: int = 1000) -> Dict:
+        """
+        Search for the highest RPS that still meets a p99 latency SLO and an error budget
+        
+        Starting at min_rps the rate doubles until a trial fails, then a binary
+        search narrows the gap between the last passing and first failing rate
+        to `tolerance` (relative). A trial passes when its p99 response time is
+        within the SLO, its error rate within budget and it completed at least
+        90% of the target rate.
+        
+        Args:
+            min_rps, max_rps: Search bounds
+            trial_duration: Seconds per trial
+            slo_p99_ms: Latency SLO on p99 response time
+            max_error_rate: Allowed fraction of failed requests
+            tolerance: Stop when (failing - passing) / passing is below this
+            complexity_range, engine, arrival, max_connections: As for run_load_test
+        """
+        print(f"Searching for max throughput between {min_rps} and {max_rps} RPS "
+              f"(p99 <= {slo_p99_ms} ms, errors <= {max_error_rate*100:.1f}%, {trial_duration}s trials)")
+        trials = []
+        
+        def run_trial(rps: int) -> bool:
+            summary = self.run_load_test(rps, trial_duration, complexity_range, ramp_up=False,
+                                         engine=engine, arrival=arrival,
+                                         max_connections=max_connections, verbose=False)
+            attempted = summary["total_requests"] + summary["failed_requests"]
+            error_rate = summary["failed_requests"] / attempted if attempted else 1.0
+            p99 = summary["latency_percentiles_ms"].get("p99")
+            passed = (p99 is not None and p99 <= slo_p99_ms
+                      and error_rate <= max_error_rate
+                      and summary["actual_rps"] >= 0.9 * rps)
+            # Replicas are the unit that scales; fall back to nodes for older servers
+            replicas = summary["unique_replicas"] or summary["unique_instances"]
+            trials.append({
+                "target_rps": rps,
+                "actual_rps": summary["actual_rps"],
+                "p99_ms": p99,
+                "error_rate": error_rate,
+                "replicas": replicas,
+                "rps_per_replica": summary["actual_rps"] / replicas if replicas else None,
+                "max_replica_rps": summary["max_replica_rps"],
+                "passed": passed,
+            })
+            print(f"  {rps:>6} RPS -> {summary['actual_rps']:8.1f} RPS, "
+                  f"p99 {p99 if p99 is not None else float('nan'):8.1f} ms, "
+                  f"errors {error_rate*100:5.1f}%, {replicas} replicas: {'pass' if passed else 'FAIL'}")
+            return passed
+        
+        # Exponential phase: find a failing upper bound
+        passing, failing = None, None
+        rps = min_rps
+        while rps <= max_rps:
+            if run_trial(rps):
+                passing = rps
+                rps = min(rps * 2, max_rps) if rps < max_rps else max_rps + 1
+            else:
+                failing = rps
+                break
+        
+        # Binary phase: narrow the gap between passing and failing
+        if passing is not None and failing is not None:
+            while failing - passing > max(1, passing * tolerance):
+                rps = (passing + failing) // 2
+                if run_trial(rps):
+                    passing = rps
+                else:
+                    failing = rps
+        
+        knee = next((trial for trial in trials if trial["target_rps"] == passing), None)
+        print("\n===== Throughput Search Results =====")
+        print(f"{'target':>8} {'actual':>8} {'p99 ms':>8} {'errors':>7} {'replicas':>8} {'rps/replica':>11}  result")
+        for trial in sorted(trials, key=lambda trial: trial["target_rps"]):
+            print(f"{trial['target_rps']:>8} {trial['actual_rps']:>8.1f} "
+                  f"{trial['p99_ms'] if trial['p99_ms'] is not None else float('nan'):>8.1f} "
+                  f"{trial['error_rate']*100:>6.1f}% {trial['replicas']:>8} "
+                  f"{trial['rps_per_replica'] or 0:>11.1f}  {'pass' if trial['passed'] else 'FAIL'}")
+        if knee is None:
+            print(f"No rate passed the SLO (lowest tried: {min_rps} RPS)")
+        else:
+            print(f"Max sustainable throughput: {knee['actual_rps']:.1f} RPS at {knee['target_rps']} RPS target")
+            print(f"Per-replica throughput: {knee['rps_per_replica']:.1f} RPS over {knee['replicas']} replicas "
+                  f"(busiest replica: {knee['max_replica_rps'] or 0:.1f} RPS)")
+            if failing is None:
+                print(f"Note: max_rps ({max_rps}) still passed, capacity may be higher")
+        
+        return {"knee": knee, "trials": trials}
+    
+    def run_scenario(self,
+                     scenario_path: str,
+                     engine: str = "thread",
+                     max_connections: int = 1000,
+                     verbose: bool = True) -> Dict:
+        """
+        Run a multi-phase scenario file (see scenarios.py) and report results per phase
+        
+        Args:
+            scenario_path: JSON scenario file
+            engine, max_connections, verbose: As for run_load_test
         """
-        print(f"Starting load test: {requests_per_second} RPS for {test_duration} seconds")
+        scenario = load_scenario(scenario_path)
+        phases = scenario_phases(scenario)
+        if verbose:
+            total = sum(phase["duration_s"] for phase in phases)
+            print(f"Running scenario {scenario.get('name', scenario_path)}: "
+                  f"{len(phases)} phases, {total:.0f} seconds ({engine} engine)")
         
-        # For tracking actual RPS achieved
-        actual_rps_values = []
-        timestamp_values = []
-        active_instances = []
-        instance_counts_over_time = []
+        summary = self.run_schedule(scenario_requests(scenario, self.feature_pool), engine=engine,
+                                    max_connections=max_connections, verbose=verbose)
         
-        # Calculate delay between requests to achieve desired RPS
-        delay = 1.0 / requests_per_second if requests_per_second > 0 else 0
+        summary["phases"] = []
+        for phase in phases:
+            stats = self.phase_stats.get(phase["name"], PhaseStats(phase["name"]))
+            percentiles = stats.response_times.percentiles((50, 95, 99))
+            summary["phases"].append(dict(
+                phase,
+                sent=stats.sent,
+                completed=stats.completed,
+                errors=stats.errors,
+                actual_rps=stats.completed / phase["duration_s"],
+                unique_instances=len(stats.instance_counts),
+                latency_percentiles_ms={name: value * 1000 for name, value in percentiles.items()
+                                        if value is not None},
+            ))
+        if verbose:
+            self.print_phases(summary["phases"])
+        return summary
+    
+    def print_phases(self, phases):
+        """Print the per-phase results of a scenario"""
+        print("\n===== Results per Phase =====")
+        print(f"{'phase':<16} {'type':<8} {'start':>7} {'target':>8} {'actual':>8} {'errors':>7} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'instances':>9}")
+        for phase in phases:
+            latencies = phase["latency_percentiles_ms"]
+            print(f"{phase['name']:<16} {phase['type']:<8} {phase['start_s']:>6.0f}s "
+                  f"{phase['target_rps']:>8.1f} {phase['actual_rps']:>8.1f} {phase['errors']:>7} "
+                  f"{latencies.get('p50', float('nan')):>8.1f} {latencies.get('p95', float('nan')):>8.1f} "
+                  f"{latencies.get('p99', float('nan')):>8.1f} {phase['unique_instances']:>9}")
+    
+    def run_closed_loop(self,
+                        users,
+                        level_duration: int,
+                        think_time_s: float = 1.0,
+                        think_distribution: str = "exponential",
+                        ramp_up_s: float = 0.0,
+                        complexity_range: tuple = (0.5, 2.0),
+                        engine: str = "thread",
+                        max_connections: int = 1000,
+                        verbose: bool = True) -> Dict:
+        """
+        Closed-loop test: each virtual user sends a request, waits for the
+        response, thinks, and repeats
+        
+        Args:
+            users: Number of virtual users, or a list of levels run back to back
+            level_duration: Seconds each level is held
+            think_time_s: Mean think time between a response and the next request
+            think_distribution: "constant", "exponential" or "uniform" (0 to 2x the mean)
+            ramp_up_s: Spread the start of users added by a level over this many seconds
+            complexity_range, engine, max_connections, verbose: As for run_load_test
+        
+        Response time is measured from the actual send; a closed loop has no
+        schedule to fall behind. The summary gets a "levels" list with
+        throughput, latency and Little's-law concurrency (throughput x mean
+        response time) per level, overall and per replica.
+        """
+        levels = [users] if isinstance(users, int) else list(users)
+        if not levels or min(levels) < 1:
+            raise ValueError("Closed-loop levels need at least one user each")
+        think = think_time_sampler(think_time_s, think_distribution)
+        spans = user_spans(levels, level_duration, ramp_up_s)
+        level_names = [f"{level} users" for level in levels]
+        total_duration = len(levels) * level_duration
+        if verbose:
+            print(f"Starting closed-loop test: {' -> '.join(level_names)}, {level_duration}s per level, "
+                  f"{think_distribution} think time with mean {think_time_s}s ({engine} engine, "
+                  f"{total_duration}s total)")
         
-        # Setup thread pool for concurrent requests
-        max_workers = min(50, requests_per_second * 2)  # Limit number of threads
+        self.verbose = verbose
+        self.reset_stats()
+        if engine == "async":
+            _import_aiohttp()
         
         start_time = time.time()
-        end_time = start_time + test_duration
+        self._start_interval(start_time)
+        timers = self._start_profiles(start_time)
+        try:
+            if engine == "thread":
+                self._run_users_threads(spans, level_names, level_duration, think, complexity_range, start_time)
+            elif engine == "async":
+                asyncio.run(self._run_users_async(spans, level_names, level_duration, think, complexity_range,
+                                                  start_time, max_connections))
+            else:
+                raise ValueError(f"Unknown engine {engine}, expected 'thread' or 'async'")
+        finally:
+            self._finish_profiles(timers)
+        end_time = time.time()
+        self._flush_intervals(end_time, start_time)
+        self.duration = end_time - start_time
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            
-            # Track stats per second
-            last_second = start_time
-            requests_this_second = 0
+        summary = self.print_summary(self.duration) if verbose else self.summary(self.duration)
+        summary["levels"] = []
+        for level, name in zip(levels, level_names):
+            stats = self.phase_stats.get(name, PhaseStats(name))
+            throughput = stats.completed / level_duration
+            mean_s = stats.response_times.mean
+            percentiles = stats.response_times.percentiles((50, 99))
+            # Little's law: requests in the system = throughput x time spent there
+            in_flight = throughput * mean_s if mean_s is not None else None
+            replicas = len(stats.replica_counts) or len(stats.instance_counts)
+            summary["levels"].append({
+                "users": level,
+                "completed": stats.completed,
+                "errors": stats.errors,
+                "throughput_rps": throughput,
+                "mean_latency_ms": mean_s * 1000 if mean_s is not None else None,
+                "latency_percentiles_ms": {key: value * 1000 for key, value in percentiles.items()
+                                           if value is not None},
+                "in_flight": in_flight,
+                # Users the measured throughput and latency imply; lower than `users`
+                # means the clients themselves were the bottleneck
+                "implied_users": throughput * (mean_s + think_time_s) if mean_s is not None else None,
+                "replicas": replicas,
+                "rps_per_replica": throughput / replicas if replicas else None,
+                "in_flight_per_replica": in_flight / replicas if replicas and in_flight is not None else None,
+            })
+        if verbose:
+            self.print_levels(summary["levels"])
+        return summary
+    
+    def print_levels(self, levels):
+        """Print throughput against concurrency for a closed-loop test"""
+        print("\n===== Throughput vs Concurrency =====")
+        print(f"{'users':>6} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'in-flight':>9} "
+              f"{'implied':>8} {'replicas':>8} {'rps/rep':>8} {'in-flight/rep':>13}")
+        nan = float('nan')
+        for level in levels:
+            latencies = level["latency_percentiles_ms"]
+            print(f"{level['users']:>6} {level['throughput_rps']:>8.1f} {latencies.get('p50', nan):>8.1f} "
+                  f"{latencies.get('p99', nan):>8.1f} {level['errors']:>7} "
+                  f"{level['in_flight'] if level['in_flight'] is not None else nan:>9.2f} "
+                  f"{level['implied_users'] if level['implied_users'] is not None else nan:>8.1f} "
+                  f"{level['replicas']:>8} {level['rps_per_replica'] or nan:>8.1f} "
+                  f"{level['in_flight_per_replica'] or nan:>13.2f}")
+    
+    def _user_level(self, offset: float, level_names, level_duration: float) -> str:
+        return level_names[min(int(offset // level_duration), len(level_names) - 1)]
+    
+    def _run_users_threads(self, spans, level_names, level_duration, think, complexity_range, start_time):
+        """One blocking thread per virtual user"""
+        def user_loop(active_spans):
+            for span_start, span_stop in active_spans:
+                delay = start_time + span_start - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                while time.time() < start_time + span_stop:
+                    phase = self._user_level(time.time() - start_time, level_names, level_duration)
+                    with self.send_lock:
+                        self._count_sent(start_time, phase)
+                    self.send_payload(self.build_payload(random.uniform(*complexity_range)), phase=phase)
+                    time.sleep(max(0.0, min(think(), start_time + span_stop - time.time())))
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(spans)) as executor:
+            for future in [executor.submit(user_loop, user) for user in spans]:
+                future.result()
+    
+    async def _run_users_async(self, spans, level_names, level_duration, think, complexity_range,
+                               start_time, max_connections):
+        """One coroutine per virtual user on a shared keep-alive session"""
+        aiohttp = _import_aiohttp()
+        connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            async def user_loop(active_spans):
+                for span_start, span_stop in active_spans:
+                    delay = start_time + span_start - time.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    while time.time() < start_time + span_stop:
+                        phase = self._user_level(time.time() - start_time, level_names, level_duration)
+                        self._count_sent(start_time, phase)
+                        payload = self.build_payload(random.uniform(*complexity_range))
+                        await self.send_payload_async(session, payload, phase=phase)
+                        await asyncio.sleep(max(0.0, min(think(), start_time + span_stop - time.time())))
             
-            current_time = time.time()
-            while current_time < end_time:
-                # Calculate current target RPS if ramping up
-                if ramp_up:
-                    elapsed = current_time - start_time
-                    progress = min(1.0, elapsed / (test_duration * 0.5))  # Ramp up in first half
-                    current_rps = requests_per_second * progress
-                else:
-                    current_rps = requests_per_second
-                
-                current_delay = 1.0 / current_rps if current_rps > 0 else 0
-                
-                # Generate random complexity value
-                complexity = random.uniform(complexity_range[0], complexity_range[1])
+            await asyncio.gather(*(user_loop(user) for user in spans))
+    
+    def run_schedule(self,
+                     requests,
+                     engine: str = "thread",
+                     max_connections: int = 1000,
+                     max_workers: int = 50,
+                     verbose: bool = True) -> Dict:
+        """
+        Send (offset in seconds, payload) pairs at their offsets from now and
+        return the summary of the run. Offsets must be non-decreasing; requests
+        that are already late are sent immediately. Items may carry a third
+        element, a phase name, to get per-phase statistics in phase_stats.
+        """
+        self.verbose = verbose
+        self.reset_stats()
+        
+        if engine == "async":
+            # Import before the clock starts so it does not count as client lag
+            _import_aiohttp()
+        
+        start_time = time.time()
+        self._start_interval(start_time)
+        timers = self._start_profiles(start_time)
+        try:
+            if engine == "thread":
+                self._run_threads(requests, start_time, max(1, max_workers))
+            elif engine == "async":
+                asyncio.run(self._run_async(requests, start_time, max_connections))
+            else:
+                raise ValueError(f"Unknown engine {engine}, expected 'thread' or 'async'")
+        finally:
+            self._finish_profiles(timers)
+        
+        # Flush responses that arrived after the last full second
+        end_time = time.time()
+        self._flush_intervals(end_time, start_time)
+        self.duration = end_time - start_time
+        
+        if verbose:
+            return self.print_summary(self.duration)
+        return self.summary(self.duration)
+    
+    def _run_threads(self, requests, start_time: float, max_workers: int):
+        """Send requests with blocking calls from a thread pool"""
+        # Leaving the with block waits for all pending requests to complete
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for offset, payload, *phase in requests:
+                phase = phase[0] if phase else None
+                # Sleep until this request is due
+                delay = start_time + offset - time.time()
+                if delay > 0:
+                    time.sleep(delay)
                 
                 # Submit request
-                future = executor.submit(self.make_request, complexity)
-                futures.append(future)
-                requests_this_second += 1
-                
-                # Calculate stats each second
-                if current_time - last_second >= 1.0:
-                    # Record actual RPS
-                    actual_rps_values.append(requests_this_second)
-                    timestamp_values.append(int(current_time - start_time))
-                    
-                    # Count active instances
-                    with self.lock:
-                        instance_counts_over_time.append(len(self.instance_counts))
-                    
-                    print(f"Time: {int(current_time - start_time)}s, "
-                          f"Actual RPS: {requests_this_second}, "
-                          f"Active instances: {instance_counts_over_time[-1]}")
-                    
-                    last_second = current_time
-                    requests_this_second = 0
+                self._count_sent(start_time, phase)
+                executor.submit(self.send_payload, payload, start_time + offset, phase)
+    
+    async def _run_async(self, requests, start_time: float, max_connections: int):
+        """Send requests open-loop: every request goes out on time, however
+        many earlier responses are still outstanding"""
+        aiohttp = _import_aiohttp()
+        connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            pending = set()
+            
+            for offset, payload, *phase in requests:
+                phase = phase[0] if phase else None
+                delay = start_time + offset - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
                 
-                # Sleep to maintain RPS
-                time.sleep(current_delay)
-                current_time = time.time()
+                self._count_sent(start_time, phase)
+                task = asyncio.create_task(self.send_payload_async(session, payload, start_time + offset, phase))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            
+            # Wait for all pending requests to complete
+            if pending:
+                await asyncio.gather(*pending)
+    
+    def _start_interval(self, start_time: float):
+        self.interval_start = start_time
+        self.requests_this_interval = 0
+        with self.lock:
+            self.interval_completed = 0
+            self.interval_errors = 0
+            self.interval_instance_counts = {}
+            self.interval_response_times = LatencyHistogram()
+    
+    def _count_sent(self, start_time: float, phase: Optional[str] = None):
+        """Count a sent request and report per-second stats when a second has passed"""
+        self.requests_this_interval += 1
+        if phase is not None:
+            if phase != self.current_phase:
+                if self.verbose:
+                    print(f"--- Phase {phase} started at {time.time() - start_time:.1f}s ---")
+                self.current_phase = phase
+            with self.lock:
+                if phase not in self.phase_stats:
+                    self.phase_stats[phase] = PhaseStats(phase)
+                self.phase_stats[phase].sent += 1
+        current_time = time.time()
+        if self.window_epoch is not None:
+            self._close_windows(current_time, start_time)
+        elif current_time - self.interval_start >= 1.0:
+            self._close_interval(current_time, start_time)
+    
+    def _close_windows(self, current_time: float, start_time: float):
+        """Close every aligned window that ended by current_time, empty ones included"""
+        while True:
+            window_end = self.window_epoch + self._window_index() + 1
+            if current_time < window_end:
+                return
+            self._close_interval(window_end, start_time)
+    
+    def _window_index(self) -> int:
+        # Windows after the first start exactly on a boundary; allow for rounding
+        return max(0, int(self.interval_start - self.window_epoch + 1e-6))
+    
+    def _flush_intervals(self, end_time: float, start_time: float):
+        """Report what is left at the end of a run, a partial last window included"""
+        if self.window_epoch is not None:
+            self._close_windows(end_time, start_time)
+        self._close_interval(end_time, start_time)
+    
+    def _close_interval(self, current_time: float, start_time: float):
+        """Report the stats of the interval that ends at current_time and start a new one"""
+        with self.lock:
+            interval = {
+                "elapsed_s": current_time - start_time,
+                "interval_s": current_time - self.interval_start,
+                "sent": self.requests_this_interval,
+                "completed": self.interval_completed,
+                "errors": self.interval_errors,
+                "active_instances": len(self.instance_counts),
+                "instance_counts": self.interval_instance_counts,
+                "response_time": self.interval_response_times.to_dict(),
+                "phase": self.current_phase,
+            }
+        if self.window_epoch is not None:
+            interval["window"] = self._window_index()
+            interval["window_end_s"] = current_time - self.window_epoch
         
-        # Wait for all pending requests to complete
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                future.result()
-            except Exception as e:
-                print(f"Request failed: {str(e)}")
+        if self.verbose:
+            print(f"Time: {int(interval['elapsed_s'])}s, "
+                  f"Actual RPS: {interval['sent']}, "
+                  f"Active instances: {interval['active_instances']}")
+        for listener in self.interval_listeners:
+            listener(interval)
         
+        self._start_interval(current_time)
+    
+    def export_stats(self) -> Dict:
+        """Run statistics in a form merge_stats can combine across testers"""
+        with self.lock:
+            return {
+                "duration": self.duration,
+                "completed": self.completed,
+                "errors": self.errors,
+                "cache_hits": self.cache_hits,
+                "instance_counts": dict(self.instance_counts),
+                "replica_counts": dict(self.replica_counts),
+                "response_time": self.response_times.to_dict(),
+                "service_time": self.service_times.to_dict(),
+                "server_times": {part: histogram.to_dict() for part, histogram in self.server_times.items()},
+            }
+    
+    def merge_stats(self, stats: Dict):
+        """Add statistics exported by another tester (e.g. a worker process) into this one"""
+        with self.lock:
+            self.duration = max(self.duration, stats["duration"])
+            self.completed += stats["completed"]
+            self.errors += stats["errors"]
+            self.cache_hits += stats["cache_hits"]
+            for instance_id, count in stats["instance_counts"].items():
+                self.instance_counts[instance_id] = self.instance_counts.get(instance_id, 0) + count
+            for replica_id, count in stats.get("replica_counts", {}).items():
+                self.replica_counts[replica_id] = self.replica_counts.get(replica_id, 0) + count
+            self.response_times.merge(LatencyHistogram.from_dict(stats["response_time"]))
+            self.service_times.merge(LatencyHistogram.from_dict(stats["service_time"]))
+            for part, histogram in stats.get("server_times", {}).items():
+                if part not in self.server_times:
+                    self.server_times[part] = LatencyHistogram()
+                self.server_times[part].merge(LatencyHistogram.from_dict(histogram))
+    
+    def summary(self, total_time: float) -> Dict:
+        """Return the final statistics of a run"""
+        total_requests = self.completed
+        response_percentiles = self.response_times.percentiles()
+        service_percentiles = self.service_times.percentiles()
+        return {
+            "total_requests": total_requests,
+            "actual_rps": total_requests / total_time if total_time > 0 else 0,
+            "unique_instances": len(self.instance_counts),
+            "unique_replicas": len(self.replica_counts),
+            "max_replica_rps": max(self.replica_counts.values()) / total_time
+                               if self.replica_counts and total_time > 0 else None,
+            "failed_requests": self.errors,
+            "avg_latency_ms": self.response_times.mean * 1000 if total_requests else None,
+            "latency_percentiles_ms": {name: value * 1000 for name, value in response_percentiles.items()
+                                       if value is not None},
+            "service_percentiles_ms": {name: value * 1000 for name, value in service_percentiles.items()
+                                       if value is not None},
+            "server_mean_ms": {part: histogram.mean * 1000 for part, histogram in self.server_times.items()
+                               if histogram.total_count},
+        }
+    
+    def print_summary(self, total_time: float) -> Dict:
+        """Print and return the final statistics of a run"""
         # Print final stats
-        total_time = time.time() - start_time
-        total_requests = len(self.results)
-        actual_rps = total_requests / total_time
+        summary = self.summary(total_time)
+        total_requests = summary["total_requests"]
         
         print("\n===== Load Test Results =====")
         print(f"Test duration: {total_time:.2f} seconds")
         print(f"Total requests: {total_requests}")
-        print(f"Average RPS: {actual_rps:.2f}")
+        print(f"Failed requests: {self.errors}")
+        print(f"Average RPS: {summary['actual_rps']:.2f}")
         print(f"Unique instances seen: {len(self.instance_counts)}")
         print("Instance distribution:")
         for instance, count in sorted(self.instance_counts.items(), key=lambda x: x[1], reverse=True):
             print(f"  {instance}: {count} requests ({count/total_requests*100:.1f}%)")
+        if self.replica_counts:
+            print(f"Unique replicas seen: {len(self.replica_counts)}")
+        if (self.feature_pool or self.cache_hits) and total_requests:
+            print(f"Server cache hits: {self.cache_hits} ({self.cache_hits/total_requests*100:.1f}%)")
         
-        # Calculate latency statistics
-        latencies = [r['latency'] for r in self.results if 'latency' in r]
-        if latencies:
-            avg_latency = sum(latencies) / len(latencies)
-            p50 = sorted(latencies)[int(len(latencies) * 0.5)]
-            p95 = sorted(latencies)[int(len(latencies) * 0.95)]
-            p99 = sorted(latencies)[int(len(latencies) * 0.99)]
-            
-            print("\nLatency Statistics:")
-            print(f"  Average: {avg_latency*1000:.2f} ms")
-            print(f"  p50: {p50*1000:.2f} ms")
-            print(f"  p95: {p95*1000:.2f} ms")
-            print(f"  p99: {p99*1000:.2f} ms")
+        # Latency statistics from the histograms
+        if total_requests:
+            response_percentiles = self.response_times.percentiles()
+            service_percentiles = self.service_times.percentiles()
+            print("\nLatency Statistics (response = from intended send time, service = from actual send):")
+            print(f"  {'':>8} {'response':>12} {'service':>12}")
+            print(f"  {'Average':>8} {self.response_times.mean*1000:>9.2f} ms {self.service_times.mean*1000:>9.2f} ms")
+            for name in response_percentiles:
+                print(f"  {name:>8} {response_percentiles[name]*1000:>9.2f} ms {service_percentiles[name]*1000:>9.2f} ms")
+            print(f"  {'max':>8} {self.response_times.max*1000:>9.2f} ms {self.service_times.max*1000:>9.2f} ms")
+        if self.server_times:
+            self.print_server_breakdown()
         
-        # Generate plots
-        # self.plot_results(actual_rps_values, timestamp_values, instance_counts_over_time)
+        return summary
+    
+    def print_server_breakdown(self):
+        """Print the server timing parts next to the client service time"""
+        print("\nServer-side breakdown (ms; outside server = service time - server total):")
+        print(f"  {'part':<22} {'mean':>9} {'p50':>9} {'p99':>9} {'share':>7}")
+        rows = [(part, self.server_times[part]) for part in SERVER_TIMING_PARTS if part in self.server_times]
+        if OUTSIDE_SERVER_PART in self.server_times:
+            rows.append((OUTSIDE_SERVER_PART, self.server_times[OUTSIDE_SERVER_PART]))
+        rows.append(("client service time", self.service_times))
+        service_mean = self.service_times.mean
+        for part, histogram in rows:
+            if not histogram.total_count:
+                continue
+            percentiles = histogram.percentiles((50, 99))
+            share = f"{histogram.mean / service_mean * 100:6.1f}%" if service_mean else ""
+            print(f"  {part:<22} {histogram.mean*1000:>9.3f} {percentiles['p50']*1000:>9.3f} "
+                  f"{percentiles['p99']*1000:>9.3f} {share:>7}")
+    
+    def export_histograms(self, path: str):
+        """Save the latency histograms as JSON that LatencyHistogram.from_dict can load and merge"""
+        with open(path, "w") as f:
+            json.dump({
+                "response_time": self.response_times.to_dict(),
+                "service_time": self.service_times.to_dict(),
+            }, f)
+        print(f"Latency histograms saved to {path}")
+
+
+def _run_worker(queue, worker_index: int, base_url: str, tester_options: Dict, options: Dict,
+                window_epoch: float):
+    """Worker process / Ray task: run a share of the load and stream stats to the coordinator"""
+    tester = LoadTester(base_url, **tester_options)
+    tester.interval_listeners.append(lambda interval: queue.put(("interval", worker_index, interval)))
+    # Report windows aligned with the other workers' (clocks are assumed to be
+    # NTP-synced across nodes) and start sending together with them
+    tester.window_epoch = window_epoch
+    delay = window_epoch - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    try:
+        tester.run_load_test(verbose=False, **options)
+        queue.put(("done", worker_index, tester.export_stats()))
+    except Exception as e:
+        queue.put(("failed", worker_index, str(e)))
+
+
+class LoadCoordinator:
+    """Splits a load test across worker processes (local or Ray tasks) and merges their results"""
+    
+    def __init__(self, base_url: str, workers: int, backend: str = "local",
+                 ray_address: Optional[str] = None, feature_pool_size: int = 0,
+                 model_ids: Optional[list] = None, model_zipf: float = 0.0):
+        if backend not in ("local", "ray"):
+            raise ValueError(f"Unknown coordinator backend {backend}, expected 'local' or 'ray'")
+        self.base_url = base_url
+        self.workers = workers
+        self.backend = backend
+        self.ray_address = ray_address
+        # Passed to the LoadTester of every worker
+        self.tester_options = dict(feature_pool_size=feature_pool_size, model_ids=model_ids, model_zipf=model_zipf)
+        # Called with each merged per-second window, like LoadTester.interval_listeners
+        self.interval_listeners = []
+        # Server profiles taken by the coordinator, like LoadTester.profile_schedule
+        self.profile_schedule = []
+        self.profile_prefix = "profile"
+    
+    def run(self, requests_per_second: int, test_duration: int, **options) -> Dict:
+        """Run the test with requests_per_second split across the workers. Other
+        options are passed to LoadTester.run_load_test."""
+        # Spread the rate as evenly as possible
+        shares = [requests_per_second // self.workers + (1 if i < requests_per_second % self.workers else 0)
+                  for i in range(self.workers)]
+        print(f"Starting load test: {requests_per_second} RPS for {test_duration} seconds "
+              f"from {self.workers} {self.backend} workers ({shares} RPS each)")
+        worker_options = [dict(options, requests_per_second=share, test_duration=test_duration)
+                          for share in shares]
         
-        return {
-            "total_requests": total_requests,
-            "actual_rps": actual_rps,
-            "unique_instances": len(self.instance_counts),
-            "avg_latency_ms": avg_latency * 1000 if latencies else None
+        if self.backend == "ray":
+            self._init_ray()
+        # Workers window their stats by whole seconds since this shared start
+        window_epoch = time.time() + WORKER_START_DELAY_S
+        if self.backend == "local":
+            queue, workers_alive = self._start_local(worker_options, window_epoch)
+        else:
+            queue, workers_alive = self._start_ray(worker_options, window_epoch)
+        
+        self.aggregate = aggregate = LoadTester(self.base_url, **self.tester_options)
+        aggregate.profile_schedule = self.profile_schedule
+        aggregate.profile_prefix = self.profile_prefix
+        timers = aggregate._start_profiles(window_epoch)
+        # Window index -> {worker index: that worker's part of the window}
+        pending_windows = {}
+        self.last_window = -1
+        late_windows = 0
+        finished = set()
+        while len(finished) < self.workers:
+            try:
+                kind, worker_index, payload = queue.get(timeout=1.0)
+            except Exception:
+                # Empty queue: make sure the workers we wait for still exist
+                if not workers_alive():
+                    print("Some workers exited without reporting results")
+                    break
+                self._close_windows(pending_windows, finished, window_epoch)
+                continue
+            
+            if kind == "interval":
+                if payload["window"] <= self.last_window:
+                    # Its window was already reported without this part
+                    late_windows += 1
+                else:
+                    pending_windows.setdefault(payload["window"], {})[worker_index] = payload
+            elif kind == "done":
+                aggregate.merge_stats(payload)
+                finished.add(worker_index)
+            else:
+                print(f"Worker {worker_index} failed: {payload}")
+                finished.add(worker_index)
+            self._close_windows(pending_windows, finished, window_epoch)
+        # Whatever is left is all the workers will send
+        for window in sorted(pending_windows):
+            self._close_interval(window, list(pending_windows.pop(window).values()))
+        aggregate._finish_profiles(timers)
+        if late_windows:
+            print(f"{late_windows} worker window(s) arrived more than {WINDOW_MERGE_TIMEOUT_S:g}s late and "
+                  f"are missing from the per-second timeline (they are in the totals below)")
+        
+        return aggregate.print_summary(aggregate.duration)
+    
+    def _close_windows(self, pending_windows: Dict, finished, window_epoch: float):
+        """Report pending windows in order, each once every running worker sent
+        its part or WINDOW_MERGE_TIMEOUT_S after it ended"""
+        now = time.time()
+        for window in sorted(pending_windows):
+            parts = pending_windows[window]
+            complete = all(worker_index in parts or worker_index in finished
+                           for worker_index in range(self.workers))
+            if not complete and now < window_epoch + window + 1 + WINDOW_MERGE_TIMEOUT_S:
+                return
+            self._close_interval(window, list(pending_windows.pop(window).values()))
+    
+    def _close_interval(self, window: int, intervals):
+        """Merge the parts the workers reported for one window, print and publish them"""
+        instance_counts = {}
+        response_time = LatencyHistogram()
+        for interval in intervals:
+            for instance_id, count in interval["instance_counts"].items():
+                instance_counts[instance_id] = instance_counts.get(instance_id, 0) + count
+            response_time.merge(LatencyHistogram.from_dict(interval["response_time"]))
+        self.last_window = max(self.last_window, window)
+        merged = {
+            # Seconds from the shared start to the end of the window
+            "elapsed_s": max(interval["window_end_s"] for interval in intervals),
+            "interval_s": max(interval["interval_s"] for interval in intervals),
+            "sent": sum(interval["sent"] for interval in intervals),
+            "completed": sum(interval["completed"] for interval in intervals),
+            "errors": sum(interval["errors"] for interval in intervals),
+            "active_instances": max(interval["active_instances"] for interval in intervals),
+            "instance_counts": instance_counts,
+            "response_time": response_time.to_dict(),
+            "phase": intervals[0].get("phase"),
+            "window": window,
+            "workers": len(intervals),
         }
+        print(f"Time: {int(merged['elapsed_s'])}s, "
+              f"Actual RPS: {merged['sent']}, "
+              f"Errors: {merged['errors']}, "
+              f"Active instances: {len(instance_counts)}")
+        for listener in self.interval_listeners:
+            listener(merged)
+    
+    def _start_local(self, worker_options, window_epoch: float):
+        import multiprocessing
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_run_worker,
+                                             args=(queue, i, self.base_url, self.tester_options, options,
+                                                   window_epoch),
+                                             daemon=True)
+                     for i, options in enumerate(worker_options)]
+        for process in processes:
+            process.start()
+        return queue, lambda: any(process.is_alive() for process in processes)
+    
+    def _init_ray(self):
+        import os
+        import ray
+        # Ship this directory so the tasks can import load_test and its helpers.
+        # Workers run inside the cluster, so the URL must be reachable from there.
+        ray.init(address=self.ray_address or "auto",
+                 runtime_env={"working_dir": os.path.dirname(os.path.abspath(__file__))})
     
-    def plot_results(self, actual_rps_values, timestamp_values, instance_counts):
-        """Generate plots showing test results"""
-        plt.figure(figsize=(12, 10))
-        
-        # Plot 1: RPS over time
-        plt.subplot(2, 1, 1)
-        plt.plot(timestamp_values, actual_rps_values, 'b-')
-        plt.title('Requests Per Second Over Time')
-        plt.xlabel('Time (seconds)')
-        plt.ylabel('RPS')
-        plt.grid(True)
-        
-        # Plot 2: Instances over time
-        plt.subplot(2, 1, 2)
-        plt.plot(timestamp_values, instance_counts, 'r-')
-        plt.title('Active Instances Over Time')
-        plt.xlabel('Time (seconds)')
-        plt.ylabel('Number of Instances')
-        plt.grid(True)
-        
-        plt.tight_layout()
-        plt.savefig('load_test_results.png')
-        print("Results plotted to load_test_results.png")
-        
-        # Plot latency distribution
-        latencies = [r['latency'] * 1000 for r in self.results if 'latency' in r]  # Convert to ms
-        if latencies:
-            plt.figure(figsize=(10, 6))
-            plt.hist(latencies, bins=50, alpha=0.75)
-            plt.title('Latency Distribution')
-            plt.xlabel('Latency (ms)')
-            plt.ylabel('Count')
-            plt.grid(True)
-            plt.savefig('latency_distribution.png')
-            print("Latency distribution plotted to latency_distribution.png")
+    def _start_ray(self, worker_options, window_epoch: float):
+        import ray
+        from ray.util.queue import Queue
+        queue = Queue()
+        remote_worker = ray.remote(num_cpus=1)(_run_worker)
+        refs = [remote_worker.remote(queue, i, self.base_url, self.tester_options, options, window_epoch)
+                for i, options in enumerate(worker_options)]
+        
+        def workers_alive():
+            _, running = ray.wait(refs, num_returns=len(refs), timeout=0)
+            return bool(running)
+        return queue, workers_alive
+
+
+def plot_main(argv):
+    parser = argparse.ArgumentParser(prog='load_test.py plot',
+                                     description='Plot a results file written with --results-out')
+    parser.add_argument('results', type=str,
+                        help='JSONL results file')
+    parser.add_argument('--out-prefix', type=str, default=None,
+                        help='Prefix of the PNG files (default: the results path without extension)')
+    args = parser.parse_args(argv)
+    for path in plot_results(args.results, args.out_prefix):
+        print(f"Plot saved to {path}")
+
+
+def compare_main(argv) -> int:
+    parser = argparse.ArgumentParser(prog='load_test.py compare',
+                                     description='Compare results files written with --results-out against a baseline')
+    parser.add_argument('baseline', type=str,
+                        help='Results file of the baseline run')
+    parser.add_argument('candidates', type=str, nargs='+',
+                        help='Results files to compare against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help='Relative change in throughput or latency that counts as a regression')
+    parser.add_argument('--error-threshold', type=float, default=0.005,
+                        help='Absolute increase in error rate that counts as a regression')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='Confidence level of the intervals')
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                        help='Number of bootstrap draws')
+    parser.add_argument('--skip', type=float, default=0.0,
+                        help='Ignore windows in the first SKIP seconds of every run (e.g. ramp-up)')
+    args = parser.parse_args(argv)
+    
+    baseline = RunSamples(args.baseline, skip_s=args.skip)
+    regressions = 0
+    for path in args.candidates:
+        candidate = RunSamples(path, skip_s=args.skip)
+        rows = compare_runs(baseline, candidate, draws=args.bootstrap, confidence=args.confidence,
+                            threshold=args.threshold, error_threshold=args.error_threshold)
+        print_comparison(baseline, candidate, rows, args.confidence)
+        regressions += sum(row["regression"] for row in rows)
+    if regressions:
+        print(f"\n{regressions} significant regression(s) beyond the threshold")
+        return 1
+    print("\nNo significant regressions beyond the threshold")
+    return 0
+
+
+def profile_main(argv):
+    parser = argparse.ArgumentParser(prog='load_test.py profile',
+                                     description='Take a collapsed-stack profile of one replica now '
+                                                 '(the deployment needs enable_profiling=true)')
+    parser.add_argument('--url', type=str, default="http://localhost:8000",
+                        help='URL of the Ray Serve deployment')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Seconds to sample for')
+    parser.add_argument('--interval-ms', type=float, default=10.0,
+                        help='Sampling interval in milliseconds')
+    parser.add_argument('--include-idle', action='store_true',
+                        help='Keep stacks of threads that are waiting')
+    parser.add_argument('--out', type=str, default=None,
+                        help='Output file (default: profile-<replica>.folded)')
+    args = parser.parse_args(argv)
+    tester = LoadTester(args.url)
+    return 0 if tester.capture_profile(args.duration, args.interval_ms, args.out, args.include_idle) else 1
+
+
+def _setting_value(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def simulate_main(argv):
+    parser = argparse.ArgumentParser(prog='load_test.py simulate',
+                                     description='Simulate the autoscaling of a deployment offline, '
+                                                 'for one config or a grid of configs')
+    parser.add_argument('--deployment', type=str, default='serve_app.py',
+                        help='Source file whose @serve.deployment autoscaling_config is simulated')
+    parser.add_argument('--deployment-class', type=str, default=None,
+                        help='Deployment class, when the file has several')
+    parser.add_argument('--set', type=str, action='append', default=[], metavar='KEY=VALUE',
+                        help='Override an autoscaling setting (repeatable)')
+    parser.add_argument('--sweep', type=str, action='append', default=[], metavar='KEY=V1,V2,...',
+                        help='Simulate every value of a setting; several --sweep flags form a grid')
+    parser.add_argument('--service-time', type=str, required=True,
+                        help='Results file of a (low-load) run, or constant:MS, exponential:MEAN_MS, '
+                             'lognormal:MEDIAN_MS,SIGMA')
+    parser.add_argument('--service-part', type=str, default='total_s',
+                        help='Server timing part to take from a results file')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file to generate arrivals from')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='CSV/JSONL trace to take arrivals from')
+    parser.add_argument('--trace-speed', type=float, default=1.0,
+                        help='Trace replay speed factor')
+    parser.add_argument('--rps', type=float, default=10.0,
+                        help='Requests per second, without --scenario or --trace')
+    parser.add_argument('--duration', type=float, default=600.0,
+                        help='Seconds to simulate, without --scenario or --trace')
+    parser.add_argument('--ramp-up', action='store_true',
+                        help='Ramp up the rate over the first half, without --scenario or --trace')
+    parser.add_argument('--arrival', type=str, default='poisson', choices=['constant', 'poisson'],
+                        help='Arrival process, without --trace')
+    parser.add_argument('--max-ongoing-requests', type=int, default=None,
+                        help='Requests a replica accepts at once (default: from the deployment, else Serve\'s default)')
+    parser.add_argument('--replica-concurrency', type=int, default=None,
+                        help='Requests a replica processes in parallel (default: max ongoing requests, as for '
+                             'async replicas; 1 for a replica that serializes its work)')
+    parser.add_argument('--startup-s', type=float, default=DEFAULT_STARTUP_S,
+                        help='Seconds from starting a replica until it serves (see xgboost_startup_seconds)')
+    parser.add_argument('--slo-p99-ms', type=float, default=None,
+                        help='Mark sweep configs whose p99 latency is above this')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes to run sweep configs in')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of arrivals, service times and routing')
+    parser.add_argument('--out', type=str, default=None,
+                        help='Write every result, with its timeline, to this JSONL file')
+    args = parser.parse_args(argv)
+
+    options = read_deployment_config(args.deployment, args.deployment_class)
+    overrides = dict(setting.split("=", 1) for setting in args.set)
+    settings = autoscaling_settings(options.get("autoscaling_config") or {},
+                                    {key: _setting_value(value) for key, value in overrides.items()})
+    max_ongoing = args.max_ongoing_requests or options.get("max_ongoing_requests") or \
+        options.get("max_concurrent_queries") or DEFAULT_MAX_ONGOING_REQUESTS
+    if args.service_time.endswith(".jsonl"):
+        service_time = ServiceTime.from_results(args.service_time, args.service_part)
+    else:
+        service_time = ServiceTime.from_spec(args.service_time, seed=args.seed)
+
+    random.seed(args.seed)
+    if args.trace:
+        arrivals = [offset for offset, _ in iter_trace(args.trace, args.trace_speed)]
+        duration = arrivals[-1] if arrivals else 0.0
+    elif args.scenario:
+        scenario = load_scenario(args.scenario)
+        arrivals = [offset for offset, _, _ in scenario_requests(scenario)]
+        duration = sum(phase["duration"] for phase in scenario["phases"])
+    else:
+        arrivals = list(arrival_schedule(args.rps, args.duration, args.ramp_up, args.arrival))
+        duration = args.duration
+    arrivals.sort()
+    print(f"Simulating {len(arrivals)} requests over {duration:.0f}s "
+          f"(service time mean {service_time.mean * 1000:.1f} ms)")
+
+    simulator_options = dict(max_ongoing_requests=max_ongoing, replica_concurrency=args.replica_concurrency,
+                             startup_s=args.startup_s, seed=args.seed)
+    if args.sweep:
+        grid = {}
+        for spec in args.sweep:
+            key, _, values = spec.partition("=")
+            grid[key] = [_setting_value(value) for value in values.split(",")]
+        results = sweep(settings, grid, service_time, arrivals, duration, workers=args.workers, **simulator_options)
+        keys = [RENAMED_SETTINGS.get(key, key) for key in grid]
+        print_sweep(results, keys, args.slo_p99_ms)
+    else:
+        results = [AutoscalingSimulator(settings, service_time, **simulator_options).run(arrivals, duration)]
+        print_simulation(results[0])
+
+    if args.out:
+        with open(args.out, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"Results saved to {args.out}")
+
 
 if __name__ == "__main__":
+    import sys
+    if sys.argv[1:2] == ["simulate"]:
+        simulate_main(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["profile"]:
+        sys.exit(profile_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["plot"]:
+        plot_main(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["compare"]:
+        sys.exit(compare_main(sys.argv[2:]))
+    
     parser = argparse.ArgumentParser(description='Load test Ray Serve deployment')
     parser.add_argument('--url', type=str, default="http://localhost:8000",
                         help='URL of the Ray Serve deployment')
@@ -222,13 +1427,145 @@ if __name__ == "__main__":
                         help='Maximum request complexity')
     parser.add_argument('--ramp-up', action='store_true',
                         help='Gradually ramp up load')
+    parser.add_argument('--feature-pool', type=int, default=0,
+                        help='Send features drawn from a pool of this many vectors (0 = let the server pick random ones)')
+    parser.add_argument('--models', type=str, default=None,
+                        help='Multiplexed deployment: comma-separated model ids, or a count N for '
+                             'model-000 ... model-<N-1> as exported by multi_model_app.py')
+    parser.add_argument('--model-zipf', type=float, default=0.0,
+                        help='Zipf exponent of model popularity (0 = uniform)')
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread',
+                        help='Request engine: blocking thread pool or asyncio open-loop client (needs aiohttp)')
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant',
+                        help='Inter-arrival time distribution')
+    parser.add_argument('--max-connections', type=int, default=1000,
+                        help='Connection pool size for the async engine')
+    parser.add_argument('--histogram-out', type=str, default=None,
+                        help='Save mergeable latency histograms to this JSON file')
+    parser.add_argument('--results-out', type=str, default=None,
+                        help='Stream per-second windows and the summary to this JSONL file '
+                             '(plot it with: load_test.py plot FILE)')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Run a multi-phase JSON scenario file (see scenarios.py; ignores --rps/--duration)')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='Replay arrivals from a CSV/JSONL trace instead of generating them (ignores --rps/--ramp-up)')
+    parser.add_argument('--trace-speed', type=float, default=1.0,
+                        help='Trace replay speed multiplier')
+    parser.add_argument('--trace-max-duration', type=float, default=None,
+                        help='Stop trace replay after this many seconds')
+    parser.add_argument('--users', type=str, default=None,
+                        help='Closed-loop mode: number of virtual users, or comma-separated levels '
+                             'each held for --duration seconds (e.g. 10,20,40)')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='Mean think time in seconds between a response and the next request (closed loop)')
+    parser.add_argument('--think-distribution', choices=['constant', 'exponential', 'uniform'],
+                        default='exponential',
+                        help='Think time distribution (closed loop)')
+    parser.add_argument('--user-ramp-up', type=float, default=0.0,
+                        help='Seconds over which the users added by a level start (closed loop)')
+    parser.add_argument('--profile-at', type=str, default=None,
+                        help='Comma-separated seconds into the run at which to profile a replica '
+                             '(needs enable_profiling=true on the deployment)')
+    parser.add_argument('--profile-duration', type=float, default=10.0,
+                        help='Seconds each --profile-at profile samples for')
+    parser.add_argument('--profile-out', type=str, default='profile',
+                        help='Prefix of the collapsed-stack files written by --profile-at')
+    parser.add_argument('--search', action='store_true',
+                        help='Search for the max RPS that meets --slo-p99-ms and --max-error-rate')
+    parser.add_argument('--search-min-rps', type=int, default=1,
+                        help='Lowest RPS tried by --search')
+    parser.add_argument('--search-max-rps', type=int, default=1000,
+                        help='Highest RPS tried by --search')
+    parser.add_argument('--trial-duration', type=int, default=30,
+                        help='Seconds per --search trial')
+    parser.add_argument('--slo-p99-ms', type=float, default=500.0,
+                        help='p99 latency SLO for --search')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Allowed fraction of failed requests for --search')
+    parser.add_argument('--search-tolerance', type=float, default=0.05,
+                        help='Relative precision at which --search stops')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Split the load across this many worker processes')
+    parser.add_argument('--coordinator', choices=['local', 'ray'], default='local',
+                        help='Run workers as local processes or as Ray tasks on the cluster')
+    parser.add_argument('--ray-address', type=str, default=None,
+                        help='Ray cluster address for --coordinator ray (default: auto)')
     
     args = parser.parse_args()
     
-    tester = LoadTester(args.url)
-    tester.run_load_test(
-        requests_per_second=args.rps,
-        test_duration=args.duration,
+    options = dict(
         complexity_range=(args.min_complexity, args.max_complexity),
-        ramp_up=args.ramp_up
-    )
\ No newline at end of file
+        ramp_up=args.ramp_up,
+        engine=args.engine,
+        arrival=args.arrival,
+        max_connections=args.max_connections
+    )
+    
+    sink = ResultsSink(args.results_out, metadata=vars(args)) if args.results_out else None
+    model_ids = None
+    if args.models:
+        model_ids = ([f"model-{index:03d}" for index in range(int(args.models))] if args.models.isdigit()
+                     else args.models.split(","))
+    tester = LoadTester(args.url, feature_pool_size=args.feature_pool, model_ids=model_ids, model_zipf=args.model_zipf)
+    if sink:
+        tester.interval_listeners.append(sink)
+    if args.profile_at:
+        tester.profile_schedule = [(float(at), args.profile_duration) for at in args.profile_at.split(",")]
+        tester.profile_prefix = args.profile_out
+    try:
+        if args.users:
+            tester.run_closed_loop(
+                [int(level) for level in args.users.split(",")],
+                args.duration,
+                think_time_s=args.think_time,
+                think_distribution=args.think_distribution,
+                ramp_up_s=args.user_ramp_up,
+                complexity_range=options["complexity_range"],
+                engine=args.engine,
+                max_connections=args.max_connections
+            )
+        elif args.search:
+            tester.find_max_throughput(
+                min_rps=args.search_min_rps,
+                max_rps=args.search_max_rps,
+                trial_duration=args.trial_duration,
+                slo_p99_ms=args.slo_p99_ms,
+                max_error_rate=args.max_error_rate,
+                tolerance=args.search_tolerance,
+                **{key: value for key, value in options.items() if key != "ramp_up"}
+            )
+        elif args.scenario:
+            tester.run_scenario(args.scenario, engine=args.engine, max_connections=args.max_connections)
+        elif args.trace:
+            tester.replay_trace(
+                args.trace,
+                speed=args.trace_speed,
+                complexity_range=options["complexity_range"],
+                max_duration=args.trace_max_duration,
+                engine=args.engine,
+                max_connections=args.max_connections
+            )
+        elif args.workers > 1:
+            coordinator = LoadCoordinator(args.url, args.workers, backend=args.coordinator,
+                                          ray_address=args.ray_address, feature_pool_size=args.feature_pool,
+                                          model_ids=model_ids, model_zipf=args.model_zipf)
+            if sink:
+                coordinator.interval_listeners.append(sink)
+            coordinator.profile_schedule = tester.profile_schedule
+            coordinator.profile_prefix = tester.profile_prefix
+            coordinator.run(args.rps, args.duration, **options)
+            tester = coordinator.aggregate
+        else:
+            tester.run_load_test(
+                requests_per_second=args.rps,
+                test_duration=args.duration,
+                **options
+            )
+        if sink:
+            sink.write_summary(tester.summary(tester.duration), tester.export_stats())
+            print(f"Results saved to {args.results_out}")
+    finally:
+        if sink:
+            sink.close()
+    if args.histogram_out:
+        tester.export_histograms(args.histogram_out)
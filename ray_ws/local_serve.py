@@ -0,0 +1,248 @@
+# local_serve.py
+"""Run a Serve deployment's FastAPI app in-process, without Ray.
+
+install_ray_stubs() puts small stand-ins for `ray` and `ray.serve` into
+sys.modules before the app module is imported:
+- @serve.deployment and @serve.ingress leave the class as it is.
+- @serve.batch is a single-process batcher with the same call and set_* API.
+- metrics are no-ops.
+- ray.get_runtime_context() and serve.get_replica_context() report "local".
+
+local_app() then creates one instance of the deployment class and binds the
+class's routes to it, the way Serve's ingress does on a replica. The result
+is a plain ASGI app, so the request path can be profiled and benchmarked on a
+laptop, or in CI, with no cluster noise:
+
+    python local_serve.py --port 8000 backend=native enable_batching=true
+    python load_test.py --url http://localhost:8000 --rps 50
+"""
+import sys
+import types
+import asyncio
+import argparse
+import importlib
+from typing import Dict, Optional
+
+LOCAL_NODE_ID = "local"
+LOCAL_REPLICA_ID = "local-0"
+
+
+class _Metric:
+    """No-op stand-in for ray.serve.metrics Counter, Gauge and Histogram"""
+
+    def __init__(self, name: str, description: str = "", boundaries=None, tag_keys=None):
+        self.name = name
+
+    def inc(self, value: float = 1.0, tags: Optional[Dict] = None):
+        pass
+
+    def set(self, value: float, tags: Optional[Dict] = None):
+        pass
+
+    def observe(self, value: float, tags: Optional[Dict] = None):
+        pass
+
+    def set_default_tags(self, tags: Dict):
+        pass
+
+
+class _Batcher:
+    """Collects concurrent calls into one call of the wrapped method, like
+    @serve.batch: a batch closes at max_batch_size items or batch_wait_timeout_s
+    after its first item, and batches run one at a time"""
+
+    def __init__(self, func, instance, max_batch_size: int, batch_wait_timeout_s: float):
+        self.func = func
+        self.instance = instance
+        self.max_batch_size = max_batch_size
+        self.batch_wait_timeout_s = batch_wait_timeout_s
+        self.queue = None
+        self.task = None
+
+    def set_max_batch_size(self, max_batch_size: int):
+        self.max_batch_size = max_batch_size
+
+    def set_batch_wait_timeout_s(self, batch_wait_timeout_s: float):
+        self.batch_wait_timeout_s = batch_wait_timeout_s
+
+    async def __call__(self, item):
+        loop = asyncio.get_running_loop()
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = loop.create_task(self._run())
+        future = loop.create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait_timeout_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await self.func(self.instance, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class _BatchMethod:
+    """Descriptor giving every instance its own _Batcher"""
+
+    def __init__(self, func, max_batch_size: int, batch_wait_timeout_s: float):
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.batch_wait_timeout_s = batch_wait_timeout_s
+        self.name = func.__name__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        batcher = instance.__dict__.get(self.name)
+        if batcher is None:
+            batcher = _Batcher(self.func, instance, self.max_batch_size, self.batch_wait_timeout_s)
+            instance.__dict__[self.name] = batcher
+        return batcher
+
+
+class _LocalApplication:
+    """What Deployment.bind() returns: the class and its init arguments"""
+
+    def __init__(self, cls, args, kwargs):
+        self.cls = cls
+        self.args = args
+        self.kwargs = kwargs
+
+
+def _deployment(_cls=None, **options):
+    def decorate(cls):
+        cls._serve_options = options
+        cls.bind = classmethod(lambda cls, *args, **kwargs: _LocalApplication(cls, args, kwargs))
+        cls.options = classmethod(lambda cls, **_: cls)
+        return cls
+    return decorate(_cls) if _cls is not None else decorate
+
+
+def _ingress(fastapi_app):
+    def decorate(cls):
+        cls._ingress_app = fastapi_app
+        return cls
+    return decorate
+
+
+def _batch(_func=None, max_batch_size: int = 10, batch_wait_timeout_s: float = 0.01, **_):
+    def decorate(func):
+        return _BatchMethod(func, max_batch_size, batch_wait_timeout_s)
+    return decorate(_func) if _func is not None else decorate
+
+
+def _multiplexed(_func=None, max_num_models_per_replica: int = 3):
+    return _func if _func is not None else (lambda func: func)
+
+
+def install_ray_stubs():
+    """Register the stand-in ray, ray.serve and ray.serve.metrics modules"""
+    existing = sys.modules.get("ray")
+    if existing is not None and not getattr(existing, "_rayzer_local", False):
+        raise RuntimeError("ray is already imported; install the local stubs before importing the app")
+    if existing is not None:
+        return
+
+    runtime_context = types.SimpleNamespace(get_node_id=lambda: LOCAL_NODE_ID)
+    replica_context = types.SimpleNamespace(replica_tag=LOCAL_REPLICA_ID, app_name="local",
+                                            deployment="local")
+
+    ray = types.ModuleType("ray")
+    ray._rayzer_local = True
+    ray.get_runtime_context = lambda: runtime_context
+    ray.is_initialized = lambda: False
+
+    serve = types.ModuleType("ray.serve")
+    serve.deployment = _deployment
+    serve.ingress = _ingress
+    serve.batch = _batch
+    serve.multiplexed = _multiplexed
+    serve.get_multiplexed_model_id = lambda: ""
+    serve.get_replica_context = lambda: replica_context
+
+    metrics = types.ModuleType("ray.serve.metrics")
+    metrics.Counter = metrics.Gauge = metrics.Histogram = _Metric
+
+    ray.serve = serve
+    serve.metrics = metrics
+    sys.modules.update({"ray": ray, "ray.serve": serve, "ray.serve.metrics": metrics})
+
+
+def load_deployment(module_name: str = "serve_app", class_name: str = "XGBoostModel"):
+    """Import a deployment module under the stubs and return its class"""
+    install_ray_stubs()
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def bind_routes(instance):
+    """A FastAPI app serving the class's ingress routes on this instance"""
+    from fastapi import FastAPI
+    from fastapi.routing import APIRoute
+
+    local = FastAPI(title=f"{type(instance).__name__} (local)")
+    for route in type(instance)._ingress_app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        # Routes were registered on the unbound functions; bind them so `self`
+        # is not taken for a request parameter
+        local.add_api_route(route.path, route.endpoint.__get__(instance), methods=sorted(route.methods),
+                            name=route.name, response_class=route.response_class,
+                            status_code=route.status_code, include_in_schema=route.include_in_schema)
+    return local
+
+
+def local_app(module_name: str = "serve_app", class_name: str = "XGBoostModel", **init_args):
+    """Instantiate the deployment in this process and return (ASGI app, instance)"""
+    cls = load_deployment(module_name, class_name)
+    instance = cls(**init_args)
+    return bind_routes(instance), instance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a deployment in-process with uvicorn, without Ray')
+    parser.add_argument('init_args', nargs='*', metavar='KEY=VALUE',
+                        help='Deployment init arguments, as for `serve run serve_app:build_app`')
+    parser.add_argument('--app', type=str, default='serve_app:XGBoostModel',
+                        help='Deployment as module:Class')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='Port to listen on')
+
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("local_serve.py needs uvicorn: pip install uvicorn")
+    module_name, _, class_name = args.app.partition(":")
+    install_ray_stubs()
+    from serve_app import _parse_arg
+    init_args = {}
+    for arg in args.init_args:
+        key, _, value = arg.partition("=")
+        init_args[key] = _parse_arg(value)
+    asgi_app, _ = local_app(module_name, class_name, **init_args)
+    # One worker: the deployment keeps its state in this process, like one replica
+    uvicorn.run(asgi_app, host=args.host, port=args.port, workers=1)
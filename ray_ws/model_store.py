@@ -0,0 +1,124 @@
+# model_store.py
+"""Per-replica LRU set of loaded models, bounded by approximate memory and count."""
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Dict, Optional, Tuple
+
+
+class ModelStore:
+    """Loads models on first use and evicts the least recently used ones.
+
+    `loader(model_id)` runs on `executor` and returns (model, size in bytes).
+    Concurrent requests for a model that is still loading wait for the same
+    load. A model bigger than `max_bytes` on its own is still kept, as the
+    only resident model, so it can be served. `on_evict(model_id, model)` is
+    called for every model the store evicts; models that an outside cache
+    unloads are handed back with release().
+    """
+
+    def __init__(self,
+                 loader: Callable[[str], Tuple[object, int]],
+                 max_bytes: int,
+                 max_models: int,
+                 executor: Optional[Executor] = None,
+                 on_evict: Optional[Callable[[str, object], None]] = None):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.max_models = max_models
+        self.executor = executor
+        self.on_evict = on_evict
+        self.entries = OrderedDict()  # model_id -> (model, size)
+        self.bytes = 0
+        self.loading = {}  # model_id -> Future of the running load
+        self.model_stats = {}
+
+    def __contains__(self, model_id: str) -> bool:
+        return model_id in self.entries
+
+    def _stats(self, model_id: str) -> Dict:
+        if model_id not in self.model_stats:
+            self.model_stats[model_id] = {
+                "hits": 0,
+                "misses": 0,
+                "loads": 0,
+                "load_errors": 0,
+                "evictions": 0,
+                "load_time_s": 0.0,
+                "last_load_s": None,
+                "bytes": None,
+            }
+        return self.model_stats[model_id]
+
+    def touch(self, model_id: str):
+        """Record a hit for a resident model that was served from an outside cache"""
+        if model_id in self.entries:
+            self.entries.move_to_end(model_id)
+            self._stats(model_id)["hits"] += 1
+
+    async def get(self, model_id: str):
+        """Return the model, loading it (and evicting others) if it is not resident"""
+        stats = self._stats(model_id)
+        entry = self.entries.get(model_id)
+        if entry is not None:
+            self.entries.move_to_end(model_id)
+            stats["hits"] += 1
+            return entry[0]
+        stats["misses"] += 1
+        future = self.loading.get(model_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(model_id))
+            self.loading[model_id] = future
+            future.add_done_callback(lambda _: self.loading.pop(model_id, None))
+        # Shield so one cancelled request does not cancel the load for the others
+        return await asyncio.shield(future)
+
+    async def _load(self, model_id: str):
+        stats = self._stats(model_id)
+        start_time = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            model, size = await loop.run_in_executor(self.executor, self.loader, model_id)
+        except Exception:
+            stats["load_errors"] += 1
+            raise
+        load_time = time.perf_counter() - start_time
+        stats["loads"] += 1
+        stats["load_time_s"] += load_time
+        stats["last_load_s"] = load_time
+        stats["bytes"] = size
+
+        self.entries[model_id] = (model, size)
+        self.bytes += size
+        while len(self.entries) > 1 and (len(self.entries) > self.max_models or self.bytes > self.max_bytes):
+            evicted_id, (evicted, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self._stats(evicted_id)["evictions"] += 1
+            print(f"Evicted model {evicted_id} ({evicted_size / 1e6:.1f} MB) to load {model_id}")
+            if self.on_evict is not None:
+                self.on_evict(evicted_id, evicted)
+        return model
+
+    def release(self, model_id: str, model: object):
+        """Drop a model that was unloaded elsewhere, if it is still this store's copy"""
+        entry = self.entries.get(model_id)
+        if entry is None or entry[0] is not model:
+            return
+        del self.entries[model_id]
+        self.bytes -= entry[1]
+        self._stats(model_id)["evictions"] += 1
+        print(f"Released model {model_id} ({entry[1] / 1e6:.1f} MB)")
+
+    def summary(self) -> Dict:
+        hits = sum(stats["hits"] for stats in self.model_stats.values())
+        misses = sum(stats["misses"] for stats in self.model_stats.values())
+        return {
+            "resident": list(self.entries),  # least recently used first
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "max_models": self.max_models,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+            "models": {model_id: dict(stats, resident=model_id in self.entries)
+                       for model_id, stats in self.model_stats.items()},
+        }
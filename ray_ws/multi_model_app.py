@@ -0,0 +1,219 @@
+# multi_model_app.py
+"""Serve many small XGBoost models from one multiplexed deployment.
+
+Requests pick a model with the `serve_multiplexed_model_id` header (or a
+"model_id" field in the body). The header lets the Serve proxy route a
+request to a replica that already holds that model. Models are loaded lazily
+from `<model_dir>/<model_id>.ubj` or `.json` through an LRU store (see
+model_store.py) that tracks their memory and per-model stats.
+
+Serve's multiplex cache holds the loaded models, so the ids it reports for
+routing are the models a replica really holds. Both caches evict the least
+recently used model past RAYZER_MAX_MODELS, and models Serve unloads are
+released from the store. Only when max_model_mb is reached first does the
+store unload a model Serve still lists; its next request reloads it.
+
+    python multi_model_app.py --export-dir /tmp/models --models 50
+    serve run multi_model_app:build_app model_dir=/tmp/models max_model_mb=64
+"""
+import os
+import re
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+
+import ray
+from ray import serve
+from fastapi import FastAPI, HTTPException
+import xgboost as xgb
+
+from tree_engine import NATIVE_MAX_ROWS, TreeEnsemble
+from model_store import ModelStore
+from serve_app import (DEFAULT_PREDICT_THREADS, _parse_arg, get_replica_id, load_model_artifact,
+                       model_version, train_synthetic_model)
+
+app = FastAPI()
+
+# Models per replica, for Serve's multiplex cache and the model store alike.
+# Serve reads the cap when the class is defined, so it is set by environment
+# (e.g. in the deployment's runtime_env) rather than as an init argument.
+MAX_MULTIPLEXED_MODELS = int(os.environ.get("RAYZER_MAX_MODELS", "32"))
+ARTIFACT_SUFFIXES = (".ubj", ".json")
+# Model ids become file names, so keep them to a safe character set
+MODEL_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+
+class LoadedModel:
+    """A resident model: the booster and, on the native backend, its compiled tree engine"""
+
+    def __init__(self, model_id: str, booster: xgb.Booster, backend: str,
+                 on_unload: Optional[Callable[["LoadedModel"], None]] = None):
+        self.model_id = model_id
+        self.on_unload = on_unload
+        self.version = model_version(booster)
+        self.n_features = booster.num_features()
+        # The booster is kept on the native backend too, for batches too large for the engine
+        self.engine = TreeEnsemble.from_booster(booster) if backend == "native" else None
+        self.booster = booster
+
+    @property
+    def loaded(self) -> bool:
+        return self.booster is not None
+
+    def unload(self):
+        """Free the trees; the object may still sit in Serve's multiplex cache"""
+        self.booster = None
+        self.engine = None
+
+    def __del__(self):
+        # Serve calls this when its multiplex cache unloads the model
+        on_unload, self.on_unload = self.on_unload, None
+        if on_unload is not None:
+            on_unload(self)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.engine is not None and len(X) <= NATIVE_MAX_ROWS:
+            return self.engine.predict(X)
+        return self.booster.predict(xgb.DMatrix(X))
+
+
+@serve.deployment(
+    num_replicas="auto",
+    ray_actor_options={"num_cpus": 0.5},
+    autoscaling_config={
+        "min_replicas": 1,
+        "max_replicas": 20,
+        "target_num_ongoing_requests_per_replica": 2,
+        "upscale_delay_s": 5,
+        "downscale_delay_s": 60,
+        "smoothing_factor": 0.2,
+    }
+)
+@serve.ingress(app)
+class MultiModelXGBoost:
+    def __init__(self,
+                 model_dir: Optional[str] = None,
+                 max_model_mb: float = 256.0,
+                 predict_threads: int = DEFAULT_PREDICT_THREADS,
+                 backend: str = "xgboost"):
+        model_dir = model_dir or os.environ.get("RAYZER_MODEL_DIR")
+        if not model_dir or not os.path.isdir(model_dir):
+            raise ValueError(f"model_dir (or RAYZER_MODEL_DIR) must be a directory of model artifacts, got {model_dir}")
+        if backend not in ("xgboost", "native"):
+            raise ValueError(f"Unknown backend {backend}, expected 'xgboost' or 'native'")
+        self.model_dir = model_dir
+        self.backend = backend
+        self.replica_id = get_replica_id()
+        self.executor = ThreadPoolExecutor(max_workers=predict_threads,
+                                           thread_name_prefix="xgb-predict")
+        self.store = ModelStore(self.load_model,
+                                max_bytes=int(max_model_mb * 1024 * 1024),
+                                max_models=MAX_MULTIPLEXED_MODELS,
+                                executor=self.executor,
+                                on_evict=lambda _, model: model.unload())
+
+    def artifact_path(self, model_id: str) -> Optional[str]:
+        for suffix in ARTIFACT_SUFFIXES:
+            path = os.path.join(self.model_dir, model_id + suffix)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def load_model(self, model_id: str) -> Tuple[LoadedModel, int]:
+        """Load a model artifact and estimate its resident size"""
+        path = self.artifact_path(model_id)
+        if path is None:
+            raise FileNotFoundError(f"No artifact for model {model_id} in {self.model_dir}")
+        model = LoadedModel(model_id, load_model_artifact(path), self.backend,
+                            on_unload=lambda model: self.store.release(model.model_id, model))
+        # Parsed trees take about as much memory as their serialized form
+        size = os.path.getsize(path) + (model.engine.nbytes if model.engine is not None else 0)
+        print(f"Loaded model {model_id} ({size / 1e6:.2f} MB) from {path}")
+        return model, size
+
+    @serve.multiplexed(max_num_models_per_replica=MAX_MULTIPLEXED_MODELS)
+    async def get_model(self, model_id: str) -> LoadedModel:
+        """Load model_id through the store. Serve caches the result and reports
+        the cached ids, so the proxy routes the model's requests here."""
+        return await self.store.get(model_id)
+
+    @app.get("/")
+    async def root(self):
+        return {"status": "healthy"}
+
+    @app.get("/models")
+    async def models(self):
+        """Resident models and per-model hit, load and eviction stats of this replica"""
+        return dict(self.store.summary(),
+                    instance_id=ray.get_runtime_context().get_node_id(),
+                    replica_id=self.replica_id)
+
+    @app.post("/predict")
+    async def predict(self, data: Dict):
+        model_id = serve.get_multiplexed_model_id() or data.get("model_id")
+        if not model_id:
+            raise HTTPException(status_code=400,
+                                detail="Set the serve_multiplexed_model_id header or a model_id field")
+        if not MODEL_ID_PATTERN.match(model_id) or self.artifact_path(model_id) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown model {model_id}")
+
+        start_time = time.time()
+        cached = model_id in self.store
+        model = await self.get_model(model_id)
+        if cached:
+            self.store.touch(model_id)
+        elif not model.loaded:
+            # The store unloaded it to stay under max_model_mb
+            cached = False
+            model = await self.store.get(model_id)
+
+        features = data.get("features", None)
+        if features is None or len(features) != model.n_features:
+            features = np.random.rand(model.n_features).tolist()
+        loop = asyncio.get_running_loop()
+        prediction = float((await loop.run_in_executor(self.executor, model.predict, np.array([features])))[0])
+
+        return {
+            "prediction": prediction,
+            "model_id": model_id,
+            "model_version": model.version,
+            "cached": cached,
+            "processing_time": time.time() - start_time,
+            "instance_id": ray.get_runtime_context().get_node_id(),
+            "replica_id": self.replica_id
+        }
+
+
+def build_app(args: Dict[str, str]):
+    """Application builder for `serve run multi_model_app:build_app key=value ...`"""
+    return MultiModelXGBoost.bind(**{key: _parse_arg(value) for key, value in args.items()})
+
+
+# Reads the artifact directory from RAYZER_MODEL_DIR
+app = MultiModelXGBoost.bind()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export demo XGBoost models for the multiplexed deployment')
+    parser.add_argument('--export-dir', type=str, required=True,
+                        help='Directory to save the models to')
+    parser.add_argument('--models', type=int, default=20,
+                        help='Number of models (saved as model-000.ubj, model-001.ubj, ...)')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='Number of synthetic training samples per model')
+    parser.add_argument('--features', type=int, default=20,
+                        help='Number of features')
+
+    args = parser.parse_args()
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    for index in range(args.models):
+        # Different data per model, so every model has its own trees and version
+        np.random.seed(index)
+        path = os.path.join(args.export_dir, f"model-{index:03d}.ubj")
+        train_synthetic_model(args.samples, args.features).save_model(path)
+    print(f"{args.models} models saved to {args.export_dir}. Serve them with "
+          f"`serve run multi_model_app:build_app model_dir={args.export_dir}`")
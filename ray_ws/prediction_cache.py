@@ -0,0 +1,107 @@
+# prediction_cache.py
+"""Per-replica LRU cache of predictions keyed by (quantized) feature vectors."""
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+
+# Rough per-entry cost of the OrderedDict slot, timestamp and tuple on top of
+# the key and value objects themselves
+ENTRY_OVERHEAD_BYTES = 120
+
+
+class PredictionCache:
+    """LRU cache bounded by entry count and approximate bytes, with an optional TTL.
+
+    Features are rounded to `decimals` places before hashing, so vectors that
+    only differ by float noise share an entry. The cache is tied to a model
+    version and drops everything when that version changes.
+    """
+
+    def __init__(self,
+                 max_entries: int,
+                 max_bytes: int,
+                 ttl_s: Optional[float] = None,
+                 decimals: int = 6):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.decimals = decimals
+        self.model_version = None
+        self.entries = OrderedDict()  # key -> (value, inserted_at, size)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def make_key(self, features) -> bytes:
+        """Hash the quantized feature vector into a fixed-size key"""
+        quantized = np.round(np.asarray(features, dtype=np.float64), self.decimals)
+        return hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+
+    def set_model_version(self, model_version: str):
+        """Invalidate all entries if the model has changed"""
+        with self.lock:
+            if model_version != self.model_version:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.bytes = 0
+                self.model_version = model_version
+
+    def get(self, key: bytes):
+        """Return the cached value for key, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, inserted_at, size = entry
+            if self.ttl_s is not None and time.monotonic() - inserted_at > self.ttl_s:
+                del self.entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: bytes, value):
+        """Insert value, evicting least recently used entries to stay within bounds"""
+        size = sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD_BYTES
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self.entries[key] = (value, time.monotonic(), size)
+            self.bytes += size
+            while self.entries and (len(self.entries) > self.max_entries
+                                    or self.bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "miss_rate": self.misses / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "model_version": self.model_version,
+        }
@@ -0,0 +1,174 @@
+# results_sink.py
+"""Append-only JSONL results files for load_test.py.
+
+A results file holds one JSON record per line:
+
+    {"type": "run", "started_at": ..., "metadata": {...}}
+    {"type": "window", "elapsed_s": 1.0, "sent": 20, "completed": 19, "errors": 0,
+     "instance_counts": {...}, "response_time": <LatencyHistogram.to_dict()>, ...}
+    ...
+    {"type": "summary", "summary": {...}, "stats": {...}}
+
+Windows are written as soon as they close and flushed line by line, so the
+tester keeps nothing per window in memory and a crashed or interrupted run
+still leaves every completed window on disk; only the summary is missing.
+Plots are produced offline from the file with `python load_test.py plot`.
+"""
+import os
+import json
+import time
+from typing import Dict, List, Optional
+from latency_histogram import LatencyHistogram
+
+# How often the file is fsynced; lines are flushed to the OS after every window
+FSYNC_INTERVAL_S = 5.0
+
+
+class ResultsSink:
+    """Interval listener that appends every window to a JSONL file"""
+
+    def __init__(self, path: str, metadata: Optional[Dict] = None):
+        self.path = path
+        self.file = open(path, "a", buffering=1)
+        self.last_fsync = time.monotonic()
+        self._write({"type": "run", "started_at": time.time(), "metadata": metadata or {}})
+
+    def __call__(self, interval: Dict):
+        self._write(dict(interval, type="window"))
+
+    def write_summary(self, summary: Dict, stats: Optional[Dict] = None):
+        """Record the final summary and mergeable run statistics"""
+        self._write({"type": "summary", "summary": summary, "stats": stats or {}}, fsync=True)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    def _write(self, record: Dict, fsync: bool = False):
+        self.file.write(json.dumps(record) + "\n")
+        now = time.monotonic()
+        if fsync or now - self.last_fsync >= FSYNC_INTERVAL_S:
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_results(path: str) -> Dict:
+    """
+    Load a results file into {"run": ..., "windows": [...], "summary": ...}
+
+    A truncated last line, left by a run that crashed mid-write, is skipped.
+    """
+    run, summary, windows = None, None, []
+    with open(path) as f:
+        lines = f.readlines()
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            if number == len(lines):
+                break
+            raise ValueError(f"{path}:{number} is not valid JSON")
+        kind = record.pop("type", None)
+        if kind == "run":
+            run = record
+        elif kind == "window":
+            windows.append(record)
+        elif kind == "summary":
+            summary = record
+    return {"run": run, "windows": windows, "summary": summary}
+
+
+def merged_histogram(windows: List[Dict], key: str = "response_time") -> LatencyHistogram:
+    """Combine the per-window histograms of a run"""
+    histogram = LatencyHistogram()
+    for window in windows:
+        if key in window:
+            histogram.merge(LatencyHistogram.from_dict(window[key]))
+    return histogram
+
+
+def plot_results(path: str, output_prefix: Optional[str] = None) -> List[str]:
+    """Plot throughput, instances and latency over time from a results file"""
+    try:
+        import matplotlib
+    except ImportError:
+        raise ImportError("Plotting requires matplotlib (pip install matplotlib)")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    results = read_results(path)
+    windows = results["windows"]
+    if not windows:
+        raise ValueError(f"{path} contains no windows to plot")
+    output_prefix = output_prefix or os.path.splitext(path)[0]
+
+    elapsed = [window["elapsed_s"] for window in windows]
+    rates = lambda key: [window[key] / window["interval_s"] if window["interval_s"] > 0 else 0
+                         for window in windows]
+    percentiles = [LatencyHistogram.from_dict(window["response_time"]).percentiles((50, 99))
+                   for window in windows]
+
+    plt.figure(figsize=(12, 12))
+
+    # Plot 1: RPS over time
+    plt.subplot(3, 1, 1)
+    plt.plot(elapsed, rates("sent"), 'b-', label='sent')
+    plt.plot(elapsed, rates("completed"), 'g-', label='completed')
+    plt.plot(elapsed, rates("errors"), 'r-', label='errors')
+    plt.title('Requests Per Second Over Time')
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('RPS')
+    plt.legend()
+    plt.grid(True)
+
+    # Plot 2: Latency over time
+    plt.subplot(3, 1, 2)
+    for name, style in (("p50", 'b-'), ("p99", 'r-')):
+        values = [p[name] * 1000 if p[name] is not None else float('nan') for p in percentiles]
+        plt.plot(elapsed, values, style, label=name)
+    plt.title('Response Time Per Window')
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('Latency (ms)')
+    plt.legend()
+    plt.grid(True)
+
+    # Plot 3: Instances over time
+    plt.subplot(3, 1, 3)
+    plt.plot(elapsed, [window["active_instances"] for window in windows], 'r-')
+    plt.title('Active Instances Over Time')
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('Number of Instances')
+    plt.grid(True)
+
+    plt.tight_layout()
+    timeline_path = f"{output_prefix}_timeline.png"
+    plt.savefig(timeline_path)
+    plt.close()
+    outputs = [timeline_path]
+
+    # Latency distribution of the whole run
+    buckets = merged_histogram(windows).buckets()
+    if buckets:
+        plt.figure(figsize=(10, 6))
+        plt.hist([upper * 1000 for upper, _ in buckets], weights=[count for _, count in buckets],
+                 bins=50, alpha=0.75)  # Convert to ms
+        plt.title('Latency Distribution')
+        plt.xlabel('Latency (ms)')
+        plt.ylabel('Count')
+        plt.grid(True)
+        distribution_path = f"{output_prefix}_latency.png"
+        plt.savefig(distribution_path)
+        plt.close()
+        outputs.append(distribution_path)
+
+    return outputs
@@ -0,0 +1,167 @@
+# scenarios.py
+"""Declarative multi-phase load scenarios for load_test.py.
+
+A scenario is a JSON file with a list of phases that run back to back:
+
+    {
+        "name": "autoscaling-transitions",
+        "arrival": "poisson",
+        "phases": [
+            {"name": "baseline", "type": "constant", "rps": 10, "duration": 60},
+            {"name": "ladder", "type": "step", "start_rps": 10, "end_rps": 80, "steps": 4, "duration": 120},
+            {"name": "burst", "type": "spike", "rps": 20, "spike_rps": 300,
+             "spike_start": 10, "spike_duration": 15, "duration": 90},
+            {"name": "diurnal", "type": "sine", "min_rps": 5, "max_rps": 60, "period": 300, "duration": 600},
+            {"name": "overnight", "type": "soak", "rps": 30, "duration": 7200,
+             "complexity": [0.5, 1.0],
+             "payload_mix": [{"weight": 0.9, "features": "pool"},
+                             {"weight": 0.1, "complexity": [3.0, 5.0]}]}
+        ]
+    }
+
+Phase types and their rate parameters (requests per second over phase time t):
+    constant, soak: rps
+    ramp:           start_rps -> end_rps linearly
+    step:           `steps` equal-length levels from start_rps to end_rps
+    spike:          rps, with spike_rps from spike_start for spike_duration seconds
+    sine:           between min_rps and max_rps with the given period, starting at min_rps
+
+Every phase may also set "arrival" (constant or poisson), "complexity" ([min, max])
+and "payload_mix", a weighted list of request kinds. Each kind may set its own
+"complexity" range, "features" ("pool" to draw from the tester's feature pool,
+"random" to let the server generate them, or an explicit vector) and a "payload"
+object merged into the request body.
+"""
+import json
+import math
+import random
+from typing import Callable, Dict, List, Optional
+
+PHASE_TYPES = ("constant", "soak", "ramp", "step", "spike", "sine")
+
+# Resolution used to integrate time-varying rates into arrival times
+RATE_STEP_S = 0.01
+
+
+def load_scenario(path: str) -> Dict:
+    """Read and validate a scenario file"""
+    with open(path) as f:
+        scenario = json.load(f)
+    if not scenario.get("phases"):
+        raise ValueError(f"Scenario {path} has no phases")
+    names = set()
+    for index, phase in enumerate(scenario["phases"]):
+        phase.setdefault("name", f"phase-{index + 1}")
+        if phase["name"] in names:
+            raise ValueError(f"Phase name {phase['name']} is used more than once")
+        names.add(phase["name"])
+        if phase.get("type") not in PHASE_TYPES:
+            raise ValueError(f"Phase {phase['name']} has unknown type {phase.get('type')}, "
+                             f"expected one of {', '.join(PHASE_TYPES)}")
+        if phase.get("duration", 0) <= 0:
+            raise ValueError(f"Phase {phase['name']} needs a positive duration")
+        # Fail early on missing rate parameters
+        phase_rate(phase)(0.0)
+    return scenario
+
+
+def phase_rate(phase: Dict) -> Callable[[float], float]:
+    """Target requests per second at time t (seconds since the phase started)"""
+    kind = phase["type"]
+    duration = phase["duration"]
+    try:
+        if kind in ("constant", "soak"):
+            rps = phase["rps"]
+            return lambda t: rps
+        if kind == "ramp":
+            start, end = phase["start_rps"], phase["end_rps"]
+            return lambda t: start + (end - start) * t / duration
+        if kind == "step":
+            start, end, steps = phase["start_rps"], phase["end_rps"], int(phase["steps"])
+            step_length = duration / steps
+            increment = (end - start) / (steps - 1) if steps > 1 else 0
+            return lambda t: start + increment * min(int(t // step_length), steps - 1)
+        if kind == "spike":
+            base, spike = phase["rps"], phase["spike_rps"]
+            spike_start = phase["spike_start"]
+            spike_end = spike_start + phase["spike_duration"]
+            return lambda t: spike if spike_start <= t < spike_end else base
+        if kind == "sine":
+            low, high, period = phase["min_rps"], phase["max_rps"], phase["period"]
+            return lambda t: low + (high - low) * (1 - math.cos(2 * math.pi * t / period)) / 2
+    except KeyError as e:
+        raise ValueError(f"Phase {phase.get('name')} of type {kind} is missing {e}")
+    raise ValueError(f"Unknown phase type {kind}")
+
+
+def rate_offsets(rate: Callable[[float], float], duration: float, arrival: str = "constant"):
+    """
+    Yield arrival times in [0, duration) for a time-varying rate
+
+    The rate is integrated in RATE_STEP_S slices. Each arrival happens where
+    the integral since the previous one reaches 1 ("constant") or an Exp(1)
+    draw ("poisson").
+    """
+    if arrival not in ("constant", "poisson"):
+        raise ValueError(f"Unknown arrival process {arrival}, expected 'constant' or 'poisson'")
+    t = 0.0
+    while True:
+        needed = random.expovariate(1.0) if arrival == "poisson" else 1.0
+        while needed > 0:
+            if t >= duration:
+                return
+            step = min(RATE_STEP_S, duration - t)
+            expected = max(rate(t + step / 2), 0.0) * step
+            if expected >= needed:
+                t += step * needed / expected
+                needed = 0
+            else:
+                needed -= expected
+                t += step
+        yield t
+
+
+def _choose_kind(payload_mix: List[Dict]) -> Dict:
+    return random.choices(payload_mix, weights=[kind.get("weight", 1.0) for kind in payload_mix])[0]
+
+
+def scenario_requests(scenario: Dict, feature_pool: Optional[list] = None):
+    """Yield (offset in seconds, payload, phase name) for every request of a scenario"""
+    phase_start = 0.0
+    for phase in scenario["phases"]:
+        arrival = phase.get("arrival", scenario.get("arrival", "constant"))
+        complexity_range = phase.get("complexity", scenario.get("complexity", [0.5, 2.0]))
+        payload_mix = phase.get("payload_mix", scenario.get("payload_mix")) or [{}]
+
+        for offset in rate_offsets(phase_rate(phase), phase["duration"], arrival):
+            kind = _choose_kind(payload_mix)
+            low, high = kind.get("complexity", complexity_range)
+            payload = dict(kind.get("payload", {}))
+            payload["complexity"] = random.uniform(low, high)
+            features = kind.get("features", "pool")
+            if isinstance(features, list):
+                payload["features"] = features
+            elif features == "pool" and feature_pool:
+                payload["features"] = random.choice(feature_pool)
+            yield phase_start + offset, payload, phase["name"]
+
+        phase_start += phase["duration"]
+
+
+def scenario_phases(scenario: Dict) -> List[Dict]:
+    """Name, start, duration and mean target RPS of each phase"""
+    phases = []
+    phase_start = 0.0
+    for phase in scenario["phases"]:
+        rate = phase_rate(phase)
+        samples = min(10000, max(1, int(phase["duration"] / RATE_STEP_S)))
+        mean_rps = sum(rate((i + 0.5) * phase["duration"] / samples) for i in range(samples)) / samples
+        phases.append({
+            "name": phase["name"],
+            "type": phase["type"],
+            "start_s": phase_start,
+            "duration_s": phase["duration"],
+            "target_rps": mean_rps,
+        })
+        phase_start += phase["duration"]
+    return phases
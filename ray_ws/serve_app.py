@@ -1,16 +1,245 @@
 # serve_app.py
 import time
+_IMPORT_START = time.perf_counter()
+import os
+import json
+import hashlib
 import random
+import argparse
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 import ray
 from ray import serve
-from fastapi import FastAPI
+from ray.serve import metrics
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
 import xgboost as xgb
 
+import bulk_codec
+from tree_engine import NATIVE_MAX_ROWS, TreeEnsemble
+from prediction_cache import PredictionCache
+from stack_sampler import StackSampler
+
+IMPORT_TIME_S = time.perf_counter() - _IMPORT_START
+
 app = FastAPI()
 
+# Defaults for the optional request batching mode. These can be overridden per
+# deployment, e.g. `serve run serve_app:build_app enable_batching=true max_batch_size=32`
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_BATCH_WAIT_TIMEOUT_S = 0.005
+# Threads used to run XGBoost predictions off the event loop
+DEFAULT_PREDICT_THREADS = 2
+# Rounds of synthetic batches run before a new replica reports healthy. By
+# default the batch sizes are 1, max_batch_size and a typical bulk request.
+DEFAULT_WARMUP_BULK_ROWS = 256
+DEFAULT_WARMUP_ROUNDS = 3
+# Longest window /profile will sample for
+MAX_PROFILE_DURATION_S = 60.0
+# Histogram buckets of the Prometheus metrics
+LATENCY_BOUNDARIES_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+BATCH_SIZE_BOUNDARIES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096]
+# Parts of the server-side time reported per /predict request
+SERVER_TIMING_PARTS = ("decode_s", "features_s", "cache_s", "batch_wait_s", "executor_wait_s",
+                       "dmatrix_s", "predict_s", "simulated_work_s", "total_s")
+
+
+class RollingStats:
+    """Keeps the most recent samples of a value for reporting on /stats"""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self) -> Dict:
+        if not self.samples:
+            return {"count": self.count}
+        recent = np.fromiter(self.samples, dtype=np.float64)
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "recent_mean": float(recent.mean()),
+            "recent_p50": float(np.percentile(recent, 50)),
+            "recent_p95": float(np.percentile(recent, 95)),
+            "recent_max": float(recent.max()),
+        }
+
+
+def train_synthetic_model(n_samples: int = 1000, n_features: int = 20) -> xgb.Booster:
+    """Train the small demo booster on random data"""
+    # Create some synthetic data for training
+    X = np.random.rand(n_samples, n_features)
+    y = np.random.randint(0, 2, n_samples)  # Binary classification
+
+    # Create DMatrix
+    dtrain = xgb.DMatrix(X, label=y)
+
+    # Set XGBoost parameters
+    params = {
+        'max_depth': 3,
+        'eta': 0.1,
+        'objective': 'binary:logistic',
+        'eval_metric': 'logloss',
+        'seed': 42
+    }
+
+    # Train the model
+    print("Training XGBoost model...")
+    model = xgb.train(params, dtrain, num_boost_round=10)
+    print("XGBoost model trained successfully")
+    return model
+
+
+def load_model_artifact(path: str) -> xgb.Booster:
+    """Load a booster saved with Booster.save_model (.json or .ubj)
+
+    XGBoost parses the file into its own per-process tree structures, so
+    every replica holds a private copy of the model.
+    """
+    return xgb.Booster(model_file=path)
+
+
+def model_version(booster: xgb.Booster, raw: Optional[bytes] = None) -> str:
+    """Short content hash identifying a booster, used to invalidate cached predictions"""
+    return hashlib.sha1(raw if raw is not None else booster.save_raw()).hexdigest()[:12]
+
+
+def resident_bytes() -> Optional[int]:
+    """Resident set size of this process, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ServedModel:
+    """One model version of a replica: the booster, its compiled engine for
+    the "native" backend, and how long it took to get ready. Requests read
+    the replica's current ServedModel once, so a hot swap never mixes two
+    versions within a prediction."""
+
+    def __init__(self, booster: xgb.Booster, backend: str, path: Optional[str] = None, load_s: float = 0.0):
+        raw = booster.save_raw()
+        self.booster = booster
+        self.path = path
+        self.version = model_version(booster, raw)
+        self.n_features = booster.num_features()
+        self.load_s = load_s
+        compile_start = time.perf_counter()
+        self.engine = TreeEnsemble.from_booster(booster) if backend == "native" else None
+        self.compile_s = time.perf_counter() - compile_start
+
+        # The first predict call pays for lazy initialization inside XGBoost
+        first_predict_start = time.perf_counter()
+        self.predict(np.zeros((1, self.n_features), dtype=np.float32))
+        self.first_predict_s = time.perf_counter() - first_predict_start
+
+        # Parsed trees take about as much memory as their serialized form
+        self.bytes = len(raw) + (self.engine.nbytes if self.engine is not None else 0)
+        self.loaded_at = time.time()
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.engine is not None and len(X) <= NATIVE_MAX_ROWS:
+            return self.engine.predict(X)
+        return self.booster.predict(xgb.DMatrix(X))
+
+    def info(self) -> Dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "n_features": self.n_features,
+            "bytes": self.bytes,
+            "loaded_at": self.loaded_at,
+            "load_s": self.load_s,
+            "engine_compile_s": self.compile_s,
+        }
+
+
+class ServingMetrics:
+    """Application metrics of a replica. Serve tags them with application,
+    deployment and replica, and Prometheus sees them with a ray_ prefix."""
+
+    def __init__(self):
+        self.request_latency_ms = metrics.Histogram(
+            "xgboost_request_latency_ms",
+            description="Server time of prediction requests, by path (single, batched, cached or bulk).",
+            boundaries=LATENCY_BOUNDARIES_MS,
+            tag_keys=("path",))
+        self.model_latency_ms = metrics.Histogram(
+            "xgboost_model_latency_ms",
+            description="Time per model call (DMatrix build plus predict), by source (single, batcher or bulk).",
+            boundaries=LATENCY_BOUNDARIES_MS,
+            tag_keys=("source",))
+        self.batch_size = metrics.Histogram(
+            "xgboost_batch_size",
+            description="Rows per model call, by source (single, batcher or bulk).",
+            boundaries=BATCH_SIZE_BOUNDARIES,
+            tag_keys=("source",))
+        self.cache_lookups = metrics.Counter(
+            "xgboost_cache_lookups",
+            description="Prediction cache lookups, by result (hit or miss).",
+            tag_keys=("result",))
+        self.in_flight = metrics.Gauge(
+            "xgboost_in_flight_requests",
+            description="Prediction requests currently being handled by the replica.")
+        self.startup_s = metrics.Gauge(
+            "xgboost_startup_seconds",
+            description="Replica startup time by stage (model_load, engine_compile, first_predict, warmup, init_total).",
+            tag_keys=("stage",))
+        self.model_swaps = metrics.Counter(
+            "xgboost_model_swaps",
+            description="Model hot swaps, by result (reloaded, rolled_back or failed).",
+            tag_keys=("result",))
+        self.swap_s = metrics.Gauge(
+            "xgboost_model_swap_seconds",
+            description="Time of the last model reload by stage (load, warmup, swap, total).",
+            tag_keys=("stage",))
+
+    def record_model_call(self, source: str, rows: int, timings: Dict[str, float]):
+        self.model_latency_ms.observe((timings["dmatrix_s"] + timings["predict_s"]) * 1000,
+                                      tags={"source": source})
+        self.batch_size.observe(rows, tags={"source": source})
+
+    def set_startup_times(self, startup_times: Dict):
+        for key, value in startup_times.items():
+            if key.endswith("_s") and isinstance(value, (int, float)):
+                self.startup_s.set(value, tags={"stage": key[:-2]})
+
+
+def get_replica_id() -> str:
+    """Identifier of the Serve replica running this code"""
+    context = serve.get_replica_context()
+    # Older Ray versions expose replica_tag, newer ones a replica_id object
+    replica_tag = getattr(context, "replica_tag", None)
+    if replica_tag:
+        return replica_tag
+    replica_id = context.replica_id
+    return getattr(replica_id, "unique_id", None) or str(replica_id)
+
+
+def user_config_model_path() -> Optional[str]:
+    """model_path of the deployment's user_config. Serve only passes
+    user_config to reconfigure() once __init__ has returned; reading it here
+    lets a replica load that model first instead of loading another and
+    swapping right away."""
+    # A private field, so fall back to the swap on Ray versions without it
+    deployment_config = getattr(serve.get_replica_context(), "_deployment_config", None)
+    user_config = getattr(deployment_config, "user_config", None)
+    return user_config.get("model_path") if isinstance(user_config, dict) else None
+
+
 @serve.deployment(
     num_replicas="auto",
     ray_actor_options={"num_cpus": 0.5,
@@ -27,73 +256,582 @@ app = FastAPI()
 )
 @serve.ingress(app)
 class XGBoostModel:
-    def __init__(self):
-        # Create a dummy XGBoost model
-        print("Initializing XGBoost model...")
-        
-        # Create some synthetic data for training
-        n_samples = 1000
-        n_features = 20
-        X = np.random.rand(n_samples, n_features)
-        y = np.random.randint(0, 2, n_samples)  # Binary classification
-        
-        # Create DMatrix
-        dtrain = xgb.DMatrix(X, label=y)
-        
-        # Set XGBoost parameters
-        params = {
-            'max_depth': 3,
-            'eta': 0.1,
-            'objective': 'binary:logistic',
-            'eval_metric': 'logloss',
-            'seed': 42
+    def __init__(self,
+                 enable_batching: bool = False,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 batch_wait_timeout_s: float = DEFAULT_BATCH_WAIT_TIMEOUT_S,
+                 predict_threads: int = DEFAULT_PREDICT_THREADS,
+                 model_path: Optional[str] = None,
+                 warmup_batch_sizes=None,
+                 warmup_rounds: int = DEFAULT_WARMUP_ROUNDS,
+                 backend: str = "xgboost",
+                 cache_max_entries: int = 0,
+                 cache_max_mb: float = 16.0,
+                 cache_ttl_s: Optional[float] = None,
+                 cache_decimals: int = 6,
+                 enable_profiling: bool = False,
+                 simulated_work_ratio: float = 0.1,
+                 keep_previous_model: bool = True):
+        init_start = time.perf_counter()
+        # instance_id in responses is the node ID; this tells replicas on a node apart
+        self.replica_id = get_replica_id()
+
+        # "native" evaluates the trees with NumPy (see tree_engine.py) instead of
+        # building a DMatrix and calling into XGBoost for every prediction
+        if backend not in ("xgboost", "native"):
+            raise ValueError(f"Unknown backend {backend}, expected 'xgboost' or 'native'")
+        self.backend = backend
+        # user_config wins, as reconfigure() would swap to it anyway
+        model_path = user_config_model_path() or model_path or os.environ.get("RAYZER_MODEL_PATH")
+        self.served = self.load_served_model(model_path)
+
+        # Hot swaps (POST /model/reload or a user_config change) keep the
+        # replaced model loaded so /model/rollback is instant
+        self.keep_previous_model = keep_previous_model
+        self.previous = None
+        self.reloading = False
+        self.last_swap = None
+
+        # How long this replica took to become ready, by phase
+        self.startup_times = {
+            "imports_s": IMPORT_TIME_S,
+            "model_source": "artifact" if model_path else "trained",
+            "model_load_s": self.served.load_s,
+            "backend": backend,
+            "engine_compile_s": self.served.compile_s,
+            "first_predict_s": self.served.first_predict_s,
         }
-        
-        # Train the model
-        print("Training XGBoost model...")
-        self.model = xgb.train(params, dtrain, num_boost_round=10)
-        print("XGBoost model trained successfully")
-        
-        # Save feature dimension for inference
-        self.n_features = n_features
-        
+
+        # Batching collects concurrent /predict calls into one matrix. Note that
+        # the autoscaler aims for `target_num_ongoing_requests_per_replica`
+        # requests in flight, so batches only grow past that when replicas are
+        # saturated; the stats below show how big batches really get.
+        self.enable_batching = enable_batching
+        self.max_batch_size = max_batch_size
+        self.batch_wait_timeout_s = batch_wait_timeout_s
+        if enable_batching:
+            self.predict_batch.set_max_batch_size(max_batch_size)
+            self.predict_batch.set_batch_wait_timeout_s(batch_wait_timeout_s)
+            print(f"Batching enabled: max_batch_size={max_batch_size}, "
+                  f"batch_wait_timeout_s={batch_wait_timeout_s}")
+        self.batch_sizes = RollingStats()
+        self.queue_wait_s = RollingStats()
+        self.bulk_rows = RollingStats()
+        self.metrics = ServingMetrics()
+        self.in_flight_requests = 0
+
+        # Optional cache of predictions for repeated feature vectors (0 disables it)
+        self.cache = None
+        if cache_max_entries > 0:
+            self.cache = PredictionCache(max_entries=cache_max_entries,
+                                         max_bytes=int(cache_max_mb * 1024 * 1024),
+                                         ttl_s=cache_ttl_s,
+                                         decimals=cache_decimals)
+            self.cache.set_model_version(self.model_version)
+
+        # Share of /predict requests that sleep for 0.5 * complexity seconds to
+        # mimic heavier work; 0 leaves only the real hot path (benchmarks)
+        self.simulated_work_ratio = simulated_work_ratio
+
+        # GET /profile samples this replica's stacks; off unless asked for
+        self.enable_profiling = enable_profiling
+        self.profiling = False
+
+        # Predictions are CPU bound, so they run on a small bounded pool and the
+        # event loop stays free to accept (and queue) other requests
+        self.predict_threads = predict_threads
+        self.executor = ThreadPoolExecutor(max_workers=predict_threads,
+                                           thread_name_prefix="xgb-predict")
+
+        # Serve only routes to a replica once __init__ returns, so warming up
+        # here keeps cold first-predict paths away from real traffic
+        if warmup_batch_sizes is None:
+            warmup_batch_sizes = sorted({1, max_batch_size, DEFAULT_WARMUP_BULK_ROWS})
+        elif isinstance(warmup_batch_sizes, int):
+            warmup_batch_sizes = [warmup_batch_sizes]
+        elif isinstance(warmup_batch_sizes, str):
+            warmup_batch_sizes = [int(size) for size in warmup_batch_sizes.split(",")]
+        # Reloaded models are warmed up the same way before they are swapped in
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.warmup_rounds = warmup_rounds
+        self.startup_times["warmup_s"] = self.warm_up(warmup_batch_sizes, warmup_rounds)
+        self.startup_times["init_total_s"] = time.perf_counter() - init_start
+        self.metrics.set_startup_times(self.startup_times)
+        print(f"Replica ready: {self.startup_times}")
+
+    # The current model, for code that does not need a consistent snapshot
+    @property
+    def model(self) -> xgb.Booster:
+        return self.served.booster
+
+    @property
+    def engine(self) -> Optional[TreeEnsemble]:
+        return self.served.engine
+
+    @property
+    def model_version(self) -> str:
+        return self.served.version
+
+    @property
+    def model_path(self) -> Optional[str]:
+        return self.served.path
+
+    @property
+    def n_features(self) -> int:
+        return self.served.n_features
+
+    def load_served_model(self, model_path: Optional[str]) -> ServedModel:
+        """Load (or train) a booster and prepare it for this replica's backend"""
+        load_start = time.perf_counter()
+        if model_path:
+            # Load a prebuilt booster instead of paying for training on every scale-up
+            print(f"Loading XGBoost model from {model_path}...")
+            booster = load_model_artifact(model_path)
+            print("XGBoost model loaded successfully")
+        else:
+            # Create a dummy XGBoost model
+            print("Initializing XGBoost model...")
+            booster = train_synthetic_model()
+        return ServedModel(booster, self.backend, model_path, load_s=time.perf_counter() - load_start)
+
+    def predict_matrix(self, X: np.ndarray) -> np.ndarray:
+        """Run the model on a 2D feature matrix and return one prediction per row"""
+        return self.served.predict(X)
+
+    def predict_matrix_timed(self, X: np.ndarray, submit_time: float,
+                             served: ServedModel) -> Tuple[np.ndarray, Dict[str, float]]:
+        """Run `served` on X and report how long the call waited for a pool
+        thread, built the DMatrix and ran the model"""
+        start_time = time.perf_counter()
+        # Large batches are faster through XGBoost even on the native backend
+        if served.engine is not None and len(X) <= NATIVE_MAX_ROWS:
+            dmatrix_time = start_time
+            predictions = served.engine.predict(X)
+        else:
+            dmatrix = xgb.DMatrix(X)
+            dmatrix_time = time.perf_counter()
+            predictions = served.booster.predict(dmatrix)
+        end_time = time.perf_counter()
+        return predictions, {
+            "executor_wait_s": start_time - submit_time,
+            "dmatrix_s": dmatrix_time - start_time,
+            "predict_s": end_time - dmatrix_time,
+        }
+
+    def warm_up(self, batch_sizes: List[int], rounds: int, served: Optional[ServedModel] = None) -> float:
+        """Run synthetic batches on every predict thread and return the time taken.
+        Warms the current model unless `served` is given."""
+        served = served or self.served
+        start_time = time.perf_counter()
+        for batch_size in batch_sizes:
+            X = np.random.rand(batch_size, served.n_features).astype(np.float32)
+            # One call per pool thread per round so each thread gets warmed up
+            futures = [self.executor.submit(served.predict, X)
+                       for _ in range(rounds * self.predict_threads)]
+            for future in futures:
+                future.result()
+        warmup_time = time.perf_counter() - start_time
+        print(f"Warm-up with batch sizes {list(batch_sizes)} took {warmup_time:.3f}s")
+        return warmup_time
+
+    def prepare_model(self, model_path: Optional[str]) -> Tuple[ServedModel, Dict]:
+        """Load and warm up a model next to the current one. Runs on a worker
+        thread while the replica keeps serving; returns the model and its
+        load and warmup timings."""
+        rss_before = resident_bytes()
+        served = self.load_served_model(model_path)
+        if served.n_features != self.served.n_features:
+            raise ValueError(f"Model {model_path} expects {served.n_features} features, "
+                             f"the served model {self.served.n_features}")
+        warmup_s = self.warm_up(self.warmup_batch_sizes, self.warmup_rounds, served=served)
+        rss_after = resident_bytes()
+        return served, {
+            "load_s": served.load_s,
+            "engine_compile_s": served.compile_s,
+            "first_predict_s": served.first_predict_s,
+            "warmup_s": warmup_s,
+            "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        }
+
+    def swap_model(self, served: ServedModel, result: str) -> float:
+        """Make `served` the current model and return how long the swap took.
+        Called on the event loop, so no request sees a half-done swap: requests
+        already running finish on the model they started with."""
+        swap_start = time.perf_counter()
+        previous = self.served
+        self.served = served
+        self.previous = previous if self.keep_previous_model else None
+        if self.cache is not None:
+            self.cache.set_model_version(served.version)
+        swap_s = time.perf_counter() - swap_start
+        self.metrics.model_swaps.inc(tags={"result": result})
+        return swap_s
+
+    def model_info(self) -> Dict:
+        """The current and previous model, and the memory held by both"""
+        previous_bytes = self.previous.bytes if self.previous is not None else 0
+        return {
+            "current": self.served.info(),
+            "previous": self.previous.info() if self.previous is not None else None,
+            "memory": {
+                "current_bytes": self.served.bytes,
+                "previous_bytes": previous_bytes,
+                "overhead_ratio": previous_bytes / self.served.bytes,
+                "rss_bytes": resident_bytes(),
+            },
+            "reloading": self.reloading,
+            "last_swap": self.last_swap,
+        }
+
+    async def reload_model(self, model_path: Optional[str]) -> Dict:
+        """Hot-swap the model for the one at model_path (None trains the demo
+        model). The new model is loaded and warmed up off the event loop, so
+        the replica keeps serving the old one until the swap. Raises
+        RuntimeError while another reload runs and ValueError when the model
+        cannot be used."""
+        if self.reloading:
+            raise RuntimeError("A model reload is already running on this replica")
+        self.reloading = True
+        total_start = time.perf_counter()
+        from_version = self.model_version
+        try:
+            served, timings = await asyncio.to_thread(self.prepare_model, model_path)
+        except (OSError, ValueError, xgb.core.XGBoostError) as e:
+            self.metrics.model_swaps.inc(tags={"result": "failed"})
+            raise ValueError(f"Could not load model {model_path}: {e}") from e
+        finally:
+            self.reloading = False
+        timings["swap_s"] = self.swap_model(served, "reloaded")
+        timings["total_s"] = time.perf_counter() - total_start
+        for stage in ("load", "warmup", "swap", "total"):
+            self.metrics.swap_s.set(timings[f"{stage}_s"], tags={"stage": stage})
+        self.last_swap = {"action": "reload", "from_version": from_version, "to_version": served.version,
+                          "at": time.time(), "timings": timings}
+        print(f"Model swapped {from_version} -> {served.version}: {timings}")
+        return dict(self.model_info(), swapped=True)
+
+    async def reconfigure(self, config: Dict):
+        """Serve calls this with the deployment's user_config, on start and on
+        every change. {"model_path": ...} hot-swaps every replica, where
+        POST /model/reload only reaches the replica that receives it. Errors
+        propagate so Serve reports the reconfigure as failed."""
+        model_path = config.get("model_path")
+        if model_path and model_path != self.model_path:
+            await self.reload_model(model_path)
+
+    @contextmanager
+    def track_in_flight(self):
+        """Count a request in the in-flight gauge while it is handled"""
+        self.in_flight_requests += 1
+        self.metrics.in_flight.set(self.in_flight_requests)
+        try:
+            yield
+        finally:
+            self.in_flight_requests -= 1
+            self.metrics.in_flight.set(self.in_flight_requests)
+
+    async def run_predict_timed(self, X: np.ndarray, served: ServedModel) -> Tuple[np.ndarray, Dict[str, float]]:
+        """Run predict_matrix_timed on the predict thread pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.predict_matrix_timed, X, time.perf_counter(), served)
+
+    @serve.batch(max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 batch_wait_timeout_s=DEFAULT_BATCH_WAIT_TIMEOUT_S)
+    async def predict_batch(self, requests: List[Tuple[np.ndarray, float, ServedModel]]
+                            ) -> List[Tuple[float, Dict[str, float]]]:
+        """Predict a batch of (feature row, enqueue_time, model) requests with one
+        call per model; a batch only spans two models around a hot swap.
+        Returns (prediction, timings) per request; the model timings are shared
+        by the requests of a model."""
+        batch_start = time.perf_counter()
+        for _, enqueue_time, _ in requests:
+            self.queue_wait_s.add(batch_start - enqueue_time)
+        self.batch_sizes.add(len(requests))
+
+        # Request positions by the model they were snapshotted with, in order
+        groups = {}
+        for position, (_, _, served) in enumerate(requests):
+            groups.setdefault(id(served), (served, []))[1].append(position)
+        results = [None] * len(requests)
+        for served, positions in groups.values():
+            group_start = time.perf_counter()
+            X = np.stack([requests[position][0] for position in positions])
+            build_time = time.perf_counter()
+            predictions, timings = await self.run_predict_timed(X, served)
+            self.metrics.record_model_call("batcher", len(positions), timings)
+            timings["features_s"] = build_time - group_start
+            for position, prediction in zip(positions, predictions):
+                results[position] = (float(prediction), dict(timings, batch_wait_s=batch_start - requests[position][1]))
+        return results
+
     @app.get("/")
     async def root(self):
-        return {"status": "healthy"}
-    
+        # Serve only routes here once __init__ (and so the warm-up) has finished
+        return {"status": "healthy", "warmup_s": self.startup_times["warmup_s"]}
+
+    @app.get("/stats")
+    async def stats(self):
+        return {
+            "batching": {
+                "enabled": self.enable_batching,
+                "max_batch_size": self.max_batch_size,
+                "batch_wait_timeout_s": self.batch_wait_timeout_s,
+                "batch_size": self.batch_sizes.summary(),
+                "queue_wait_s": self.queue_wait_s.summary(),
+            },
+            "bulk_rows": self.bulk_rows.summary(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "model_version": self.model_version,
+            "predict_threads": self.predict_threads,
+            "startup": self.startup_times,
+            "instance_id": ray.get_runtime_context().get_node_id(),
+            "replica_id": self.replica_id
+        }
+
+    @app.get("/profile")
+    async def profile(self, duration_s: float = 10.0, interval_ms: float = 10.0, include_idle: bool = False):
+        """
+        Sample the stacks of all replica threads for duration_s seconds and
+        return them in collapsed format (flamegraph.pl, speedscope). Requires
+        the deployment to run with enable_profiling=true. Idle threads (pool
+        workers waiting for work, the event loop waiting for I/O) are left out
+        unless include_idle is set.
+        """
+        if not self.enable_profiling:
+            raise HTTPException(status_code=404, detail="Profiling is disabled, deploy with enable_profiling=true")
+        if not 0 < duration_s <= MAX_PROFILE_DURATION_S or interval_ms < 1:
+            raise HTTPException(status_code=400,
+                                detail=f"duration_s must be in (0, {MAX_PROFILE_DURATION_S:g}] and interval_ms >= 1")
+        if self.profiling:
+            raise HTTPException(status_code=409, detail="A profile is already being taken on this replica")
+        self.profiling = True
+        try:
+            sampler = StackSampler(interval_s=interval_ms / 1000.0, include_idle=include_idle)
+            # Sample from a separate thread so the event loop keeps serving and shows up in the profile
+            await asyncio.to_thread(sampler.run, duration_s)
+        finally:
+            self.profiling = False
+        stats = sampler.stats()
+        return PlainTextResponse(
+            sampler.collapsed(),
+            headers={
+                "X-Samples": str(stats["samples"]),
+                "X-Elapsed-S": f"{stats['elapsed_s']:.3f}",
+                "X-Instance-Id": ray.get_runtime_context().get_node_id(),
+                "X-Replica-Id": self.replica_id,
+            },
+        )
+
+    @app.get("/model")
+    async def model_status(self):
+        """The served model, the previous one kept for rollback and their memory use"""
+        return dict(self.model_info(), replica_id=self.replica_id)
+
+    @app.post("/model/reload")
+    async def model_reload(self, request: Request):
+        """
+        Hot-swap this replica's model for the artifact at `model_path` in the
+        JSON body. Requests keep being served by the current model while the
+        new one loads and warms up. To update every replica, change
+        `user_config: {model_path: ...}` of the deployment instead.
+        """
+        try:
+            data = json.loads(await request.body() or b"{}")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Request body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+        try:
+            info = await self.reload_model(data.get("model_path"))
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return dict(info, replica_id=self.replica_id)
+
+    @app.post("/model/rollback")
+    async def model_rollback(self):
+        """Swap back to the previous model, which is still loaded and warm"""
+        if self.previous is None:
+            raise HTTPException(status_code=409, detail="No previous model to roll back to")
+        if self.reloading:
+            raise HTTPException(status_code=409, detail="A model reload is running on this replica")
+        from_version = self.model_version
+        swap_s = self.swap_model(self.previous, "rolled_back")
+        self.metrics.swap_s.set(swap_s, tags={"stage": "swap"})
+        self.last_swap = {"action": "rollback", "from_version": from_version, "to_version": self.model_version,
+                          "at": time.time(), "timings": {"swap_s": swap_s}}
+        return dict(self.model_info(), swapped=True, replica_id=self.replica_id)
+
     @app.post("/predict")
-    async def predict(self, data: Dict):
+    async def predict(self, request: Request):
+        """
+        Score one feature vector. Besides the prediction the response has a
+        `timings` breakdown of the server time in seconds: decode_s (JSON body),
+        features_s (feature array build), cache_s, batch_wait_s (waiting for
+        the batcher), executor_wait_s (waiting for a predict thread), dmatrix_s,
+        predict_s, simulated_work_s and total_s. Parts that did not run are 0.
+        """
+        with self.track_in_flight():
+            return await self._predict(request)
+
+    async def _predict(self, request: Request) -> Dict:
+        handler_start = time.perf_counter()
+        timings = dict.fromkeys(SERVER_TIMING_PARTS, 0.0)
+        try:
+            data = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Request body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+        decoded = time.perf_counter()
+        timings["decode_s"] = decoded - handler_start
+
         # Extract complexity to simulate different workloads
         complexity = data.get("complexity", 1.0)
         complexity = min(max(complexity, 0.1), 5.0)  # Bound between 0.1 and 5.0
-        
+
+        # The model this request is answered by, passed down to the predict
+        # call; a hot swap may replace self.served while it waits for the
+        # batcher or a predict thread
+        served = self.served
+
         # Get features from request or generate random ones
         features = data.get("features", None)
-        if features is None or len(features) != self.n_features:
+        cache_key = None
+        if features is None or len(features) != served.n_features:
             # Generate random features if not provided correctly
-            features = np.random.rand(self.n_features).tolist()
-        
+            row = np.random.rand(served.n_features)
+        else:
+            row = np.asarray(features, dtype=np.float64)
+            if self.cache is not None:
+                # Only client-provided features can repeat, so only they are cached
+                cache_key = self.cache.make_key(row)
+        features_built = time.perf_counter()
+        timings["features_s"] = features_built - decoded
+
         # Start timing
         start_time = time.time()
-        
-        # Create DMatrix for prediction
-        dtest = xgb.DMatrix(np.array([features]))
-        
-        # Make prediction
-        prediction = self.model.predict(dtest)
-        
+
+        prediction = self.cache.get(cache_key) if cache_key is not None else None
+        cached = prediction is not None
+        timings["cache_s"] = time.perf_counter() - features_built
+        if cache_key is not None:
+            self.metrics.cache_lookups.inc(tags={"result": "hit" if cached else "miss"})
+        if not cached:
+            if self.enable_batching:
+                # Wait for our row of a batched prediction
+                prediction, model_timings = await self.predict_batch((row, time.perf_counter(), served))
+            else:
+                # Make prediction on a single-row matrix
+                predictions, model_timings = await self.run_predict_timed(row[None, :], served)
+                self.metrics.record_model_call("single", 1, model_timings)
+                prediction = float(predictions[0])
+            # In batched mode features_s also covers stacking the batch
+            model_timings["features_s"] = timings["features_s"] + model_timings.get("features_s", 0.0)
+            timings.update(model_timings)
+            # A prediction of a model that was swapped out meanwhile must not
+            # land in the cache the swap just cleared
+            if cache_key is not None and self.served is served:
+                cache_start = time.perf_counter()
+                self.cache.put(cache_key, prediction)
+                timings["cache_s"] += time.perf_counter() - cache_start
+
         # Add some artificial delay based on complexity to simulate more processing
-        if random.random() < 0.1:  # 10% of requests take longer
-            time.sleep(0.5 * complexity)
-            
+        if random.random() < self.simulated_work_ratio:  # 10% of requests take longer by default
+            work_start = time.perf_counter()
+            await asyncio.sleep(0.5 * complexity)
+            timings["simulated_work_s"] = time.perf_counter() - work_start
+
         processing_time = time.time() - start_time
-        
+        timings["total_s"] = time.perf_counter() - handler_start
+        path = "cached" if cached else "batched" if self.enable_batching else "single"
+        self.metrics.request_latency_ms.observe(timings["total_s"] * 1000, tags={"path": path})
+
         return {
-            "prediction": float(prediction[0]),
-            "probability": float(prediction[0]),
+            "prediction": prediction,
+            "probability": prediction,
             "processing_time": processing_time,
+            "timings": timings,
             "complexity": complexity,
-            "instance_id": ray.get_runtime_context().get_node_id()
+            "cached": cached,
+            "model_version": served.version,
+            "instance_id": ray.get_runtime_context().get_node_id(),
+            "replica_id": self.replica_id
         }
 
-app = XGBoostModel.bind()
\ No newline at end of file
+
+    @app.post("/predict/bulk")
+    async def predict_bulk(self, request: Request):
+        """Score many rows sent as a raw float32 matrix (see bulk_codec.py)"""
+        with self.track_in_flight():
+            return await self._predict_bulk(request)
+
+    async def _predict_bulk(self, request: Request) -> Response:
+        body = await request.body()
+        try:
+            X = bulk_codec.decode_matrix(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        served = self.served
+        if X.shape[1] != served.n_features:
+            raise HTTPException(status_code=400,
+                                detail=f"Expected {served.n_features} features per row, got {X.shape[1]}")
+
+        start_time = time.time()
+        # The whole body is already a batch, so it skips the request batcher
+        if len(X):
+            predictions, timings = await self.run_predict_timed(X, served)
+            self.metrics.record_model_call("bulk", len(X), timings)
+        else:
+            predictions = np.empty(0, dtype=bulk_codec.DTYPE)
+        self.bulk_rows.add(len(X))
+        processing_time = time.time() - start_time
+        self.metrics.request_latency_ms.observe(processing_time * 1000, tags={"path": "bulk"})
+
+        return Response(
+            content=bulk_codec.encode_vector(predictions),
+            media_type=bulk_codec.CONTENT_TYPE,
+            headers={
+                "X-Processing-Time": f"{processing_time:.6f}",
+                "X-Model-Version": served.version,
+                "X-Instance-Id": ray.get_runtime_context().get_node_id(),
+                "X-Replica-Id": self.replica_id,
+            },
+        )
+
+
+def _parse_arg(value: str):
+    """Convert a `key=value` CLI string into a bool, int or float where possible"""
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def build_app(args: Dict[str, str]):
+    """Application builder for `serve run serve_app:build_app key=value ...`"""
+    return XGBoostModel.bind(**{key: _parse_arg(value) for key, value in args.items()})
+
+
+app = XGBoostModel.bind()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the demo XGBoost model as a serving artifact')
+    parser.add_argument('--export', type=str, required=True,
+                        help='Where to save the model (.json or .ubj)')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='Number of synthetic training samples')
+    parser.add_argument('--features', type=int, default=20,
+                        help='Number of features')
+
+    args = parser.parse_args()
+
+    train_synthetic_model(args.samples, args.features).save_model(args.export)
+    print(f"Model saved to {args.export}. Serve it with "
+          f"`serve run serve_app:build_app model_path={args.export}`")
@@ -0,0 +1,95 @@
+# stack_sampler.py
+"""Wall-clock stack sampler that writes collapsed stacks for flame graphs.
+
+A background thread reads the Python stack of every thread with
+sys._current_frames() at a fixed interval and counts identical stacks. No
+tracing hooks are installed, so code between samples runs at full speed; the
+cost is one stack walk per thread per sample (tens of microseconds), which
+at the default 10 ms interval stays well below 1% of a core.
+
+Output is the collapsed format read by flamegraph.pl, speedscope and
+similar tools, one stack per line with its sample count:
+
+    MainThread;run (base_events.py:590);predict (serve_app.py:412) 27
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+DEFAULT_INTERVAL_S = 0.01
+
+# Leaf frames of threads that are blocked waiting rather than running Python
+# code: pool workers waiting for work, lock and condition waits, event loop
+# selects, sleeps in the thread pool's queue
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sample the stacks of all threads of this process into collapsed-stack counts"""
+
+    def __init__(self, interval_s: float = DEFAULT_INTERVAL_S, include_idle: bool = False):
+        self.interval_s = interval_s
+        self.include_idle = include_idle
+        self.counts = Counter()
+        self.samples = 0
+        self.elapsed_s = 0.0
+
+    def sample(self, exclude_thread: Optional[int] = None):
+        """Record the current stack of every thread except exclude_thread"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude_thread:
+                continue
+            leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+            if not self.include_idle and leaf in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, duration_s: float) -> "StackSampler":
+        """Sample in the calling thread for duration_s seconds"""
+        me = threading.get_ident()
+        start_time = time.perf_counter()
+        next_sample = start_time
+        while True:
+            now = time.perf_counter()
+            if now - start_time >= duration_s:
+                break
+            if now < next_sample:
+                time.sleep(next_sample - now)
+            self.sample(exclude_thread=me)
+            # Skip missed ticks instead of sampling in a burst to catch up
+            next_sample = max(next_sample + self.interval_s, time.perf_counter())
+        self.elapsed_s = time.perf_counter() - start_time
+        return self
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+    def stats(self) -> Dict:
+        return {
+            "samples": self.samples,
+            "stacks": len(self.counts),
+            "elapsed_s": self.elapsed_s,
+            "interval_s": self.interval_s,
+        }
@@ -0,0 +1,189 @@
+# tree_engine.py
+"""Pure NumPy inference for small XGBoost tree ensembles.
+
+The trees of a trained booster are flattened into parallel node arrays
+(feature index, threshold, children, default direction, leaf value). A batch
+is evaluated by moving every (row, tree) pair one level down per step, so a
+prediction costs max_depth vectorized gathers instead of a DMatrix build and
+a call into the library.
+
+The gathers grow with the batch while the library's fixed call overhead does
+not, so the speedup shrinks with batch size (about 1.1x at 2048 rows and 0.9x
+at 4096 for the demo model). Callers route batches larger than
+NATIVE_MAX_ROWS to the booster.
+"""
+import json
+import time
+import argparse
+import numpy as np
+import xgboost as xgb
+
+# Objectives whose output is sigmoid(margin), and ones that return the margin as is
+SIGMOID_OBJECTIVES = {"binary:logistic", "reg:logistic"}
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror"}
+# Largest batch evaluated natively; below the crossover with Booster.predict
+NATIVE_MAX_ROWS = 1024
+
+
+class TreeEnsemble:
+    """Flattened copy of a single-output gbtree booster"""
+
+    def __init__(self, feature, threshold, left, right, default_left, value,
+                 roots, max_depth, base_margin, objective, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.base_margin = base_margin
+        self.objective = objective
+        self.n_features = n_features
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the node arrays"""
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.left, self.right,
+                                              self.default_left, self.value, self.roots))
+
+    @classmethod
+    def from_booster(cls, booster: xgb.Booster) -> "TreeEnsemble":
+        """Compile a trained booster, raising ValueError for unsupported models"""
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in SIGMOID_OBJECTIVES | IDENTITY_OBJECTIVES:
+            raise ValueError(f"Objective {objective} is not supported by the native engine")
+        booster_type = learner["gradient_booster"]["name"]
+        if booster_type != "gbtree":
+            raise ValueError(f"Booster type {booster_type} is not supported by the native engine")
+        model_param = learner["learner_model_param"]
+        if int(model_param.get("num_class", 0)) > 1 or int(model_param.get("num_target", 1)) > 1:
+            raise ValueError("Multi-output models are not supported by the native engine")
+
+        feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in learner["gradient_booster"]["model"]["trees"]:
+            if tree["categories_nodes"]:
+                raise ValueError("Categorical splits are not supported by the native engine")
+            lefts = np.asarray(tree["left_children"], dtype=np.int64)
+            rights = np.asarray(tree["right_children"], dtype=np.int64)
+            is_leaf = lefts == -1
+            node_ids = np.arange(len(lefts))
+
+            # Leaves point at themselves, so extra traversal steps are no-ops
+            left.append(np.where(is_leaf, node_ids, lefts) + offset)
+            right.append(np.where(is_leaf, node_ids, rights) + offset)
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            # For leaves split_conditions holds the leaf value
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            threshold.append(np.where(is_leaf, np.float32(0), conditions))
+            value.append(np.where(is_leaf, conditions, np.float32(0)))
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            roots.append(offset)
+            max_depth = max(max_depth, _tree_depth(lefts, rights))
+            offset += len(lefts)
+
+        # XGBoost 3.x saves base_score as a vector, e.g. "[5E-1]"
+        base_score = float(str(model_param["base_score"]).strip("[]").split(",")[0])
+        if objective in SIGMOID_OBJECTIVES:
+            base_margin = float(np.log(base_score / (1.0 - base_score)))
+        else:
+            base_margin = base_score
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            default_left=np.concatenate(default_left),
+            value=np.concatenate(value).astype(np.float32),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            base_margin=np.float32(base_margin),
+            objective=objective,
+            n_features=int(model_param["num_feature"]),
+        )
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        """Return the untransformed sum of leaf values plus base margin per row"""
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        # One current node per (row, tree)
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(x), self.default_left[nodes], x < self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].sum(axis=1) + self.base_margin
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Equivalent of Booster.predict(DMatrix(X)) for the compiled model"""
+        margin = self.predict_margin(X)
+        if self.objective in SIGMOID_OBJECTIVES:
+            return 1.0 / (1.0 + np.exp(-margin))
+        return margin
+
+
+def _tree_depth(lefts: np.ndarray, rights: np.ndarray) -> int:
+    """Number of splits on the longest root-to-leaf path"""
+    depth = 0
+    level = [0]
+    while True:
+        level = [child for node in level if lefts[node] != -1
+                 for child in (lefts[node], rights[node])]
+        if not level:
+            return depth
+        depth += 1
+
+
+def _time_call(fn, X, min_time_s: float = 0.2) -> float:
+    """Average seconds per call of fn(X), repeated for at least min_time_s"""
+    fn(X)
+    calls = 0
+    start_time = time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= min_time_s:
+            return elapsed / calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the native tree engine against Booster.predict')
+    parser.add_argument('--model', type=str, default=None,
+                        help='Saved booster to benchmark (default: train the demo model)')
+    parser.add_argument('--max-batch', type=int, default=4096,
+                        help='Largest batch size (powers of two from 1)')
+    parser.add_argument('--tolerance', type=float, default=1e-5,
+                        help='Maximum allowed absolute difference from Booster.predict')
+
+    args = parser.parse_args()
+
+    if args.model:
+        booster = xgb.Booster(model_file=args.model)
+    else:
+        # Same shape and parameters as the demo model in serve_app.py
+        X_train = np.random.rand(1000, 20)
+        y_train = np.random.randint(0, 2, 1000)
+        booster = xgb.train({'max_depth': 3, 'eta': 0.1, 'objective': 'binary:logistic', 'seed': 42},
+                            xgb.DMatrix(X_train, label=y_train), num_boost_round=10)
+
+    engine = TreeEnsemble.from_booster(booster)
+    dmatrix_predict = lambda X: booster.predict(xgb.DMatrix(X))
+
+    print(f"{'batch':>6} {'dmatrix us':>12} {'native us':>12} {'speedup':>8} {'max abs diff':>13}")
+    batch_size = 1
+    while batch_size <= args.max_batch:
+        X = np.random.rand(batch_size, engine.n_features).astype(np.float32)
+        max_diff = float(np.abs(engine.predict(X) - dmatrix_predict(X)).max())
+        if max_diff > args.tolerance:
+            raise SystemExit(f"Native predictions differ by {max_diff} at batch size {batch_size}")
+        dmatrix_s = _time_call(dmatrix_predict, X)
+        native_s = _time_call(engine.predict, X)
+        print(f"{batch_size:>6} {dmatrix_s * 1e6:>12.1f} {native_s * 1e6:>12.1f} "
+              f"{dmatrix_s / native_s:>7.1f}x {max_diff:>13.2e}")
+        batch_size *= 2